@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+"""
+Corpus statistics as NumPy count matrices, built in one pass over the transcripts and cached as .npy files.
+
+Matrices (under ANALYTICS_NAME):
+- line_counts.npy: speakers x episodes, lines spoken (continuation lines of multi-line dialogue are not counted again)
+- word_counts.npy: speakers x episodes, words spoken
+- term_counts.npy: terms x seasons, occurrences of each case-folded word in the dialogue
+- terms.npy: the terms, in the order of term_counts' rows
+- analytics.json: the speakers ('|' for narration), episodes, seasons, each episode's season, and the corpus checksum
+
+The cache is rebuilt whenever the corpus checksum changes: that of the catalog (see catalog.py), if current
+and no file was rewritten since, otherwise of every episode file's contents.
+
+Run with:
+    python3 analytics.py [--rebuild] speakers [--season S] [--top N]
+    python3 analytics.py episode EPISODE
+    python3 analytics.py terms [--season S] [--top N]
+    python3 analytics.py term TERM [TERM ...]
+"""
+
+from hashlib import sha256
+from pathlib import Path
+import argparse
+import json
+import logging
+import os
+import re
+
+import numpy as np
+
+from constants import OUTPUT_NAME, SHARDS_NAME, ANALYTICS_NAME, LOGGING_FILE
+from batch import iter_episodes
+import corpus
+
+ANALYTICS_VERSION = 1
+MATRICES = ("line_counts", "word_counts", "term_counts", "terms")
+WORD = re.compile(r"\w+(?:'\w+)*")
+NARRATION = "|"
+
+def corpus_checksum(output_dir=OUTPUT_NAME, shards_name: str = SHARDS_NAME):
+    """
+    Returns a hex digest that changes whenever any episode's text, name or place in the corpus does.
+    """
+    output_dir = Path(output_dir)
+    digest = sha256()
+    entries = corpus.read_catalog(output_dir, verify_files=True) if output_dir.is_dir() else None
+    if entries is not None:
+        for entry in entries:
+            digest.update(("%s\0%s\n" % (entry["path"], entry["checksum"])).encode("utf-8"))
+        return digest.hexdigest()
+    for episode_file, lines in iter_episodes(output_dir, shards_name):
+        digest.update(("%s\0" % episode_file.relative_to(output_dir)).encode("utf-8"))
+        digest.update("\n".join(lines).encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+class CorpusAnalytics:
+    """
+    The count matrices of a corpus, and their labels.
+    """
+
+    def __init__(self, matrices: dict, labels: dict):
+        self.line_counts = matrices["line_counts"]
+        self.word_counts = matrices["word_counts"]
+        self.term_counts = matrices["term_counts"]
+        self.terms = matrices["terms"]
+        self.speakers = labels["speakers"]
+        self.episodes = labels["episodes"]
+        self.seasons = labels["seasons"]
+        self.episode_seasons = np.asarray(labels["episode_seasons"], dtype=np.int64)
+        self.checksum = labels["checksum"]
+        self.term_ids = {term: term_id for term_id, term in enumerate(self.terms.tolist())}
+
+    def season_id(self, season: str):
+        """
+        Returns the index of a season given by number (as in Season_N) or name. Raises KeyError if there is none.
+        """
+        name = "Season_%s" % season if season.isdigit() else season
+        for season_id, season_name in enumerate(self.seasons):
+            if season_name.casefold() == name.casefold():
+                return season_id
+        raise KeyError(season)
+
+    def episode_id(self, episode: str):
+        """
+        Returns the index of an episode given by relative path or title. Raises KeyError if there is none.
+        """
+        for episode_id, relative_path in enumerate(self.episodes):
+            if episode.casefold() in (relative_path.casefold(), corpus.episode_title(Path(relative_path))[1].casefold()):
+                return episode_id
+        raise KeyError(episode)
+
+    def speaker_totals(self, season: str = None):
+        """
+        Returns (speaker, lines, words) for every speaker with lines, most lines first, in all seasons or only 'season'.
+        """
+        columns = slice(None) if season is None else self.episode_seasons == self.season_id(season)
+        lines = self.line_counts[:, columns].sum(axis=1)
+        words = self.word_counts[:, columns].sum(axis=1)
+        order = np.argsort(-lines, kind="stable")
+        return [(self.speakers[speaker_id], int(lines[speaker_id]), int(words[speaker_id])) for speaker_id in order if lines[speaker_id]]
+
+    def episode_speakers(self, episode: str):
+        """
+        Returns (speaker, lines, words) for every speaker in 'episode', most lines first.
+        """
+        episode_id = self.episode_id(episode)
+        lines = self.line_counts[:, episode_id]
+        words = self.word_counts[:, episode_id]
+        order = np.argsort(-lines, kind="stable")
+        return [(self.speakers[speaker_id], int(lines[speaker_id]), int(words[speaker_id])) for speaker_id in order if lines[speaker_id]]
+
+    def term_frequencies(self, term: str):
+        """
+        Returns {season: occurrences of 'term'} (case-insensitive), for every season.
+        """
+        term_id = self.term_ids.get(term.casefold())
+        counts = self.term_counts[term_id] if term_id is not None else np.zeros(len(self.seasons), dtype=np.int64)
+        return dict(zip(self.seasons, counts.tolist()))
+
+    def top_terms(self, season: str = None, top: int = 20):
+        """
+        Returns the 'top' most frequent (term, occurrences), in all seasons or only 'season'.
+        """
+        counts = self.term_counts.sum(axis=1) if season is None else self.term_counts[:, self.season_id(season)]
+        top = min(top, len(counts))
+        if not top:
+            return []
+        best = np.argpartition(-counts, top - 1)[:top]
+        best = best[np.lexsort((best, -counts[best]))]
+        return [(str(self.terms[term_id]), int(counts[term_id])) for term_id in best]
+
+def build_analytics(output_dir=OUTPUT_NAME, shards_name: str = SHARDS_NAME):
+    """
+    Returns the CorpusAnalytics of the corpus under 'output_dir' (or its shards), in one pass over its lines.
+    """
+    output_dir = Path(output_dir)
+    speakers = {}
+    seasons = []
+    episodes = []
+    episode_seasons = []
+    # one entry per counted line
+    line_speakers, line_episodes, line_words = [], [], []
+    # one entry per token
+    tokens, token_seasons = [], []
+    for episode_id, (episode_file, lines) in enumerate(iter_episodes(output_dir, shards_name)):
+        season_name = episode_file.parent.name
+        if season_name not in seasons:
+            seasons.append(season_name)
+        season_id = seasons.index(season_name)
+        episodes.append(str(episode_file.relative_to(output_dir)))
+        episode_seasons.append(season_id)
+        for line in lines:
+            speaker, separator, dialogue = line.partition(": ")
+            words = WORD.findall(dialogue.casefold() if separator else line.casefold())
+            if separator or not line_speakers or line_episodes[-1] != episode_id:
+                line_speakers.append(speakers.setdefault(speaker if separator else NARRATION, len(speakers)))
+                line_episodes.append(episode_id)
+                line_words.append(len(words))
+            else:
+                # a continuation of the previous line's dialogue
+                line_words[-1] += len(words)
+            tokens.extend(words)
+            token_seasons.extend([season_id] * len(words))
+    shape = (len(speakers), len(episodes))
+    cells = np.ravel_multi_index((np.asarray(line_speakers, dtype=np.int64), np.asarray(line_episodes, dtype=np.int64)), shape) \
+        if line_speakers else np.zeros(0, dtype=np.int64)
+    size = shape[0] * shape[1]
+    line_counts = np.bincount(cells, minlength=size).reshape(shape).astype(np.int64)
+    word_counts = np.bincount(cells, weights=np.asarray(line_words, dtype=np.float64), minlength=size).reshape(shape).astype(np.int64)
+    terms, term_ids = np.unique(np.asarray(tokens, dtype=str), return_inverse=True)
+    term_cells = term_ids.astype(np.int64) * len(seasons) + np.asarray(token_seasons, dtype=np.int64)
+    term_counts = np.bincount(term_cells, minlength=len(terms) * len(seasons)).reshape(len(terms), len(seasons)).astype(np.int64)
+    matrices = {"line_counts": line_counts, "word_counts": word_counts, "term_counts": term_counts, "terms": terms}
+    labels = {"version": ANALYTICS_VERSION, "speakers": list(speakers), "episodes": episodes, "seasons": seasons,
+        "episode_seasons": episode_seasons, "checksum": corpus_checksum(output_dir, shards_name)}
+    return CorpusAnalytics(matrices, labels)
+
+def save_analytics(analytics: CorpusAnalytics, cache_name: str = ANALYTICS_NAME):
+    """
+    Writes the matrices as .npy files and their labels as JSON under 'cache_name'. The labels are written last,
+    so a cache interrupted mid-write is seen as stale.
+    """
+    cache_dir = Path(cache_name)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for name in MATRICES:
+        temp_file = cache_dir.joinpath(name + ".tmp.npy")
+        np.save(temp_file, getattr(analytics, name), allow_pickle=False)
+        os.replace(temp_file, cache_dir.joinpath(name + ".npy"))
+    labels = {"version": ANALYTICS_VERSION, "speakers": analytics.speakers, "episodes": analytics.episodes,
+        "seasons": analytics.seasons, "episode_seasons": analytics.episode_seasons.tolist(), "checksum": analytics.checksum}
+    temp_file = cache_dir.joinpath("analytics.json.tmp")
+    temp_file.write_text(json.dumps(labels, ensure_ascii=False))
+    os.replace(temp_file, cache_dir.joinpath("analytics.json"))
+
+def load_analytics(output_dir=OUTPUT_NAME, cache_name: str = ANALYTICS_NAME, shards_name: str = SHARDS_NAME, rebuild: bool = False):
+    """
+    Returns the CorpusAnalytics of the corpus, from the cache under 'cache_name' if its checksum is the corpus's,
+    else built afresh and cached.
+    """
+    cache_dir = Path(cache_name)
+    checksum = corpus_checksum(output_dir, shards_name)
+    if not rebuild:
+        try:
+            labels = json.loads(cache_dir.joinpath("analytics.json").read_text())
+            if labels.get("version") == ANALYTICS_VERSION and labels["checksum"] == checksum:
+                matrices = {name: np.load(cache_dir.joinpath(name + ".npy"), allow_pickle=False) for name in MATRICES}
+                return CorpusAnalytics(matrices, labels)
+        except (OSError, ValueError):
+            pass
+        logging.info("Analytics cache %r is missing or stale. Rebuilding it.", cache_name)
+    analytics = build_analytics(output_dir, shards_name)
+    save_analytics(analytics, cache_name)
+    return analytics
+
+def main():
+    """
+    Prints the report asked for on the command line.
+    """
+    parser = argparse.ArgumentParser(description="statistics of the SU transcripts")
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the cached matrices in %r even if current' % ANALYTICS_NAME)
+    reports = parser.add_subparsers(dest='report', required=True)
+    speakers = reports.add_parser('speakers', help='lines and words per speaker')
+    speakers.add_argument('--season', help='only this season: number, or name such as Movie')
+    speakers.add_argument('--top', type=int, default=20, help='speakers to list (default: %(default)s)')
+    episode = reports.add_parser('episode', help='lines and words per speaker in one episode')
+    episode.add_argument('episode', help='title, or path such as Season_1/01-Gem Glow.txt')
+    terms = reports.add_parser('terms', help='most frequent words')
+    terms.add_argument('--season', help='only this season: number, or name such as Movie')
+    terms.add_argument('--top', type=int, default=20, help='words to list (default: %(default)s)')
+    term = reports.add_parser('term', help='occurrences of words in each season')
+    term.add_argument('terms', nargs='+')
+    args = parser.parse_args()
+    analytics = load_analytics(rebuild=args.rebuild)
+    try:
+        if args.report == 'speakers':
+            for speaker, lines, words in analytics.speaker_totals(args.season)[:args.top]:
+                print("%-24s %8d lines %10d words" % (speaker, lines, words))
+        elif args.report == 'episode':
+            for speaker, lines, words in analytics.episode_speakers(args.episode):
+                print("%-24s %8d lines %10d words" % (speaker, lines, words))
+        elif args.report == 'terms':
+            for word, count in analytics.top_terms(args.season, args.top):
+                print("%-24s %10d" % (word, count))
+        else:
+            print("%-16s" % "season" + "".join(" %12s" % word for word in args.terms))
+            frequencies = [analytics.term_frequencies(word) for word in args.terms]
+            for season in analytics.seasons:
+                print("%-16s" % season + "".join(" %12d" % counts[season] for counts in frequencies))
+    except KeyError as error:
+        parser.error("no such season or episode: %s" % error)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+"""
+Batch search: many patterns, matched together in one pass over the corpus.
+
+Patterns are read one per line from a file (blank lines and lines starting with '#' are skipped),
+and are regexes as for query.py. They are split in two:
+- literals (patterns without regex metacharacters) go into a trie, the goto structure of an Aho-Corasick automaton,
+  compiled into one regex that reports the longest literal starting at every position of a line;
+  the shorter literals matching at the same position are its prefixes, looked up in a precomputed table,
+  so overlapping matches are all found
+- other regexes are combined into one alternation, which rules out the lines none of them matches;
+  only the lines it does match are searched with each regex on its own
+
+Results per pattern are exactly those of query.iter_matches for that pattern, and are written as JSON or CSV.
+Run with:
+    python3 query.py --batch PATTERN_FILE [--format json|csv] [--output FILE]
+"""
+
+from pathlib import Path
+import csv
+import io
+import json
+import re
+
+from constants import OUTPUT_NAME, SHARDS_NAME
+import corpus
+import metrics
+import shards
+
+REGEX_METACHARACTERS = re.compile(r"[.^$*+?{}\[\]\\|()]")
+# a leading group of global flags, which must be made local to the pattern's own group once combined
+GLOBAL_FLAGS = re.compile(r"\(\?([imsx]+)\)")
+
+def read_patterns(pattern_file):
+    """
+    Returns the patterns listed in 'pattern_file', one per line; blank lines and '#' comments are skipped.
+    """
+    lines = Path(pattern_file).read_text().splitlines()
+    return [line for line in lines if line.strip() and not line.startswith("#")]
+
+def is_literal(pattern: str):
+    return pattern != "" and REGEX_METACHARACTERS.search(pattern) is None
+
+def trie_regex(literals: list):
+    """
+    Returns a regex matching the longest of 'literals' that starts at the current position.
+    Literals sharing a prefix share its branch, so the regex engine tests each character once per position,
+    rather than once per literal.
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # a literal ends here: its longer extensions are tried first, greedily
+        return "(?:" + body + ")?" if "" in node else body
+    return build(trie)
+
+def scoped(pattern: str):
+    """
+    Returns 'pattern' wrapped in a group of its own, with leading global flags made local to it,
+    or None if it cannot be combined with others: back-references would point at other patterns' groups,
+    and named groups could clash.
+    """
+    if re.search(r"\\[1-9]|\(\?P[<=]|\(\?\(", pattern):
+        return None
+    flags = GLOBAL_FLAGS.match(pattern)
+    if flags is not None:
+        scoped_pattern = "(?%s:%s)" % (flags.group(1), pattern[flags.end():])
+    else:
+        scoped_pattern = "(?:%s)" % pattern
+    try:
+        # e.g. other global flags, such as (?a), cannot be scoped, and a verbose comment would swallow the group's end
+        re.compile(scoped_pattern)
+    except re.error:
+        return None
+    return scoped_pattern
+
+class PatternSet:
+    """
+    Many patterns, compiled to be matched together against each line. Repeated patterns are matched once:
+    pattern ids index the distinct patterns, in order of first appearance.
+    """
+
+    def __init__(self, patterns: list):
+        """
+        Compiles 'patterns'; raises re.error naming the first invalid one.
+        """
+        self.patterns = list(dict.fromkeys(patterns))
+        # literal -> ids of the patterns it is
+        self.literal_ids = {}
+        self.regexes = []
+        combinable = []
+        for pattern_id, pattern in enumerate(self.patterns):
+            if is_literal(pattern):
+                self.literal_ids.setdefault(pattern, []).append(pattern_id)
+                continue
+            try:
+                regex = re.compile(pattern)
+                scoped_pattern = scoped(pattern)
+            except re.error as error:
+                raise re.error("%s in pattern %r" % (error.msg, pattern)) from None
+            self.regexes.append((pattern_id, regex, scoped_pattern is not None))
+            if scoped_pattern is not None:
+                combinable.append(scoped_pattern)
+        # longest literal at a position -> (pattern id, length) of every literal that is a prefix of it
+        self.prefixes = {}
+        for literal in self.literal_ids:
+            self.prefixes[literal] = [(pattern_id, length) for length in range(1, len(literal) + 1)
+                for pattern_id in self.literal_ids.get(literal[:length], ())]
+        self.literal_regex = re.compile("(?=(%s))" % trie_regex(list(self.literal_ids))) if self.literal_ids else None
+        self.combined_regex = re.compile("|".join(combinable)) if combinable else None
+
+    def search_line(self, line: str):
+        """
+        Returns {pattern id: span of its first match} for every pattern matching 'line'.
+        """
+        hits = {}
+        if self.literal_regex is not None:
+            for match in self.literal_regex.finditer(line):
+                start = match.start()
+                for pattern_id, length in self.prefixes[match.group(1)]:
+                    if pattern_id not in hits:
+                        hits[pattern_id] = (start, start + length)
+        if self.regexes:
+            any_combined = self.combined_regex is not None and self.combined_regex.search(line) is not None
+            for pattern_id, regex, combined in self.regexes:
+                if combined and not any_combined:
+                    continue
+                match = regex.search(line)
+                if match is not None:
+                    hits[pattern_id] = match.span()
+        return hits
+
+def iter_episodes(output_dir=OUTPUT_NAME, shards_name: str = SHARDS_NAME, candidates: set = None):
+    """
+    Yields (episode_file, lines) for every episode in canonical order, from the shards if there is no 'output_dir'.
+    If 'candidates' is given, only those relative paths are read.
+    """
+    output_dir = Path(output_dir)
+    if not output_dir.is_dir() and Path(shards_name).is_dir():
+        for shard_path in shards.shard_paths(shards_name):
+            shard = shards.Shard(shard_path)
+            for episode_id, relative_path in enumerate(shard.relative_paths()):
+                if candidates is None or relative_path in candidates:
+                    yield output_dir.joinpath(relative_path), shard.read_episode(episode_id)
+        return
+    for episode_file in corpus.episode_files(output_dir):
+        if candidates is None or str(episode_file.relative_to(output_dir)) in candidates:
+            yield episode_file, episode_file.read_text().splitlines()
+
+def search_batch(patterns: list, output_dir=OUTPUT_NAME, shards_name: str = SHARDS_NAME):
+    """
+    Returns, for each of 'patterns' in order, the list of its (episode_file, lineno, line, span) matches,
+    as query.iter_matches would give them, from a single pass over the corpus.
+    """
+    pattern_set = PatternSet(patterns)
+    results = [[] for _ in pattern_set.patterns]
+    for episode_file, lines in iter_episodes(output_dir, shards_name):
+        with metrics.timer("scan"):
+            for line_index, line in enumerate(lines):
+                for pattern_id, span in pattern_set.search_line(line).items():
+                    results[pattern_id].append((episode_file, line_index + 1, line, span))
+        metrics.count("files_scanned")
+        metrics.count("lines_scanned", len(lines))
+    metrics.count("matches", sum(map(len, results)))
+    by_pattern = dict(zip(pattern_set.patterns, results))
+    return [list(by_pattern[pattern]) for pattern in patterns]
+
+def format_results(patterns: list, results: list, output_format: str = "json"):
+    """
+    Returns the 'results' of search_batch as JSON (one object per pattern) or CSV (one row per match).
+    """
+    if output_format == "json":
+        return json.dumps({"patterns": [{"pattern": pattern, "count": len(matches),
+            "matches": [{"file": str(episode_file), "lineno": lineno, "line": line, "span": list(span)}
+                for episode_file, lineno, line, span in matches]}
+            for pattern, matches in zip(patterns, results)]}, ensure_ascii=False, indent=1)
+    if output_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["pattern", "file", "lineno", "start", "end", "line"])
+        for pattern, matches in zip(patterns, results):
+            for episode_file, lineno, line, (start, end) in matches:
+                writer.writerow([pattern, str(episode_file), lineno, start, end, line])
+        return buffer.getvalue()
+    raise ValueError("Unknown output format %r; expected json or csv." % output_format)
@@ -0,0 +1,207 @@
+#!/usr/bin/python3
+"""
+Benchmarks for the scraper and query pipelines.
+- parse: compares the original full-page transcript parser with scraper.parse_transcript
+  on saved fixture pages (fixtures/*.html).
+- wiki: crawls a generated wiki served by fixture_server.WikiFixtureServer, then reports
+  crawl throughput, per-page parse and write time, trigram index build time and query latency
+  over the scraped corpus. Runs offline, so results are reproducible.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import argparse
+import json
+
+from bs4 import BeautifulSoup
+
+from constants import MAX_WORKERS, MAX_PER_HOST
+from fixture_server import WORDS, WikiFixtureServer, episode_name, transcript_page
+from mwapi import ApiBatchScheduler
+from pipeline import CrawlPipeline
+from scheduler import CrawlScheduler
+import batch
+import http_client
+import packed
+import query
+import scraper
+import trigram
+
+FIXTURES_NAME = "fixtures"
+QUERY_PATTERNS = ["cookie cat", "(?i)steven", "^Garnet: .*fusion", "bubble|shield", "no such phrase"]
+# a batch of phrases, as an analyst might submit: every pair of adjacent fixture words, and the patterns above
+BATCH_PATTERNS = ["%s %s" % pair for pair in zip(WORDS, WORDS[1:])] + QUERY_PATTERNS
+
+def parse_transcript_reference(page_text: str):
+    """
+    The original parser: parses the whole page, and looks up each row's cells twice.
+    Kept as the baseline for bench_parse.
+    """
+    transcript_table = BeautifulSoup(page_text, "html.parser").find("table", class_="wikitable bgrevo")
+    assert transcript_table is not None
+    line_list = []
+    for index, tr in enumerate(transcript_table.find_all("tr")):
+        if index == 0:
+            continue
+        if tr.find("th") is None:
+            speaker = None
+        else:
+            speaker = tr.find("th").text.strip()
+        if tr.find("td") is None:
+            dialogue = ""
+        else:
+            dialogue = tr.find("td").text.strip()
+        line_list.append((speaker, dialogue))
+    return line_list
+
+def time_call(function, *args, repeat: int = 5):
+    """
+    Returns the best wall-clock time, in seconds, of 'repeat' calls to 'function(*args)'.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        function(*args)
+        best = min(best, perf_counter() - start)
+    return best
+
+def bench_parse(fixture_files: list, repeat: int = 5):
+    """
+    Times both parsers on each fixture page, after checking that they agree.
+    Returns a list of (fixture name, reference seconds, current seconds).
+    """
+    results = []
+    for fixture_file in fixture_files:
+        page_text = Path(fixture_file).read_text(encoding="utf-8")
+        assert parse_transcript_reference(page_text) == scraper.parse_transcript(page_text), fixture_file
+        reference_time = time_call(parse_transcript_reference, page_text, repeat=repeat)
+        current_time = time_call(scraper.parse_transcript, page_text, repeat=repeat)
+        results.append((Path(fixture_file).name, reference_time, current_time))
+    return results
+
+@contextmanager
+def pointed_at(root: str, output_name: str):
+    """
+    Points the scraper at the wiki at 'root' and the output directory 'output_name', without an HTTP cache,
+    restoring the previous settings afterwards.
+    """
+    saved = scraper.WIKIA_ROOT, scraper.OUTPUT_NAME, http_client.default_client
+    scraper.WIKIA_ROOT, scraper.OUTPUT_NAME = root, output_name
+    http_client.default_client = http_client.HttpClient(cache_dir=None)
+    try:
+        yield
+    finally:
+        scraper.WIKIA_ROOT, scraper.OUTPUT_NAME, http_client.default_client = saved
+
+def bench_wiki(num_seasons: int = 5, num_episodes: int = 20, num_lines: int = 200, latency: float = 0.05,
+        max_workers: int = None, max_per_host: int = None, repeat: int = 5, max_parsers: int = None, api: bool = False):
+    """
+    Crawls a generated wiki of 'num_seasons' x 'num_episodes' episodes (each response delayed by 'latency'),
+    then times parsing, writing, indexing and querying on the result.
+    If 'max_parsers' is given, the crawl runs through a pipeline.CrawlPipeline with that many parse processes;
+    if 'api' is set, it fetches transcripts in batches through api.php, with a mwapi.ApiBatchScheduler.
+    Returns a dict of measurements; times are in seconds.
+    """
+    results = {"seasons": num_seasons, "episodes": num_episodes, "lines": num_lines, "latency": latency, "parsers": max_parsers, "api": api}
+    scheduler_options = {key: value for key, value in (("max_workers", max_workers), ("max_per_host", max_per_host)) if value}
+    if max_parsers:
+        scheduler_options = {"max_fetchers": max_workers or MAX_WORKERS, "max_per_host": max_per_host or MAX_PER_HOST, "max_parsers": max_parsers}
+    with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons, num_episodes, num_lines, latency) as server:
+        output_dir = Path(tempdir, "output")
+        with pointed_at(server.root, str(output_dir)):
+            start = perf_counter()
+            scheduler_class = CrawlPipeline if max_parsers else ApiBatchScheduler if api else CrawlScheduler
+            with scheduler_class(**scheduler_options) as scheduler:
+                scraper.scrape_episodes(scheduler, num_seasons=num_seasons)
+                scraper.scrape_movie(scheduler)
+                scraper.scrape_future(scheduler)
+                scraper.scrape_shorts(scheduler)
+            results["crawl_seconds"] = perf_counter() - start
+        results["pages"] = server.requests_served
+        results["bytes"] = server.bytes_served
+        results["pages_per_second"] = server.requests_served / results["crawl_seconds"]
+
+        page_text = transcript_page(episode_name(1, 1), num_lines)
+        results["parse_seconds_per_page"] = time_call(scraper.parse_transcript, page_text, repeat=repeat)
+        line_list = scraper.parse_transcript(page_text)
+        write_file = Path(tempdir, "write.txt")
+        results["write_seconds_per_page"] = time_call(lambda: write_file.write_text(scraper.format_linelist(line_list)), repeat=repeat)
+
+        index_name = str(Path(tempdir, "trigram_index.json"))
+        start = perf_counter()
+        trigram.build_index(str(output_dir), index_name)
+        results["index_build_seconds"] = perf_counter() - start
+        packed_name = str(Path(tempdir, "transcripts.pack"))
+        start = perf_counter()
+        packed.build_packed(str(output_dir), packed_name).close()
+        results["pack_build_seconds"] = perf_counter() - start
+        results["queries"] = {}
+        for pattern in QUERY_PATTERNS:
+            scan = lambda use_index, packed_name=str(Path(tempdir, "none.pack")): list(query.iter_matches(pattern, use_index=use_index,
+                output_dir=output_dir, index_name=index_name, packed_name=packed_name))
+            results["queries"][pattern] = {
+                "matches": len(scan(False)),
+                "scan_seconds": time_call(scan, False, repeat=repeat),
+                "indexed_seconds": time_call(scan, True, repeat=repeat),
+                "packed_seconds": time_call(scan, True, packed_name, repeat=repeat),
+                }
+        one_by_one = lambda: [list(query.iter_matches(pattern, use_index=False, output_dir=output_dir)) for pattern in BATCH_PATTERNS]
+        results["batch"] = {
+            "patterns": len(BATCH_PATTERNS),
+            "batch_seconds": time_call(batch.search_batch, BATCH_PATTERNS, output_dir, repeat=repeat),
+            "one_by_one_seconds": time_call(one_by_one, repeat=repeat),
+            }
+    return results
+
+def print_wiki(results: dict):
+    """
+    Prints the results of bench_wiki as a table.
+    """
+    print("crawl: %d pages (%.1f MB) in %.2f s = %.1f pages/s; %d seasons x %d episodes, %.0f ms latency, %s" % (
+        results["pages"], results["bytes"] / 1e6, results["crawl_seconds"], results["pages_per_second"],
+        results["seasons"], results["episodes"], results["latency"] * 1e3,
+        "%d parse processes" % results["parsers"] if results["parsers"] else "parsing on fetch threads",
+        ) + (", transcripts through api.php" if results["api"] else ""))
+    print("parse: %.2f ms/page; write: %.2f ms/page (%d lines)" % (
+        results["parse_seconds_per_page"] * 1e3, results["write_seconds_per_page"] * 1e3, results["lines"]))
+    print("trigram index build: %.1f ms; packed corpus build: %.1f ms" % (results["index_build_seconds"] * 1e3, results["pack_build_seconds"] * 1e3))
+    print("%-24s %8s %10s %12s %11s" % ("query", "matches", "scan ms", "indexed ms", "packed ms"))
+    for pattern, timings in results["queries"].items():
+        print("%-24s %8d %10.2f %12.2f %11.2f" % (pattern, timings["matches"], timings["scan_seconds"] * 1e3,
+            timings["indexed_seconds"] * 1e3, timings["packed_seconds"] * 1e3))
+    print("batch of %d patterns: %.1f ms in one pass; %.1f ms one by one" % (results["batch"]["patterns"],
+        results["batch"]["batch_seconds"] * 1e3, results["batch"]["one_by_one_seconds"] * 1e3))
+
+def main():
+    """
+    Runs the benchmark named on the command line, and prints its results.
+    """
+    parser = argparse.ArgumentParser(description="benchmark the SU Wikia scraper")
+    parser.add_argument('benchmark', choices=['parse', 'wiki'], help='benchmark to run')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per measurement (best is reported)')
+    parser.add_argument('--fixtures', nargs='*', help='parse: fixture pages to parse (default: fixtures/*.html)')
+    parser.add_argument('--seasons', type=int, default=5, help='wiki: seasons to generate (default: 5)')
+    parser.add_argument('--episodes', type=int, default=20, help='wiki: episodes per season (default: 20)')
+    parser.add_argument('--lines', type=int, default=200, help='wiki: dialogue rows per transcript (default: 200)')
+    parser.add_argument('--latency', type=float, default=0.05, help='wiki: seconds to delay each response (default: 0.05)')
+    parser.add_argument('--max-workers', type=int, help='wiki: crawl worker threads (default: constants.MAX_WORKERS)')
+    parser.add_argument('--max-per-host', type=int, help='wiki: crawl jobs per host (default: constants.MAX_PER_HOST)')
+    parser.add_argument('--max-parsers', type=int, help='wiki: crawl through pipeline.CrawlPipeline with this many parse processes')
+    parser.add_argument('--api', action='store_true', help='wiki: fetch transcripts in batches through api.php (see mwapi.py)')
+    parser.add_argument('--json', help='wiki: also write the results to this JSON file')
+    args = parser.parse_args()
+    if args.benchmark == 'parse':
+        fixture_files = args.fixtures or sorted(Path(FIXTURES_NAME).glob("*.html"))
+        print("%-32s %12s %12s %8s" % ("fixture", "reference ms", "current ms", "speedup"))
+        for name, reference_time, current_time in bench_parse(fixture_files, repeat=args.repeat):
+            print("%-32s %12.2f %12.2f %7.1fx" % (name, reference_time * 1e3, current_time * 1e3, reference_time / current_time))
+    elif args.benchmark == 'wiki':
+        results = bench_wiki(args.seasons, args.episodes, args.lines, args.latency, args.max_workers, args.max_per_host, args.repeat, args.max_parsers, args.api)
+        print_wiki(results)
+        if args.json:
+            Path(args.json).write_text(json.dumps(results, indent=1))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+"""
+Episode catalog: one small JSON file (CATALOG_NAME) inside an output directory, listing every episode in canonical order:
+    {"version": <corpus.CATALOG_VERSION>,
+     "seasons": {"Season_1": <directory mtime_ns>, ...},
+     "episodes": [{"season": "Season_1", "ordinal": 1, "title": "Gem Glow", "path": "Season_1/01-Gem Glow.txt",
+                   "lines": 190, "bytes": 10771, "mtime_ns": <file mtime>, "checksum": <sha256 of the text>}, ...]}
+
+The scraper (and sites.py, pipeline.py and mwapi.py) rebuilds it once a crawl is done, by walking the tree,
+so it lists every episode on disk, whichever of them the crawl rewrote; files whose size and mtime are unchanged keep their entries
+without being reread. corpus.episode_files (so query.py, and every index built from the output directory)
+lists the corpus from it instead of walking and sorting the tree.
+The season directory mtimes and listings tell readers whether files were added, removed or renamed since; if so, they walk the tree.
+Each file's size and mtime tell those that need to know whether it was rewritten in place (see corpus.read_catalog).
+
+Rebuild it from an already-scraped output directory with:
+    python3 catalog.py [OUTPUT_DIR]
+"""
+
+from pathlib import Path
+from threading import Lock
+import argparse
+import json
+import logging
+import os
+
+from constants import OUTPUT_NAME, SEASON_ORDER, CATALOG_NAME, LOGGING_FILE
+from manifest import content_hash
+import corpus
+
+class CatalogBuilder:
+    """
+    Collects episodes (in any order, from any thread) and writes the catalog of their output directory.
+    """
+    # entries are read from the written episode files, so scraper.stream_episode need not keep their lines
+    reads_file = True
+
+    def __init__(self, output_dir=OUTPUT_NAME, season_order: list = SEASON_ORDER, keep_existing: bool = True):
+        """
+        If 'keep_existing', starts from the entries of the catalog already in 'output_dir', if there is one,
+        so episodes that are not re-added (e.g. unchanged in an incremental crawl) are kept while their files exist.
+        """
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir.joinpath(CATALOG_NAME)
+        self.season_order = season_order
+        self._lock = Lock()
+        # relative path -> entry
+        self.entries = {}
+        if keep_existing and self.path.exists():
+            try:
+                catalog = json.loads(self.path.read_text())
+            except ValueError:
+                catalog = {}
+            if catalog.get("version") == corpus.CATALOG_VERSION:
+                self.entries = {entry["path"]: entry for entry in catalog["episodes"]}
+
+    def add_file(self, episode_file: Path):
+        """
+        Adds (or replaces) the entry of the written 'episode_file'.
+        """
+        episode_file = Path(episode_file)
+        stat = episode_file.stat()
+        text = episode_file.read_text()
+        relative_path = str(Path(episode_file.parent.name, episode_file.name))
+        ordinal, title = corpus.episode_title(episode_file)
+        entry = {"season": episode_file.parent.name, "ordinal": ordinal, "title": title, "path": relative_path,
+            "lines": len(text.splitlines()), "bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns, "checksum": content_hash(text)}
+        with self._lock:
+            self.entries[relative_path] = entry
+
+    def add_episode(self, episode_file: Path, line_list: list):
+        """
+        Adds (or replaces) the entry of the episode written to 'episode_file'; lets a builder be one of scraper.write_episode's 'stores'.
+        """
+        self.add_file(episode_file)
+
+    def save(self):
+        """
+        Writes the catalog, atomically, leaving out entries whose files no longer exist.
+        """
+        with self._lock:
+            entries = [entry for entry in self.entries.values() if self.output_dir.joinpath(entry["path"]).is_file()]
+        entries.sort(key=lambda entry: (corpus.order_seasons(Path(entry["season"]), self.season_order),
+            corpus.order_episodes(Path(entry["path"])), entry["path"]))
+        catalog = {"version": corpus.CATALOG_VERSION, "seasons": corpus.season_mtimes(self.output_dir), "episodes": entries}
+        temp_file = self.path.with_name(self.path.name + ".tmp")
+        temp_file.write_text(json.dumps(catalog, ensure_ascii=False, indent=0))
+        os.replace(temp_file, self.path)
+        logging.info("Catalogued %d episodes in %r.", len(entries), str(self.path))
+
+    def close(self):
+        """
+        Saves the catalog.
+        """
+        self.save()
+
+def build_catalog(output_name: str = OUTPUT_NAME, season_order: list = SEASON_ORDER, keep_existing: bool = True):
+    """
+    Catalogs every transcript under 'output_name', walking the tree. Returns the builder.
+    If 'keep_existing', the entries of the current catalog are reused for files whose size and mtime are unchanged.
+    """
+    output_dir = Path(output_name)
+    builder = CatalogBuilder(output_dir, season_order, keep_existing)
+    for relative_path, dir_entry in corpus.season_files(output_dir).items():
+        entry = builder.entries.get(relative_path)
+        stat = dir_entry.stat()
+        if entry is None or (entry["bytes"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            builder.add_file(output_dir.joinpath(relative_path))
+    builder.save()
+    return builder
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    parser = argparse.ArgumentParser(description="catalog the episodes of a scraped output directory")
+    parser.add_argument('output', nargs='?', default=OUTPUT_NAME, help='output directory (default: %(default)s)')
+    args = parser.parse_args()
+    builder = build_catalog(args.output)
+    print("Catalogued %d episodes in %r." % (len(builder.entries), str(builder.path)))
@@ -6,10 +6,49 @@ Contains constants used by all modules.
 WIKIA_ROOT = "https://steven-universe.fandom.com"
 OUTPUT_NAME = "output"
 LOGGING_FILE = "su-wikia_scraper.log"
+HTTP_CACHE_NAME = ".http_cache"
+MANIFEST_NAME = "crawl_manifest.json"
+TRIGRAM_INDEX_NAME = "trigram_index.json"
+SQLITE_NAME = "transcripts.sqlite3"
+LINESTORE_NAME = "linestore.bin"
+PACKED_NAME = "transcripts.pack"
+SHARDS_NAME = "shards"
+# analytics.py: directory of the cached count matrices
+ANALYTICS_NAME = "analytics"
+# episode catalog, kept inside the output directory (see catalog.py)
+CATALOG_NAME = "catalog.json"
+# suffix of the temporary files episodes are written through, beside them; never listed as episodes (see corpus.py)
+TEMP_SUFFIX = ".tmp"
 SEASON_ORDER = ["Season_%d" % season_num for season_num in range(1, 5 + 1)]
 SEASON_ORDER.append("Shorts")
 SEASON_ORDER.append("Movie")
 SEASON_ORDER.append("Future")
+# crawl concurrency: total worker threads, and simultaneous jobs against any one host
+MAX_WORKERS = 16
+MAX_PER_HOST = 8
+# hosts whose connections are kept alive at once (sites.py crawls many)
+MAX_POOLED_HOSTS = 64
+# sites.py: site definitions
+SITES_CONFIG = "sites.json"
+# pipeline.py: most fetched pages waiting to be parsed and written
+PIPELINE_QUEUE_SIZE = 32
+# http_client.py: seconds to wait for a response, retries after a failed request,
+# and the base and cap (in seconds) of the exponential backoff between them
+REQUEST_TIMEOUT = 30
+MAX_RETRIES = 4
+RETRY_BACKOFF = 1.0
+RETRY_BACKOFF_MAX = 60.0
+# characters read at a time when a page is streamed (scraper.py --stream)
+STREAM_CHUNK_SIZE = 64 * 1024
+# mwapi.py: most titles per api.php query (the MediaWiki limit for ordinary clients)
+API_BATCH_SIZE = 50
+# query_server.py: port and URL of the query daemon, and seconds between checks for a changed corpus
+QUERY_SERVER_PORT = 8765
+QUERY_SERVER_URL = "http://127.0.0.1:%d" % QUERY_SERVER_PORT
+QUERY_RELOAD_INTERVAL = 2.0
+# result_cache.py: query.py's result cache, and the most bytes of results it keeps
+QUERY_CACHE_NAME = "query_cache.sqlite3"
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
 
 
 if __name__ == '__main__':
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+"""
+Walks the scraped transcripts under OUTPUT_NAME in canonical order:
+seasons as listed in SEASON_ORDER (then any others, by name), then episodes by episode number.
+Corpora of other shows (see sites.py) pass their own season order.
+
+When the output directory holds a current catalog (CATALOG_NAME, written by the scraper; see catalog.py),
+its listing and order are read from the catalog instead of walking and sorting the directory tree.
+Temporary files (TEMP_SUFFIX) left beside the episodes by an interrupted write are never listed.
+"""
+
+from pathlib import Path
+import json
+import os
+import re
+
+from constants import SEASON_ORDER, CATALOG_NAME, TEMP_SUFFIX
+
+CATALOG_VERSION = 2
+
+def order_seasons(spath: Path, season_order: list = SEASON_ORDER):
+    """
+    Returns a sort key placing the season as defined by 'season_order'; unlisted seasons sort last, by name.
+    """
+    sstr = spath.name
+    if sstr in season_order:
+        return season_order.index(sstr), ""
+    return len(season_order), sstr
+
+def order_episodes(efile: Path):
+    """
+    Returns ordering of episode in the season.
+    """
+    episode_filename = efile.name
+    if episode_filename == "Movie.txt":
+        return 0
+    episode_num = re.search(r"(\d+).+", episode_filename).group(1)
+    return int(episode_num)
+
+def episode_title(efile: Path):
+    """
+    Returns (ordinal, title) for an episode file named 'NN-title.txt', or (0, 'Movie') for Movie.txt.
+    """
+    match = re.fullmatch(r"(\d+)-(.*)\.txt", efile.name)
+    if match is None:
+        return order_episodes(efile), efile.stem
+    return int(match.group(1)), match.group(2)
+
+def season_mtimes(output_dir: Path):
+    """
+    Returns {season directory name: mtime_ns} for every directory under 'output_dir'.
+    A directory's mtime changes whenever an episode file in it is added, removed or renamed.
+    """
+    return {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(output_dir) if entry.is_dir()}
+
+def season_files(output_dir: Path):
+    """
+    Returns {relative path: os.DirEntry} for every episode file in a season directory under 'output_dir', without stat-ing them.
+    """
+    files = {}
+    for season_entry in os.scandir(output_dir):
+        if season_entry.is_dir():
+            for entry in os.scandir(season_entry.path):
+                if entry.is_file() and not entry.name.endswith(TEMP_SUFFIX):
+                    files[str(Path(season_entry.name, entry.name))] = entry
+    return files
+
+def read_catalog(output_dir: Path, verify_files: bool = False):
+    """
+    Returns the episode entries of the catalog in 'output_dir', in canonical order,
+    or None if there is none, or if episode files have been added, removed or renamed since it was written:
+    a season directory's mtime changed, or the files on disk are not exactly those listed.
+    With 'verify_files', also returns None if any file's size or mtime is not its entry's, e.g. after it was rewritten in place.
+    Each entry is a dict of season, ordinal, title, path (relative to 'output_dir'), lines, bytes, mtime_ns and checksum.
+    """
+    try:
+        catalog = json.loads(Path(output_dir, CATALOG_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+    if catalog.get("version") != CATALOG_VERSION or catalog["seasons"] != season_mtimes(output_dir):
+        return None
+    entries = {entry["path"]: entry for entry in catalog["episodes"]}
+    files = season_files(output_dir)
+    if files.keys() != entries.keys():
+        return None
+    if verify_files:
+        for relative_path, dir_entry in files.items():
+            stat = dir_entry.stat()
+            if (stat.st_size, stat.st_mtime_ns) != (entries[relative_path]["bytes"], entries[relative_path]["mtime_ns"]):
+                return None
+    return catalog["episodes"]
+
+def episode_files(output_dir: Path, season_order: list = SEASON_ORDER):
+    """
+    Yields every episode file under 'output_dir', in canonical order: the catalog's, if it is current.
+    """
+    entries = read_catalog(output_dir)
+    if entries is not None:
+        yield from (Path(output_dir, entry["path"]) for entry in entries)
+        return
+    season_paths = (path for path in Path(output_dir).iterdir() if path.is_dir())
+    for season_path in sorted(season_paths, key=lambda spath: order_seasons(spath, season_order)):
+        episode_paths = (path for path in season_path.iterdir() if not path.name.endswith(TEMP_SUFFIX))
+        yield from sorted(episode_paths, key=order_episodes)
+
+
+if __name__ == '__main__':
+    pass
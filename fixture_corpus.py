@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+"""
+Small transcript corpus written by the query-side tests (test_trigram.py, test_packed.py, test_shards.py, ...).
+Its lines cover the cases the search backends must agree on: a "|:" stage direction, an empty line,
+a line with no speaker, mixed case, "ſ" (which folds to "s") and non-ASCII text.
+"""
+
+from pathlib import Path
+
+EPISODES = {
+    "Season_1/01-Gem Glow.txt": "Steven: Cookie Cat!\n|: Steven gasps\nGarnet: Nye.",
+    "Season_1/02-Laser Light Cannon.txt": "Pearl: The light cannon.\nSteven: Dad!\nPearl: Cookie Cat? Cookie Cat.",
+    "Season_2/01-Full Disclosure.txt": "Connie: STEVEN!\nSteven: I'm ſorry, Connie. ♪ Café ♪",
+    "Movie/Movie.txt": "Spinel: Other friends!\nSteven: Cookie cat, he's a pet for your tummy\n\nSpinel: Cookie\nCat",
+    }
+# an episode sorting after Season_1/02 only by number, not by name
+BACKPACK = {"Season_1/10-Cheeseburger Backpack.txt": "Steven: Cookie Cat, in a backpack."}
+
+def write_corpus(output_dir, episodes: dict = EPISODES):
+    """
+    Writes 'episodes' ({path relative to 'output_dir': text}) under 'output_dir'. Returns 'output_dir' as a Path.
+    """
+    output_dir = Path(output_dir)
+    for relative_path, text in episodes.items():
+        episode_file = output_dir.joinpath(relative_path)
+        episode_file.parent.mkdir(parents=True, exist_ok=True)
+        episode_file.write_text(text)
+    return output_dir
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+"""
+Local HTTP server imitating the fandom wiki pages the scraper reads, for benchmarks and offline tests.
+- /wiki/Season_N: season index, with one bold <td> cell per episode
+- /wiki/Steven_Universe_Future: index page of the same form
+- /wiki/<episode>/Transcript: transcript page, with a <table class="wikitable bgrevo">
+- /wiki/Steven_Universe:_The_Movie/Transcript: the Movie transcript
+- /wiki/Category:Shorts: category page, with one member cell per short
+- /api.php?action=query&prop=revisions&titles=...: the wikitext and revision ID of up to 50 transcript pages, as JSON
+
+Pages are generated deterministically from the episode name, and each response can be delayed by 'latency' seconds.
+
+Run standalone with:
+    python3 fixture_server.py [--port PORT] [--seasons N] [--episodes M] [--latency SECONDS]
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from html import escape
+from threading import Lock, Thread
+from urllib.parse import parse_qs, quote, unquote
+import argparse
+import json
+import random
+import time
+
+SPEAKERS = ["Steven", "Garnet", "Amethyst", "Pearl", "Greg", "Connie", "Lars", "Sadie", "Peridot", "Lapis"]
+WORDS = ("gem fusion beach city donut the a we're going to save everyone I can't believe it's not butter "
+    "cookie cat temple warp pad lion sword shield bubble friends together").split()
+EPISODE_CELL = '<td style="border-top:0; font-weight:bold !important"><a href="%s" title="%s">"%s"</a></td>'
+SHORTS_CELL = '<div class="category-page__member-left"><a href="%s" title="%s">%s</a></div>'
+# most titles answered by one api.php query, as on the real wiki
+API_MAX_TITLES = 50
+
+def episode_name(season_num: int, episode_num: int):
+    return "Season %d Episode %d" % (season_num, episode_num)
+
+def episode_path(name: str):
+    return "/wiki/" + quote(name.replace(" ", "_"), safe=":")
+
+def transcript_rows(name: str, num_lines: int):
+    """
+    Returns the 'num_lines' dialogue rows of the transcript for 'name', as (kind, speaker, line) 3-tuples.
+    kind is one of "narration", "blank" or "dialogue".
+    """
+    rng = random.Random(name)
+    rows = []
+    for _ in range(num_lines):
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25)))
+        kind = rng.random()
+        if kind < 0.15:
+            rows.append(("narration", None, line))
+        elif kind < 0.17:
+            rows.append(("blank", rng.choice(SPEAKERS), ""))
+        else:
+            rows.append(("dialogue", rng.choice(SPEAKERS), line))
+    return rows
+
+def transcript_page(name: str, num_lines: int):
+    """
+    Returns the HTML of a transcript page for 'name', in the wiki's markup, with 'num_lines' dialogue rows.
+    """
+    rows = []
+    for kind, speaker, line in transcript_rows(name, num_lines):
+        if kind == "narration":
+            rows.append('<tr>\n<td colspan="2"><i>[%s]</i>\n</td></tr>' % escape(line))
+        elif kind == "blank":
+            rows.append('<tr>\n<th>%s\n</th>\n<td>\n</td></tr>' % speaker)
+        else:
+            rows.append('<tr>\n<th><a href="/wiki/%s" title="%s">%s</a>\n</th>\n<td>%s\n</td></tr>' % (speaker, speaker, speaker, escape(line)))
+    navigation = "".join('<li><a href="/wiki/Page_%d">Page %d</a></li>' % (index, index) for index in range(200))
+    return ('<!DOCTYPE html>\n<html><head><title>%s/Transcript</title><script>var ads = [1, 2, 3];</script></head>\n'
+        '<body><nav><ul>%s</ul></nav><main><div class="mw-parser-output">\n'
+        '<table class="wikitable"><tr><td>Previous</td><td>Next</td></tr></table>\n'
+        '<table class="wikitable bgrevo" style="width:100%%;">\n<tbody><tr>\n<th>Character\n</th>\n<th>Dialogue\n</th></tr>\n'
+        '%s\n</tbody></table>\n</div></main><footer><ul>%s</ul></footer></body></html>\n'
+        % (escape(name), navigation, "\n".join(rows), navigation))
+
+def transcript_wikitext(name: str, num_lines: int):
+    """
+    Returns the wikitext source of the transcript page for 'name': the same rows as transcript_page.
+    """
+    rows = []
+    for kind, speaker, line in transcript_rows(name, num_lines):
+        if kind == "narration":
+            rows.append("|-\n| colspan=\"2\" |''[%s]''" % line)
+        elif kind == "blank":
+            rows.append("|-\n!%s\n|" % speaker)
+        else:
+            rows.append("|-\n![[%s]]\n|%s" % (speaker, line))
+    return ("{{Transcript nav|previous=|next=}}\n"
+        '{| class="wikitable bgrevo" style="width:100%%;"\n!Character\n!Dialogue\n%s\n|}\n[[Category:Transcripts]]\n'
+        % "\n".join(rows))
+
+def index_page(names: list):
+    """
+    Returns the HTML of a season index page listing 'names'.
+    """
+    cells = "\n".join("<tr>%s</tr>" % (EPISODE_CELL % (episode_path(name), escape(name), escape(name))) for name in names)
+    return "<!DOCTYPE html>\n<html><body><table class=\"wikitable\">\n%s\n</table></body></html>\n" % cells
+
+def shorts_page(names: list):
+    """
+    Returns the HTML of the Category:Shorts page; its first member is skipped by the scraper.
+    """
+    cells = [SHORTS_CELL % ("/wiki/Classroom_Shorts", "Classroom Shorts", "Classroom Shorts")]
+    cells += [SHORTS_CELL % (episode_path(name), escape(name), escape(name)) for name in names]
+    return "<!DOCTYPE html>\n<html><body>\n%s\n</body></html>\n" % "\n".join(cells)
+
+class WikiFixtureServer:
+    """
+    A generated wiki of 'num_seasons' seasons of 'num_episodes' episodes, plus Future, the Movie and Shorts,
+    served from 127.0.0.1 on a background thread.
+
+    Usage:
+        with WikiFixtureServer(num_seasons=5, num_episodes=10) as server:
+            scraper.WIKIA_ROOT = server.root
+    """
+
+    def __init__(self, num_seasons: int = 5, num_episodes: int = 10, num_lines: int = 200, latency: float = 0.0, port: int = 0):
+        self.num_seasons = num_seasons
+        self.num_episodes = num_episodes
+        self.num_lines = num_lines
+        self.latency = latency
+        self.requests_served = 0
+        self.bytes_served = 0
+        self._lock = Lock()
+        self.wikitexts = {}
+        self.revisions = {}
+        self.pages = self.build_pages()
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fixture.serve(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self.root = "http://127.0.0.1:%d" % self.httpd.server_address[1]
+
+    def build_pages(self):
+        """
+        Returns a dict of every page path to a callable producing its HTML.
+        Also fills in the wikitext and revision ID of every transcript page, for api.php.
+        """
+        pages = {}
+
+        def add_transcript(name, num_lines):
+            pages[unquote(episode_path(name)) + "/Transcript"] = lambda: transcript_page(name, num_lines)
+            self.wikitexts[name + "/Transcript"] = lambda: transcript_wikitext(name, num_lines)
+            self.revisions[name + "/Transcript"] = 1000 + len(self.revisions)
+
+        for season_num in range(1, self.num_seasons + 1):
+            names = [episode_name(season_num, episode_num) for episode_num in range(1, self.num_episodes + 1)]
+            pages["/wiki/Season_%d" % season_num] = (lambda names=names: index_page(names))
+            for name in names:
+                add_transcript(name, self.num_lines)
+        future_names = ["Future Episode %d" % episode_num for episode_num in range(1, self.num_episodes + 1)]
+        pages["/wiki/Steven_Universe_Future"] = lambda: index_page(future_names)
+        short_names = ["Short %d" % short_num for short_num in range(1, self.num_episodes + 1)]
+        pages["/wiki/Category:Shorts"] = lambda: shorts_page(short_names)
+        for name in future_names + short_names:
+            add_transcript(name, self.num_lines)
+        add_transcript("Steven Universe: The Movie", self.num_lines * 5)
+        return pages
+
+    def api_query(self, params: dict):
+        """
+        Answers an api.php request (parsed by urllib.parse.parse_qs) in the shape of
+        action=query&prop=revisions&rvprop=ids|content&rvslots=main&formatversion=2.
+        """
+        if params.get("action") != ["query"] or "titles" not in params:
+            return {"error": {"code": "badparams", "info": "Only action=query with titles is served here."}}
+        titles = params["titles"][0].split("|")
+        response = {"batchcomplete": True, "query": {"pages": []}}
+        if len(titles) > API_MAX_TITLES:
+            response["warnings"] = {"query": {"warnings": "Too many values supplied for parameter \"titles\". The limit is %d." % API_MAX_TITLES}}
+            titles = titles[:API_MAX_TITLES]
+        with_content = "content" in params.get("rvprop", ["ids"])[0].split("|")
+        normalized = []
+        for title in titles:
+            canonical = title.replace("_", " ")
+            if canonical != title:
+                normalized.append({"fromencoded": False, "from": title, "to": canonical})
+            if canonical not in self.wikitexts:
+                response["query"]["pages"].append({"ns": 0, "title": canonical, "missing": True})
+                continue
+            revision = {"revid": self.revisions[canonical]}
+            if with_content:
+                revision["slots"] = {"main": {"contentmodel": "wikitext", "contentformat": "text/x-wiki", "content": self.wikitexts[canonical]()}}
+            response["query"]["pages"].append({"pageid": self.revisions[canonical], "ns": 0, "title": canonical, "revisions": [revision]})
+        if normalized:
+            response["query"]["normalized"] = normalized
+        return response
+
+    def serve(self, handler: BaseHTTPRequestHandler):
+        """
+        Answers one GET request, after the configured latency.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        path, _, query = handler.path.partition("?")
+        if path == "/api.php":
+            body = json.dumps(self.api_query(parse_qs(query))).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        else:
+            page = self.pages.get(unquote(handler.path))
+            if page is None:
+                handler.send_error(404)
+                return
+            body = page().encode("utf-8")
+            content_type = "text/html; charset=utf-8"
+        handler.send_response(200)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+        with self._lock:
+            self.requests_served += 1
+            self.bytes_served += len(body)
+
+    def start(self):
+        Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="serve a generated SU Wikia stand-in")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--seasons', type=int, default=5)
+    parser.add_argument('--episodes', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each response')
+    args = parser.parse_args()
+    server = WikiFixtureServer(args.seasons, args.episodes, latency=args.latency, port=args.port)
+    print("Serving %d seasons x %d episodes at %s" % (args.seasons, args.episodes, server.root))
+    server.httpd.serve_forever()
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+"""
+SQLite storage and full-text search backend for transcripts.
+
+Tables:
+- seasons(id, name, ordinal)
+- episodes(id, season_id, ordinal, title, path)
+- lines(id, episode_id, lineno, speaker, dialogue)
+- lines_fts: FTS5 index over lines(speaker, dialogue)
+
+Queries use FTS5 syntax: words, "phrases", prefix*, AND/OR/NOT, and column filters such as speaker:garnet.
+
+Build from an already-scraped output directory with:
+    python3 fts.py
+"""
+
+from pathlib import Path
+from threading import Lock
+import logging
+import sqlite3
+
+from constants import OUTPUT_NAME, SEASON_ORDER, SQLITE_NAME, LOGGING_FILE
+import corpus
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seasons (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    ordinal INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    season_id INTEGER NOT NULL REFERENCES seasons(id),
+    ordinal INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY,
+    episode_id INTEGER NOT NULL REFERENCES episodes(id),
+    lineno INTEGER NOT NULL,
+    speaker TEXT,
+    dialogue TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lines_episode ON lines(episode_id, lineno);
+CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5(
+    speaker, dialogue,
+    content='lines', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+"""
+
+def split_line(line: str):
+    """
+    Inverse of scraper.format_linelist for one line: returns (speaker, dialogue), with speaker None for '|' rows.
+    Lines without a ': ' separator (continuations of multi-line dialogue) have no speaker.
+    """
+    speaker, separator, dialogue = line.partition(": ")
+    if not separator:
+        return None, line
+    return (None if speaker == "|" else speaker), dialogue
+
+def read_linelist(episode_file: Path):
+    """
+    Reads the (speaker, dialogue) 2-tuples back out of an 'episode_file' written by scraper.format_linelist,
+    as the scraper hands them to stores: lines without a ': ' separator continue the dialogue of the line before them.
+    """
+    line_list = []
+    for line in episode_file.read_text().splitlines():
+        speaker, dialogue = split_line(line)
+        if speaker is None and not line.startswith("|: ") and line_list:
+            line_list[-1] = (line_list[-1][0], line_list[-1][1] + "\n" + line)
+        else:
+            line_list.append((speaker, dialogue))
+    return line_list
+
+class TranscriptDatabase:
+    """
+    A transcript database. Safe to share between scraper threads.
+    """
+
+    def __init__(self, path=SQLITE_NAME):
+        """
+        Opens (and creates, if need be) the database at 'path'.
+        """
+        self.path = str(path)
+        self._lock = Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add_episode(self, episode_file: Path, line_list: list):
+        """
+        Stores the (speaker, dialogue) 2-tuples of 'line_list' as the episode written to 'episode_file',
+        replacing any lines previously stored for it.
+        """
+        season_name = episode_file.parent.name
+        relative_path = str(Path(season_name, episode_file.name))
+        ordinal, title = corpus.episode_title(episode_file)
+        season_ordinal = SEASON_ORDER.index(season_name) if season_name in SEASON_ORDER else len(SEASON_ORDER)
+        with self._lock, self.connection:
+            cursor = self.connection.cursor()
+            cursor.execute("INSERT OR IGNORE INTO seasons (name, ordinal) VALUES (?, ?)", (season_name, season_ordinal))
+            season_id = cursor.execute("SELECT id FROM seasons WHERE name = ?", (season_name,)).fetchone()[0]
+            row = cursor.execute("SELECT id FROM episodes WHERE path = ?", (relative_path,)).fetchone()
+            if row is None:
+                cursor.execute("INSERT INTO episodes (season_id, ordinal, title, path) VALUES (?, ?, ?, ?)",
+                    (season_id, ordinal, title, relative_path))
+                episode_id = cursor.lastrowid
+            else:
+                episode_id = row[0]
+                cursor.execute("UPDATE episodes SET season_id = ?, ordinal = ?, title = ? WHERE id = ?",
+                    (season_id, ordinal, title, episode_id))
+                # external-content FTS tables are kept in sync by deleting the old rows explicitly
+                cursor.execute("INSERT INTO lines_fts (lines_fts, rowid, speaker, dialogue) "
+                    "SELECT 'delete', id, speaker, dialogue FROM lines WHERE episode_id = ?", (episode_id,))
+                cursor.execute("DELETE FROM lines WHERE episode_id = ?", (episode_id,))
+            # lineno is the line of the transcript file the row starts on; dialogue may span several
+            lineno = 1
+            for speaker, dialogue in line_list:
+                cursor.execute("INSERT INTO lines (episode_id, lineno, speaker, dialogue) VALUES (?, ?, ?, ?)",
+                    (episode_id, lineno, speaker, dialogue))
+                cursor.execute("INSERT INTO lines_fts (rowid, speaker, dialogue) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, speaker, dialogue))
+                lineno += 1 + dialogue.count("\n") + (speaker or "").count("\n")
+        logging.info("Stored %d lines of %r.", len(line_list), relative_path)
+
+    def search(self, query: str, limit: int = 50):
+        """
+        Runs the FTS5 'query', best match first.
+        Returns a list of (path, lineno, speaker, dialogue) 4-tuples; path is relative to OUTPUT_NAME.
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT episodes.path, lines.lineno, lines.speaker, lines.dialogue "
+                "FROM lines_fts JOIN lines ON lines.id = lines_fts.rowid "
+                "JOIN episodes ON episodes.id = lines.episode_id "
+                "WHERE lines_fts MATCH ? ORDER BY bm25(lines_fts) LIMIT ?",
+                (query, limit)).fetchall()
+        return rows
+
+def load_corpus(output_name: str = OUTPUT_NAME, database_name: str = SQLITE_NAME):
+    """
+    Stores every transcript under 'output_name' into the database at 'database_name'.
+    """
+    database = TranscriptDatabase(database_name)
+    for episode_file in corpus.episode_files(Path(output_name)):
+        database.add_episode(episode_file, read_linelist(episode_file))
+    return database
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    load_corpus().close()
+    print("Stored transcripts under %r into %r." % (OUTPUT_NAME, SQLITE_NAME))
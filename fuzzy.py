@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+"""
+Approximate (typo-tolerant) search: lines holding a substring within edit distance K of a query.
+Matching is case-insensitive: the query and lines are case-folded first.
+
+Lines are narrowed down with the q-gram lemma before any edit distance is computed:
+each edit destroys at most q of the query's q-grams, so a line within distance K of it
+must still contain all but K * q of the query's distinct q-grams.
+Lines must pass the test for both trigrams (as in trigram.py, so a current trigram index also rules out whole episodes)
+and bigrams, which rule out more lines at small K; where K is too large for either to rule anything out, it is skipped.
+Within a candidate line, the same count is taken over each stretch a match could span (the query's length plus K),
+and only the stretches that pass are verified, with Myers' bit-parallel algorithm, which computes a column of the edit distance
+matrix per character of the line with a few operations on one integer, whatever the length of the query.
+
+Run with:
+    python3 query.py --fuzzy K QUERY
+"""
+
+from pathlib import Path
+
+from constants import OUTPUT_NAME, TRIGRAM_INDEX_NAME, SHARDS_NAME
+from batch import iter_episodes
+import metrics
+import trigram
+
+def qgrams(text: str, q: int):
+    """
+    Returns the set of q-character substrings of 'text'.
+    """
+    return {text[index:index + q] for index in range(len(text) - q + 1)}
+
+def myers_search(pattern: str, text: str):
+    """
+    Returns (distance, end) for the substring of 'text' closest to 'pattern' in edit distance,
+    where 'end' is the index just past the first such substring. Returns (len(pattern), 0) for an empty 'text'.
+    """
+    length = len(pattern)
+    if length == 0:
+        return 0, 0
+    peq = {}
+    for index, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | 1 << index
+    mask = (1 << length) - 1
+    high = 1 << (length - 1)
+    plus, minus = mask, 0
+    score = best = length
+    best_end = 0
+    for index, char in enumerate(text):
+        eq = peq.get(char, 0)
+        xv = eq | minus
+        xh = (((eq & plus) + plus) ^ plus) | eq
+        horizontal_plus = minus | (~(xh | plus) & mask)
+        horizontal_minus = plus & xh
+        if horizontal_plus & high:
+            score += 1
+        elif horizontal_minus & high:
+            score -= 1
+        # a match may start anywhere in 'text': the top row of the matrix stays 0, so nothing is shifted in
+        horizontal_plus = (horizontal_plus << 1) & mask
+        horizontal_minus = (horizontal_minus << 1) & mask
+        plus = horizontal_minus | (~(xv | horizontal_plus) & mask)
+        minus = horizontal_plus & xv
+        if score < best:
+            best, best_end = score, index + 1
+    return best, best_end
+
+def fuzzy_span(pattern: str, text: str):
+    """
+    Returns (distance, (start, end)) of the first substring of 'text' closest to 'pattern'.
+    The start is found by matching the reversed pattern backwards from the end.
+    """
+    distance, end = myers_search(pattern, text)
+    if distance >= len(pattern):
+        return distance, (0, 0)
+    reverse_distance, reverse_end = myers_search(pattern[::-1], text[end - 1::-1])
+    return distance, (end - reverse_end, end)
+
+class FuzzyQuery:
+    """
+    A query, with the q-grams that filter candidate lines for it at edit distance 'max_distance'.
+    """
+
+    def __init__(self, query: str, max_distance: int):
+        """
+        Raises ValueError if 'max_distance' is negative.
+        """
+        if max_distance < 0:
+            raise ValueError("The edit distance must not be negative; got %d." % max_distance)
+        self.query = query.casefold()
+        self.max_distance = max_distance
+        # q -> (the query's distinct q-grams, how many of them may be missing), for the q that can rule lines out
+        self.filters = {}
+        for q in (3, 2):
+            grams = qgrams(self.query, q)
+            if len(grams) > max_distance * q:
+                self.filters[q] = (grams, max_distance * q)
+
+    def is_candidate(self, folded: str):
+        """
+        Returns True unless the case-folded 'folded' text is too far from the query to hold a match, by the q-gram lemma.
+        """
+        for grams, allowed in self.filters.values():
+            missing = 0
+            for gram in grams:
+                if gram not in folded:
+                    missing += 1
+                    if missing > allowed:
+                        return False
+        return True
+
+    def regions(self, folded: str):
+        """
+        Returns the merged (start, end) stretches of the case-folded line 'folded' that may hold a match,
+        by the q-gram lemma applied to every stretch a match could span.
+        """
+        length = len(self.query) + self.max_distance
+        if not self.filters:
+            return [(0, len(folded))]
+        q = min(self.filters)
+        grams, allowed = self.filters[q]
+        threshold = len(grams) - allowed
+        hits = []
+        for gram in grams:
+            position = folded.find(gram)
+            while position != -1:
+                hits.append((position, gram))
+                position = folded.find(gram, position + 1)
+        hits.sort()
+        # the q-grams of a match start within 'width' positions of each other
+        width = length - q + 1
+        regions = []
+        counts = {}
+        last = 0
+        for first, (start, _) in enumerate(hits):
+            while last < len(hits) and hits[last][0] < start + width:
+                counts[hits[last][1]] = counts.get(hits[last][1], 0) + 1
+                last += 1
+            if len(counts) >= threshold:
+                region = (max(0, start - (length - q)), min(len(folded), start + length))
+                if regions and region[0] <= regions[-1][1]:
+                    regions[-1] = (regions[-1][0], region[1])
+                else:
+                    regions.append(region)
+            gram = hits[first][1]
+            counts[gram] -= 1
+            if not counts[gram]:
+                del counts[gram]
+        return regions
+
+    def index_candidates(self, index: trigram.TrigramIndex):
+        """
+        Returns the relative paths of the files in 'index' that may hold a match, or None if trigrams cannot tell.
+        """
+        if 3 not in self.filters:
+            return None
+        grams, allowed = self.filters[3]
+        postings = [int(index.postings.get(gram, "0"), 16) for gram in grams]
+        return {relative_path for file_id, (relative_path, _, _) in enumerate(index.files)
+            if sum(posting >> file_id & 1 for posting in postings) >= len(grams) - allowed}
+
+    def match(self, line: str):
+        """
+        Returns (distance, span) if 'line' holds a substring within the edit distance, else None.
+        The span is in the case-folded line, which is the line itself unless folding changed its length.
+        """
+        folded = line.casefold()
+        if not self.is_candidate(folded):
+            return None
+        best = None
+        for start, end in self.regions(folded):
+            distance, _ = myers_search(self.query, folded[start:end])
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = distance, start, end
+                if distance == 0:
+                    break
+        if best is None:
+            return None
+        distance, start, end = best
+        _, (span_start, span_end) = fuzzy_span(self.query, folded[start:end])
+        return distance, (start + span_start, start + span_end)
+
+def iter_fuzzy_matches(query: str, max_distance: int, max_matches: int = None, max_per_file: int = None,
+        output_dir=OUTPUT_NAME, index_name: str = TRIGRAM_INDEX_NAME, shards_name: str = SHARDS_NAME):
+    """
+    Returns an iterator of (episode_file, lineno, line, span, distance) for every line holding a substring
+    within edit distance 'max_distance' of 'query', in canonical episode order, with the limits of query.iter_matches.
+    A current trigram index at 'index_name' rules out whole episodes.
+    Raises ValueError at once, before anything is searched, if 'max_distance' is negative.
+    """
+    return _iter_fuzzy_matches(FuzzyQuery(query, max_distance), max_matches, max_per_file, output_dir, index_name, shards_name)
+
+def _iter_fuzzy_matches(fuzzy_query: FuzzyQuery, max_matches: int, max_per_file: int, output_dir, index_name: str, shards_name: str):
+    """
+    Yields the matches of iter_fuzzy_matches for 'fuzzy_query'.
+    """
+    output_dir = Path(output_dir)
+    candidates = None
+    index = trigram.load_index(index_name) if output_dir.is_dir() else None
+    if index is not None and index.is_current(output_dir):
+        candidates = fuzzy_query.index_candidates(index)
+    num_matches = 0
+    for episode_file, lines in iter_episodes(output_dir, shards_name, candidates):
+        if max_matches is not None and num_matches >= max_matches:
+            return
+        num_file_matches = 0
+        with metrics.timer("scan") as scan:
+            if fuzzy_query.is_candidate("\n".join(lines).casefold()):
+                for line_index, line in enumerate(lines):
+                    matched = fuzzy_query.match(line)
+                    if matched is None:
+                        continue
+                    distance, span = matched
+                    scan.pause()
+                    yield episode_file, line_index + 1, line, span, distance
+                    scan.resume()
+                    num_matches += 1
+                    num_file_matches += 1
+                    if max_matches is not None and num_matches >= max_matches:
+                        break
+                    if max_per_file is not None and num_file_matches >= max_per_file:
+                        break
+        metrics.count("files_scanned")
+        metrics.count("matches", num_file_matches)
@@ -0,0 +1,347 @@
+#!/usr/bin/python3
+"""
+Shared HTTP client for the scraper.
+- One requests.Session, so connections are pooled and kept alive per host.
+- Responses are cached on disk, keyed by URL.
+- Cached pages are revalidated with ETag/Last-Modified conditional GETs,
+  so an unchanged page costs a 304 instead of a full HTML body.
+- Failed requests (connection errors, timeouts, 429 and 5xx responses) are retried with exponential backoff,
+  honouring Retry-After.
+- A host that answers 429 or 503 is throttled: requests to it are spaced out, twice as far apart each time,
+  and the spacing is halved again with every successful response.
+- A host can also be given a fixed rate limit (see limit_rate), below which the spacing never drops.
+"""
+
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import monotonic, sleep
+from urllib.parse import urlsplit
+import codecs
+import json
+import logging
+import os
+import random
+
+from requests.adapters import HTTPAdapter
+import requests as r
+
+from constants import HTTP_CACHE_NAME, MAX_PER_HOST, MAX_POOLED_HOSTS, REQUEST_TIMEOUT, MAX_RETRIES, RETRY_BACKOFF, RETRY_BACKOFF_MAX, STREAM_CHUNK_SIZE, TEMP_SUFFIX
+import metrics
+
+# responses worth asking again for; THROTTLE_STATUSES also slow the host down
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+THROTTLE_STATUSES = frozenset((429, 503))
+# seconds between requests to a host once it first throttles us; spacing below MIN_THROTTLE / 2 is dropped
+MIN_THROTTLE = 0.1
+
+def retry_after(response):
+    """
+    Returns the seconds to wait given by the Retry-After header of 'response' (in seconds or as an HTTP date), or None.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def open_temp(target: Path):
+    """
+    Opens a new temporary file beside 'target' for writing text, named uniquely across threads and processes.
+    Its name is the returned file's 'name'; the caller renames it onto 'target', or removes it.
+    """
+    return NamedTemporaryFile("w", encoding="utf-8", newline="", dir=target.parent, prefix=target.name + ".", suffix=TEMP_SUFFIX, delete=False)
+
+def replace_text(target: Path, contents: str):
+    """
+    Atomically replaces 'target' with 'contents', through a temporary file of its own.
+    """
+    temp_file = open_temp(target)
+    try:
+        with temp_file:
+            temp_file.write(contents)
+        os.replace(temp_file.name, target)
+    except BaseException:
+        Path(temp_file.name).unlink(missing_ok=True)
+        raise
+
+class HttpClient:
+    """
+    Fetches pages through a pooled session and an on-disk conditional-GET cache.
+    Pass cache_dir=None to disable the cache.
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_NAME, pool_maxsize: int = MAX_PER_HOST,
+            max_retries: int = MAX_RETRIES, backoff: float = RETRY_BACKOFF, backoff_max: float = RETRY_BACKOFF_MAX,
+            pool_hosts: int = MAX_POOLED_HOSTS):
+        """
+        Creates the session. 'pool_maxsize' is the number of kept-alive connections per host,
+        for up to 'pool_hosts' hosts at once.
+        A failed request is retried up to 'max_retries' times, the n-th time after about 'backoff' * 2**n seconds,
+        at most 'backoff_max'.
+        """
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        # host -> (seconds between requests, monotonic time of the next request allowed)
+        self._throttles = {}
+        # host -> least seconds between requests, set by limit_rate
+        self._min_intervals = {}
+        self.session = r.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        self._lock = Lock()
+
+    def _cache_paths(self, urlname: str):
+        """
+        Returns the (metadata, body) paths under which 'urlname' is cached.
+        """
+        key = sha256(urlname.encode("utf-8")).hexdigest()
+        return self.cache_dir.joinpath(key + ".json"), self.cache_dir.joinpath(key + ".html")
+
+    def _read_cache(self, urlname: str):
+        """
+        Returns the cached (metadata, text) for 'urlname', or (None, None) if it has not been cached.
+        """
+        meta_file, body_file = self._cache_paths(urlname)
+        try:
+            metadata = json.loads(meta_file.read_text())
+            text = body_file.read_text(encoding="utf-8")
+        except (OSError, ValueError):
+            return None, None
+        return metadata, text
+
+    def _write_cache(self, urlname: str, metadata: dict, text: str):
+        """
+        Atomically replaces the cached copy of 'urlname': its body, then its metadata.
+        A body newer than its metadata only costs a full refetch; metadata newer than its body would have
+        a stale body served on the next 304, so the metadata always goes last.
+        """
+        with self._lock:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        meta_file, body_file = self._cache_paths(urlname)
+        replace_text(body_file, text)
+        replace_text(meta_file, json.dumps(metadata))
+
+    def limit_rate(self, host: str, requests_per_second: float):
+        """
+        Sends at most 'requests_per_second' requests to 'host' (a netloc, e.g. 'steven-universe.fandom.com').
+        """
+        if requests_per_second <= 0:
+            raise ValueError(f"requests_per_second := {requests_per_second} must be positive.")
+        with self._lock:
+            self._min_intervals[host] = 1 / requests_per_second
+            interval, next_request = self._throttles.get(host, (0.0, monotonic()))
+            self._throttles[host] = (max(interval, self._min_intervals[host]), next_request)
+
+    def _wait_turn(self, host: str):
+        """
+        Blocks until a request to the throttled 'host' is allowed, and books the following slot.
+        """
+        with self._lock:
+            throttle = self._throttles.get(host)
+            if throttle is None:
+                return
+            interval, next_request = throttle
+            now = monotonic()
+            start = max(now, next_request)
+            self._throttles[host] = (interval, start + interval)
+        if start > now:
+            sleep(start - now)
+
+    def _adapt(self, host: str, status_code: int):
+        """
+        Spaces out requests to 'host' after a throttling response; relaxes the spacing after a successful one.
+        """
+        with self._lock:
+            interval, next_request = self._throttles.get(host, (0.0, monotonic()))
+            min_interval = self._min_intervals.get(host, 0.0)
+            if status_code in THROTTLE_STATUSES:
+                interval = min(max(2 * interval, MIN_THROTTLE, min_interval), max(self.backoff_max, min_interval))
+                logging.warning("%s is throttling requests (%d). Spacing them %.2f s apart.", host, status_code, interval)
+                metrics.count("throttled")
+            elif status_code < 400 and interval > min_interval:
+                interval = max(interval / 2, min_interval)
+            else:
+                return
+            if interval < MIN_THROTTLE / 2 and not min_interval:
+                self._throttles.pop(host, None)
+            else:
+                self._throttles[host] = (interval, next_request)
+
+    def _backoff_delay(self, attempt: int):
+        """
+        Returns the jittered seconds to wait before retry number 'attempt' (from 0).
+        """
+        return min(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5), self.backoff_max)
+
+    def _get(self, urlname: str, headers: dict = None, stream: bool = False):
+        """
+        Sends a GET request for 'urlname', retrying connection errors, timeouts and RETRY_STATUSES responses.
+        Returns the last response, which may still be an error. With 'stream', its body is left unread.
+        """
+        host = urlsplit(urlname).netloc
+        attempt = 0
+        while True:
+            self._wait_turn(host)
+            try:
+                response = self.session.get(urlname, headers=headers, timeout=REQUEST_TIMEOUT, stream=stream)
+            except (r.ConnectionError, r.Timeout) as error:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logging.warning("GET %r failed (%r). Retrying in %.2f s.", urlname, error, delay)
+            else:
+                self._adapt(host, response.status_code)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = min(max(retry_after(response) or 0.0, self._backoff_delay(attempt)), self.backoff_max)
+                response.close()
+                logging.warning("GET %r answered %d. Retrying in %.2f s.", urlname, response.status_code, delay)
+            metrics.count("retries")
+            attempt += 1
+            sleep(delay)
+
+    def fetch(self, urlname: str):
+        """
+        Sends a (conditional, if cached) GET request for 'urlname'.
+        Returns a 2-tuple: (text, not_modified), where not_modified is True if the cached copy was still current.
+        """
+        with metrics.timer("fetch"):
+            text, not_modified = self._fetch(urlname)
+        metrics.count("pages_not_modified" if not_modified else "pages_fetched")
+        return text, not_modified
+
+    def _fetch(self, urlname: str):
+        if self.cache_dir is None:
+            response = self._get(urlname)
+            response.raise_for_status()
+            metrics.count("bytes_received", len(response.content))
+            return response.text, False
+        metadata, cached_text = self._read_cache(urlname)
+        headers = {}
+        if metadata is not None:
+            if metadata.get("etag"):
+                headers["If-None-Match"] = metadata["etag"]
+            if metadata.get("last_modified"):
+                headers["If-Modified-Since"] = metadata["last_modified"]
+        response = self._get(urlname, headers)
+        metrics.count("bytes_received", len(response.content))
+        if response.status_code == 304 and metadata is not None:
+            logging.info("%r not modified; using cached copy.", urlname)
+            return cached_text, True
+        response.raise_for_status()
+        metadata = {
+            "url": urlname,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            }
+        if metadata["etag"] or metadata["last_modified"]:
+            self._write_cache(urlname, metadata, response.text)
+        return response.text, False
+
+    def get_text(self, urlname: str):
+        """
+        Returns the text of the page at 'urlname'.
+        """
+        return self.fetch(urlname)[0]
+
+    def iter_text(self, urlname: str, chunk_size: int = STREAM_CHUNK_SIZE):
+        """
+        Like fetch, but yields the text of the page at 'urlname' in chunks of about 'chunk_size' characters,
+        as it is received, so the page is never held whole. A new copy is streamed to the cache as it is read,
+        and only replaces the cached one once complete.
+        """
+        metadata, headers = None, {}
+        if self.cache_dir is not None:
+            meta_file, body_file = self._cache_paths(urlname)
+            try:
+                metadata = json.loads(meta_file.read_text())
+            except (OSError, ValueError):
+                metadata = None
+            if metadata is not None and body_file.exists():
+                if metadata.get("etag"):
+                    headers["If-None-Match"] = metadata["etag"]
+                if metadata.get("last_modified"):
+                    headers["If-Modified-Since"] = metadata["last_modified"]
+        with metrics.timer("fetch"):
+            response = self._get(urlname, headers, stream=True)
+        with response:
+            if response.status_code == 304 and headers:
+                logging.info("%r not modified; using cached copy.", urlname)
+                metrics.count("pages_not_modified")
+                with body_file.open(encoding="utf-8", newline="") as cached:
+                    yield from iter(lambda: cached.read(chunk_size), "")
+                return
+            response.raise_for_status()
+            metrics.count("pages_fetched")
+            metadata = {
+                "url": urlname,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                }
+            cache_body = None
+            if self.cache_dir is not None and (metadata["etag"] or metadata["last_modified"]):
+                with self._lock:
+                    self.cache_dir.mkdir(parents=True, exist_ok=True)
+                cache_body = open_temp(body_file)
+                temp_body = Path(cache_body.name)
+            decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+            try:
+                for data in response.iter_content(chunk_size):
+                    metrics.count("bytes_received", len(data))
+                    text = decoder.decode(data)
+                    if text:
+                        if cache_body is not None:
+                            cache_body.write(text)
+                        yield text
+                text = decoder.decode(b"", final=True)
+                if text:
+                    if cache_body is not None:
+                        cache_body.write(text)
+                    yield text
+            except BaseException:
+                if cache_body is not None:
+                    cache_body.close()
+                    temp_body.unlink()
+                raise
+        if cache_body is not None:
+            cache_body.close()
+            # metadata last, as in _write_cache
+            os.replace(temp_body, body_file)
+            replace_text(meta_file, json.dumps(metadata))
+
+
+default_client = HttpClient()
+
+def fetch(urlname: str):
+    """
+    HttpClient.fetch on the shared client.
+    """
+    return default_client.fetch(urlname)
+
+def get_text(urlname: str):
+    """
+    HttpClient.get_text on the shared client.
+    """
+    return default_client.get_text(urlname)
+
+def iter_text(urlname: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    HttpClient.iter_text on the shared client.
+    """
+    return default_client.iter_text(urlname, chunk_size)
+
+
+if __name__ == '__main__':
+    pass
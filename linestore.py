@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+"""
+Compact columnar store of transcript lines, for speaker/season/episode-filtered queries.
+
+One row per (speaker, dialogue) line, held in parallel integer columns:
+- speaker_ids: index into the interned speaker table (-1 for rows with no speaker)
+- episode_ids: index into the episode table, which also gives the season
+- linenos: line of the transcript file the row starts on
+- dialogue_offsets: byte offsets of each row's dialogue in one utf-8 blob
+Rows are grouped by episode, in canonical order, so a season or episode is a contiguous range of rows.
+
+File layout: 8-byte little-endian header length, JSON header, then each column's raw bytes, then the dialogue blob.
+
+Build at scrape time with 'scraper.py --linestore', or from an already-scraped output directory with:
+    python3 linestore.py
+"""
+
+from array import array
+from pathlib import Path
+from threading import Lock
+import json
+import logging
+import os
+import re
+import sys
+
+from constants import OUTPUT_NAME, SEASON_ORDER, LINESTORE_NAME, LOGGING_FILE
+import corpus
+import fts
+
+STORE_VERSION = 1
+COLUMNS = (("speaker_ids", "i"), ("episode_ids", "I"), ("linenos", "I"), ("dialogue_offsets", "Q"))
+
+def season_order(season_name: str):
+    """
+    Returns the canonical position of a season, with unknown seasons last.
+    """
+    return SEASON_ORDER.index(season_name) if season_name in SEASON_ORDER else len(SEASON_ORDER)
+
+class LineStoreBuilder:
+    """
+    Collects episodes (in any order, from any thread) and writes them out as a line store.
+    """
+
+    def __init__(self, path=LINESTORE_NAME, keep_existing: bool = True):
+        """
+        If 'keep_existing', starts from the episodes already in the store at 'path', if there is one,
+        so episodes that are not re-added (e.g. unchanged in an incremental crawl) are kept.
+        """
+        self.path = Path(path)
+        self._lock = Lock()
+        self.episodes = {}
+        if keep_existing and self.path.exists():
+            store = LineStore(self.path)
+            for episode_id, (season_name, ordinal, title, relative_path) in enumerate(store.episodes):
+                start, end = store.episode_range(episode_id)
+                line_list = [(store.speaker(row), store.dialogue(row)) for row in range(start, end)]
+                self.episodes[relative_path] = (season_name, ordinal, title, line_list)
+
+    def add_episode(self, episode_file: Path, line_list: list):
+        """
+        Adds (or replaces) the (speaker, dialogue) 2-tuples of the episode written to 'episode_file'.
+        """
+        season_name = episode_file.parent.name
+        ordinal, title = corpus.episode_title(episode_file)
+        with self._lock:
+            self.episodes[str(Path(season_name, episode_file.name))] = (season_name, ordinal, title, list(line_list))
+
+    def save(self):
+        """
+        Writes the collected episodes to the store file, atomically.
+        """
+        with self._lock:
+            episodes = sorted(self.episodes.items(), key=lambda item: (season_order(item[1][0]), item[1][1], item[0]))
+        seasons = []
+        speakers = {}
+        episode_table = []
+        columns = {name: array(typecode) for name, typecode in COLUMNS}
+        blob = bytearray()
+        for episode_id, (relative_path, (season_name, ordinal, title, line_list)) in enumerate(episodes):
+            if season_name not in seasons:
+                seasons.append(season_name)
+            episode_table.append([seasons.index(season_name), ordinal, title, relative_path, len(columns["linenos"])])
+            lineno = 1
+            for speaker, dialogue in line_list:
+                if speaker is None:
+                    columns["speaker_ids"].append(-1)
+                else:
+                    columns["speaker_ids"].append(speakers.setdefault(speaker, len(speakers)))
+                columns["episode_ids"].append(episode_id)
+                columns["linenos"].append(lineno)
+                columns["dialogue_offsets"].append(len(blob))
+                blob += dialogue.encode("utf-8")
+                lineno += 1 + dialogue.count("\n") + (speaker or "").count("\n")
+        columns["dialogue_offsets"].append(len(blob))
+        header = {
+            "version": STORE_VERSION,
+            "byteorder": sys.byteorder,
+            "seasons": seasons,
+            "speakers": list(speakers),
+            "episodes": episode_table,
+            "columns": [[name, typecode, len(columns[name])] for name, typecode in COLUMNS],
+            }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        temp_file = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_file, "wb") as store_file:
+            store_file.write(len(header_bytes).to_bytes(8, "little"))
+            store_file.write(header_bytes)
+            for name, _ in COLUMNS:
+                columns[name].tofile(store_file)
+            store_file.write(blob)
+        os.replace(temp_file, self.path)
+        logging.info("Saved %d lines of %d episodes to %r.", len(columns["linenos"]), len(episodes), str(self.path))
+
+    def close(self):
+        """
+        Saves the store; lets a builder be used as one of scraper.write_episode's 'stores'.
+        """
+        self.save()
+
+class LineStore:
+    """
+    A loaded line store.
+    """
+
+    def __init__(self, path=LINESTORE_NAME):
+        """
+        Reads the store at 'path'.
+        """
+        data = Path(path).read_bytes()
+        header_length = int.from_bytes(data[:8], "little")
+        header = json.loads(data[8:8 + header_length].decode("utf-8"))
+        if header["version"] != STORE_VERSION:
+            raise ValueError(f"{path} is a version {header['version']} line store; expected {STORE_VERSION}.")
+        self.seasons = header["seasons"]
+        self.speakers = header["speakers"]
+        self.episodes = [(self.seasons[season_id], ordinal, title, relative_path)
+            for season_id, ordinal, title, relative_path, _ in header["episodes"]]
+        self.episode_starts = [line_start for *_, line_start in header["episodes"]]
+        position = 8 + header_length
+        for name, typecode, count in header["columns"]:
+            column = array(typecode)
+            column.frombytes(data[position:position + count * column.itemsize])
+            if header["byteorder"] != sys.byteorder:
+                column.byteswap()
+            setattr(self, name, column)
+            position += count * column.itemsize
+        self.blob = data[position:]
+        self.episode_starts.append(len(self.linenos))
+
+    def __len__(self):
+        return len(self.linenos)
+
+    def episode_range(self, episode_id: int):
+        """
+        Returns the (start, end) row range of an episode.
+        """
+        return self.episode_starts[episode_id], self.episode_starts[episode_id + 1]
+
+    def speaker(self, row: int):
+        speaker_id = self.speaker_ids[row]
+        return None if speaker_id < 0 else self.speakers[speaker_id]
+
+    def dialogue(self, row: int):
+        return self.blob[self.dialogue_offsets[row]:self.dialogue_offsets[row + 1]].decode("utf-8")
+
+    def select(self, speaker: str = None, season: str = None, episode: str = None):
+        """
+        Yields the rows matching every filter given, using only the integer columns.
+        - speaker: speaker name, case-insensitive
+        - season: season number, or season directory name (e.g. Season_1, Movie), case-insensitive
+        - episode: episode number, or episode title (case-insensitive)
+        """
+        episode_ids = range(len(self.episodes))
+        if season is not None and season.isdigit():
+            season = "Season_%d" % int(season)
+        if season is not None:
+            episode_ids = [episode_id for episode_id in episode_ids if self.episodes[episode_id][0].casefold() == season.casefold()]
+        if episode is not None:
+            if episode.isdigit():
+                episode_ids = [episode_id for episode_id in episode_ids if self.episodes[episode_id][1] == int(episode)]
+            else:
+                episode_ids = [episode_id for episode_id in episode_ids if self.episodes[episode_id][2].casefold() == episode.casefold()]
+        speaker_id = None
+        if speaker is not None:
+            speaker_ids = [index for index, name in enumerate(self.speakers) if name.casefold() == speaker.casefold()]
+            if not speaker_ids:
+                return
+            speaker_id = set(speaker_ids)
+        for episode_id in episode_ids:
+            start, end = self.episode_range(episode_id)
+            if speaker_id is None:
+                yield from range(start, end)
+            else:
+                column = self.speaker_ids
+                yield from (row for row in range(start, end) if column[row] in speaker_id)
+
+    def search(self, pattern: str, speaker: str = None, season: str = None, episode: str = None):
+        """
+        Yields (relative path, lineno, speaker, dialogue) for each filtered row whose dialogue matches 'pattern'.
+        """
+        regex = re.compile(pattern)
+        for row in self.select(speaker, season, episode):
+            dialogue = self.dialogue(row)
+            if regex.search(dialogue) is None:
+                continue
+            yield self.episodes[self.episode_ids[row]][3], self.linenos[row], self.speaker(row), dialogue
+
+def build_linestore(output_name: str = OUTPUT_NAME, store_name: str = LINESTORE_NAME):
+    """
+    Builds the line store from every transcript under 'output_name'.
+    """
+    builder = LineStoreBuilder(store_name, keep_existing=False)
+    for episode_file in corpus.episode_files(Path(output_name)):
+        builder.add_episode(episode_file, fts.read_linelist(episode_file))
+    builder.save()
+    return LineStore(store_name)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    store = build_linestore()
+    print("Stored %d lines of %d episodes in %r." % (len(store), len(store.episodes), LINESTORE_NAME))
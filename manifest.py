@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+"""
+Crawl manifest for incremental re-scrapes.
+Maps each transcript URL to:
+- hash: sha256 of the fetched page
+- path: the transcript file written from it
+- fetched: when the page was last fetched (UTC, ISO 8601)
+
+Every record is also appended to a journal (<manifest>.journal) as soon as it is made,
+so the progress of a crawl that is interrupted before save() is not lost.
+The next crawl replays the journal; with resume=True, it also skips the episodes recorded in it (see is_done).
+save() folds the journal into the manifest, and removes it once the crawl has finished.
+"""
+
+from datetime import datetime, timezone
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+import json
+import logging
+import os
+
+from constants import MANIFEST_NAME
+
+def content_hash(text: str):
+    """
+    Returns the hex sha256 digest of 'text'.
+    """
+    return sha256(text.encode("utf-8")).hexdigest()
+
+class CrawlManifest:
+    """
+    Thread-safe record of what each crawled URL looked like when it was last written.
+    """
+
+    def __init__(self, path=MANIFEST_NAME, resume: bool = False):
+        """
+        Loads the manifest at 'path', or starts an empty one if it does not exist yet,
+        then replays the journal of an interrupted crawl, if there is one.
+        If 'resume' is set, the URLs completed by that crawl are not crawled again.
+        """
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self._lock = Lock()
+        self._journal = None
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            self.entries = {}
+        journaled = self._replay_journal()
+        self.resumed = set(journaled) if resume else set()
+        logging.info("Loaded %d manifest entries from %r, %d of them from an interrupted crawl.",
+            len(self.entries), str(self.path), len(journaled))
+
+    def _replay_journal(self):
+        """
+        Applies the journal's records to the entries. Returns the URLs recorded in it.
+        A record cut short by the interruption is ignored.
+        """
+        journaled = []
+        try:
+            journal_lines = self.journal_path.read_text().splitlines()
+        except FileNotFoundError:
+            return journaled
+        for line in journal_lines:
+            try:
+                urlname, entry = json.loads(line)
+            except ValueError:
+                logging.warning("Ignoring incomplete journal record %r.", line)
+                continue
+            self.entries[urlname] = entry
+            journaled.append(urlname)
+        return journaled
+
+    def is_current(self, urlname: str, page_hash: str, output_file: Path):
+        """
+        Returns True if 'urlname' was last written to 'output_file' from a page hashing to 'page_hash',
+        and 'output_file' still exists.
+        """
+        with self._lock:
+            entry = self.entries.get(urlname)
+        if entry is None:
+            return False
+        return entry["hash"] == page_hash and entry["path"] == str(output_file) and output_file.exists()
+
+    def is_done(self, urlname: str, output_file: Path):
+        """
+        Returns True if the interrupted crawl being resumed already wrote 'urlname' to 'output_file',
+        and 'output_file' still exists. Such pages need not even be fetched.
+        """
+        with self._lock:
+            entry = self.entries.get(urlname) if urlname in self.resumed else None
+        return entry is not None and entry["path"] == str(output_file) and output_file.exists()
+
+    def record(self, urlname: str, page_hash: str, output_file: Path):
+        """
+        Records that 'urlname' was fetched just now, hashed to 'page_hash', and is stored at 'output_file'.
+        The record is journaled immediately.
+        """
+        entry = {
+            "hash": page_hash,
+            "path": str(output_file),
+            "fetched": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+        with self._lock:
+            self.entries[urlname] = entry
+            if self._journal is None:
+                self._journal = self.journal_path.open("a", encoding="utf-8")
+            self._journal.write(json.dumps([urlname, entry]) + "\n")
+            self._journal.flush()
+
+    def save(self, finished: bool = True):
+        """
+        Atomically writes the manifest back to disk.
+        The journal is removed if the crawl 'finished'; otherwise it is kept, so the crawl can still be resumed.
+        """
+        with self._lock:
+            contents = json.dumps(self.entries, indent=1, sort_keys=True)
+            temp_file = self.path.with_name(self.path.name + ".tmp")
+            temp_file.write_text(contents)
+            os.replace(temp_file, self.path)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if finished:
+                self.journal_path.unlink(missing_ok=True)
+                self.resumed.clear()
+        logging.info("Saved %d manifest entries to %r.", len(self.entries), str(self.path))
+
+
+if __name__ == '__main__':
+    pass
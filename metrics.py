@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+"""
+Lightweight per-stage timings and counters for the scrape and query pipelines.
+
+Off by default; timer() and count() then cost one global lookup and a function call.
+Turn on with environment variables, before running scraper.py or query.py:
+- SU_METRICS=<file.json>: dump a JSON summary of every stage and counter at exit
+- SU_PROFILE=<file.prof>: also dump cProfile stats at exit, covering the main thread and every crawl job
+or from code, with enable().
+
+Stages recorded: fetch, parse, format, write (scraper); scan (query, per file).
+Counters recorded: bytes_received, pages_fetched, pages_not_modified, retries, throttled, lines_scraped,
+files_scanned, lines_scanned, matches.
+"""
+
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+import atexit
+import cProfile
+import json
+import os
+import pstats
+import sys
+
+_enabled = False
+_lock = Lock()
+_stages = {}
+_counters = {}
+_json_path = None
+_profile_path = None
+_profiles = []
+# before 3.12, cProfile only sees the thread it was enabled in; from 3.12 on, it sees every thread,
+# and only one profiler may be active at a time
+_PROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+def enabled():
+    return _enabled
+
+def enable(json_path: str = None, profile_path: str = None):
+    """
+    Starts recording. At exit, writes a JSON summary to 'json_path' and cProfile stats to 'profile_path', if given.
+    """
+    global _enabled, _json_path, _profile_path
+    if _enabled:
+        return
+    _enabled = True
+    _json_path = json_path
+    _profile_path = profile_path
+    if profile_path is not None:
+        main_profile = cProfile.Profile()
+        main_profile.enable()
+        _profiles.append(main_profile)
+    atexit.register(dump)
+
+class _Timer:
+    """
+    Adds the time spent inside a 'with' block to a stage, less any time spent paused.
+    """
+    __slots__ = ("stage", "start", "elapsed")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.elapsed = 0.0
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.start is not None:
+            self.elapsed += perf_counter() - self.start
+        record(self.stage, self.elapsed)
+        return False
+
+    def pause(self):
+        """
+        Stops the clock, e.g. while a generator is suspended at a yield.
+        """
+        self.elapsed += perf_counter() - self.start
+        self.start = None
+
+    def resume(self):
+        self.start = perf_counter()
+
+class _NullTimer:
+    """
+    Stands in for _Timer while metrics are off.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def pause(self):
+        pass
+
+    def resume(self):
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+def timer(stage: str):
+    """
+    Returns a context manager timing its block as one call of 'stage'.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(stage)
+
+def record(stage: str, seconds: float):
+    """
+    Adds one call of 'seconds' to 'stage'.
+    """
+    with _lock:
+        totals = _stages.get(stage)
+        if totals is None:
+            _stages[stage] = [1, seconds, seconds]
+        else:
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+
+def count(counter: str, amount: int = 1):
+    """
+    Adds 'amount' to 'counter'.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + amount
+
+@contextmanager
+def profiled():
+    """
+    Profiles the current thread for the duration of the block, if profiling is on and needs a profiler per thread.
+    Worker threads wrap each job in this; from Python 3.12 on, the main profiler already sees them.
+    """
+    if _profile_path is None or not _PROFILE_PER_THREAD:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        with _lock:
+            _profiles.append(profile)
+
+def summary():
+    """
+    Returns the stages and counters recorded so far, as a JSON-ready dict.
+    """
+    with _lock:
+        stages = {stage: {"calls": calls, "total_seconds": total, "mean_seconds": total / calls, "max_seconds": longest}
+            for stage, (calls, total, longest) in _stages.items()}
+        return {"stages": stages, "counters": dict(_counters)}
+
+def drain():
+    """
+    Returns the stages and counters recorded so far, as they are kept, and clears them.
+    Worker processes hand these to the parent process, which adds them to its own with merge().
+    """
+    with _lock:
+        drained = {"stages": {stage: list(totals) for stage, totals in _stages.items()}, "counters": dict(_counters)}
+        _stages.clear()
+        _counters.clear()
+    return drained
+
+def merge(drained: dict):
+    """
+    Adds the stages and counters of drain(), e.g. from a worker process, to those recorded here.
+    """
+    with _lock:
+        for stage, (calls, total, longest) in drained["stages"].items():
+            totals = _stages.setdefault(stage, [0, 0.0, 0.0])
+            totals[0] += calls
+            totals[1] += total
+            totals[2] = max(totals[2], longest)
+        for counter, amount in drained["counters"].items():
+            _counters[counter] = _counters.get(counter, 0) + amount
+
+def enable_worker():
+    """
+    Starts recording in a worker process, which must not dump anything at exit, nor profile:
+    its records are drained and sent to the parent process instead.
+    """
+    global _enabled, _json_path, _profile_path
+    _enabled = True
+    _json_path = None
+    _profile_path = None
+    with _lock:
+        for profile in _profiles:
+            profile.disable()
+        _profiles.clear()
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+def dump():
+    """
+    Writes the JSON summary and the combined cProfile stats, where enabled.
+    """
+    if _json_path is not None:
+        with open(_json_path, "w") as json_file:
+            json.dump(summary(), json_file, indent=1, sort_keys=True)
+    if _profile_path is not None and _profiles:
+        _profiles[0].disable()
+        with _lock:
+            stats = pstats.Stats(_profiles[0])
+            for profile in _profiles[1:]:
+                stats.add(profile)
+        stats.dump_stats(_profile_path)
+
+if os.environ.get("SU_METRICS") or os.environ.get("SU_PROFILE"):
+    enable(os.environ.get("SU_METRICS") or None, os.environ.get("SU_PROFILE") or None)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+"""
+Fetches transcripts through the wiki's MediaWiki API (api.php) instead of one rendered HTML page each.
+- Up to API_BATCH_SIZE transcripts are requested in one action=query call, as wikitext with revision IDs.
+- The wikitext transcript table is parsed into the same (speaker, dialogue) list as scraper.parse_transcript.
+- With a manifest, revision IDs are checked first (a cheap ids-only query),
+  and only the content of changed pages is requested.
+
+ApiBatchScheduler is a drop-in CrawlScheduler: the scraper entry points take either.
+Season and category index pages are still scraped from HTML; there are only a handful of them.
+Run a full crawl through it with:
+    python3 mwapi.py [--workers N] [--per-host N] [--batch-size N] [--incremental | --resume] [--sqlite] [--linestore] ...
+"""
+
+from html import unescape
+from urllib.parse import unquote, urlencode, urlsplit
+import argparse
+import json
+import logging
+import re
+
+from constants import MAX_WORKERS, MAX_PER_HOST, API_BATCH_SIZE, LOGGING_FILE
+from scheduler import CrawlScheduler
+import http_client
+import metrics
+import scraper
+
+API_PATH = "/api.php"
+# wikitext markup with no counterpart in the rendered text of a cell
+TEMPLATE = re.compile(r"\{\{[^{}]*\}\}")
+WIKILINK = re.compile(r"\[\[(?:[^\[\]|]*\|)?([^\[\]]*)\]\]")
+EXTERNAL_LINK = re.compile(r"\[(?:https?:)?//[^\s\]]+ ?([^\]]*)\]")
+HTML_TAG = re.compile(r"<[^>]*>")
+EMPHASIS = re.compile(r"'{2,}")
+
+def api_url(urlname: str):
+    """
+    Returns the api.php URL of the wiki serving 'urlname'.
+    """
+    parts = urlsplit(urlname)
+    return "%s://%s%s" % (parts.scheme, parts.netloc, API_PATH)
+
+def page_title(urlname: str):
+    """
+    Returns the title of the page at 'urlname', of the form https://<wiki>/wiki/<title>.
+    """
+    path = urlsplit(urlname).path
+    assert path.startswith("/wiki/"), urlname
+    return unquote(path[len("/wiki/"):]).replace("_", " ")
+
+def query_revisions(endpoint: str, titles: list, content: bool = True):
+    """
+    Queries the api.php at 'endpoint' for the latest revision of each of 'titles' (at most API_BATCH_SIZE).
+    Returns a dict of each title, as given, to (revid, wikitext); wikitext is None unless 'content' is set.
+    Titles of missing pages are left out.
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "formatversion": "2",
+        "prop": "revisions",
+        "rvprop": "ids|content" if content else "ids",
+        "rvslots": "main",
+        "redirects": "1",
+        "titles": "|".join(titles),
+        }
+    # the api names each page by its normalized (and redirect-resolved) title
+    requested = {title: title for title in titles}
+    revisions = {}
+    while True:
+        response = json.loads(http_client.get_text(endpoint + "?" + urlencode(params)))
+        if "error" in response:
+            raise RuntimeError("%s: %s" % (response["error"].get("code"), response["error"].get("info")))
+        query = response.get("query", {})
+        for key in ("normalized", "redirects"):
+            for rename in query.get(key, ()):
+                for title, resolved in requested.items():
+                    if resolved == rename["from"]:
+                        requested[title] = rename["to"]
+        for page in query.get("pages", ()):
+            if page.get("revisions"):
+                revision = page["revisions"][0]
+                wikitext = revision["slots"]["main"]["content"] if content else None
+                revisions[page["title"]] = (revision["revid"], wikitext)
+        # very large batches are split by the api: fetch the rest of their content
+        if "continue" not in response:
+            break
+        params.update(response["continue"])
+    return {title: revisions[resolved] for title, resolved in requested.items() if resolved in revisions}
+
+def wikitext_to_text(markup: str):
+    """
+    Returns the text that 'markup' renders to, as far as transcript cells go:
+    links become their labels, and templates, HTML tags and bold/italic quotes are dropped.
+    """
+    while True:
+        stripped = TEMPLATE.sub("", markup)
+        if stripped == markup:
+            break
+        markup = stripped
+    markup = WIKILINK.sub(r"\1", markup)
+    markup = EXTERNAL_LINK.sub(r"\1", markup)
+    markup = HTML_TAG.sub("", markup)
+    markup = EMPHASIS.sub("", markup)
+    return unescape(markup).strip()
+
+def cell_content(cell: str):
+    """
+    Returns the content of a table cell, without its attributes: 'colspan="2" | text' -> 'text'.
+    Pipes inside links and templates are not attribute separators.
+    """
+    depth = 0
+    for index, char in enumerate(cell):
+        if char in "[{":
+            depth += 1
+        elif char in "]}":
+            depth -= 1
+        elif char == "|" and depth <= 0:
+            return cell[index + 1:]
+    return cell
+
+def table_rows(wikitext: str, table_class: str = scraper.TRANSCRIPT_TABLE_CLASS):
+    """
+    Yields the rows of the first table of class 'table_class' in 'wikitext', header row included,
+    each as a list of (is_header, markup) cells.
+    """
+    lines = iter(wikitext.splitlines())
+    for line in lines:
+        if line.lstrip().startswith("{|") and table_class in line:
+            break
+    else:
+        return
+    row = []
+    depth = 0
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("{|"):
+            depth += 1
+        elif stripped.startswith("|}"):
+            if depth == 0:
+                break
+            depth -= 1
+        if depth:
+            # a nested table belongs to the cell it is in
+            if row:
+                row[-1] = (row[-1][0], row[-1][1] + "\n" + line)
+            continue
+        if stripped.startswith("|-"):
+            if row:
+                yield row
+            row = []
+        elif stripped.startswith("|+"):
+            continue
+        elif stripped.startswith("!"):
+            row.extend((True, cell_content(cell)) for cell in re.split(r"!!|\|\|", stripped[1:]))
+        elif stripped.startswith("|"):
+            row.extend((False, cell_content(cell)) for cell in stripped[1:].split("||"))
+        elif row:
+            # continuation of the last cell
+            row[-1] = (row[-1][0], row[-1][1] + "\n" + line)
+    if row:
+        yield row
+
+def parse_wikitext_transcript(wikitext: str, table_class: str = scraper.TRANSCRIPT_TABLE_CLASS):
+    """
+    Parses the wikitext of a transcript page into list of 2-tuples, each of the form (speaker, dialogue),
+    as scraper.parse_transcript does for its HTML.
+    """
+    with metrics.timer("parse"):
+        rows = list(table_rows(wikitext, table_class))
+        assert rows, "no transcript table in wikitext"
+        line_list = []
+        # skip header row of table
+        for row in rows[1:]:
+            speaker = next((wikitext_to_text(markup) for is_header, markup in row if is_header), None)
+            dialogue = next((wikitext_to_text(markup) for is_header, markup in row if not is_header), "")
+            line_list.append((speaker, dialogue))
+    metrics.count("lines_scraped", len(line_list))
+    return line_list
+
+def write_episodes(endpoint: str, episodes: list):
+    """
+    Fetches the transcripts of 'episodes' through the api.php at 'endpoint' in one query, and writes them.
+    'episodes' holds the arguments of scraper.write_episode: (urlname, episode_file, manifest, stores, table_class) 5-tuples.
+    Pages whose manifest entry matches their revision ID are skipped without fetching their content,
+    and pages already written by the crawl the manifest resumes are not queried at all;
+    their stores are given the lines already written instead (see scraper.restore_episode).
+    Raises LookupError for missing pages, once every other page is written.
+    """
+    by_title = {}
+    for urlname, episode_file, manifest, stores, table_class in episodes:
+        if manifest is not None and manifest.is_done(urlname, episode_file):
+            logging.info("%r already written by the crawl being resumed. Skipping.", urlname)
+            scraper.restore_episode(episode_file, stores)
+            continue
+        by_title[page_title(urlname)] = (urlname, episode_file, manifest, stores, table_class)
+    titles = list(by_title)
+    if not titles:
+        return
+    if any(manifest is not None for _, _, manifest, _, _ in by_title.values()):
+        current = query_revisions(endpoint, titles, content=False)
+        changed = []
+        for title in titles:
+            urlname, episode_file, manifest, stores, _ = by_title[title]
+            page_hash = "rev:%d" % current[title][0] if title in current else None
+            if manifest is not None and page_hash is not None and manifest.is_current(urlname, page_hash, episode_file):
+                logging.info("%r unchanged since last crawl (%s). Skipping.", urlname, page_hash)
+                scraper.restore_episode(episode_file, stores)
+                manifest.record(urlname, page_hash, episode_file)
+            else:
+                changed.append(title)
+        titles = changed
+    revisions = query_revisions(endpoint, titles) if titles else {}
+    missing = [title for title in titles if title not in revisions]
+    for title, (revid, wikitext) in revisions.items():
+        urlname, episode_file, manifest, stores, table_class = by_title[title]
+        line_list = parse_wikitext_transcript(wikitext, table_class)
+        scraper.save_episode(urlname, episode_file, "rev:%d" % revid, line_list, scraper.format_linelist(line_list), manifest, stores)
+    if missing:
+        raise LookupError("No such pages at %r: %s" % (endpoint, ", ".join(missing)))
+
+class ApiBatchScheduler(CrawlScheduler):
+    """
+    A CrawlScheduler that gathers episode jobs (see submit_episode) into batches of 'batch_size' pages per wiki,
+    each fetched with a single api.php query (see write_episodes).
+    Every other job (e.g. fetching a season index) runs as usual.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, max_per_host: int = MAX_PER_HOST, batch_size: int = API_BATCH_SIZE):
+        super().__init__(max_workers, max_per_host)
+        if batch_size < 1:
+            raise ValueError(f"batch_size := {batch_size} must be positive.")
+        self.batch_size = batch_size
+        self._batches = {}
+
+    def submit_episode(self, urlname: str, job, *args):
+        """
+        Adds the episode written by 'job(*args)' to the batch for its wiki instead,
+        which is submitted once full (returning its Future), or on join (returning None until then).
+        """
+        endpoint = api_url(urlname)
+        defaults = (None, (), scraper.TRANSCRIPT_TABLE_CLASS)
+        urlname, episode_file, manifest, stores, table_class = args + defaults[len(args) - 2:]
+        with self._lock:
+            batch = self._batches.setdefault(endpoint, [])
+            batch.append((urlname, episode_file, manifest, stores, table_class))
+            if len(batch) < self.batch_size:
+                return None
+            del self._batches[endpoint]
+        return self.submit(endpoint, write_episodes, endpoint, batch)
+
+    def flush(self):
+        """
+        Submits every partly filled batch.
+        """
+        with self._lock:
+            batches = list(self._batches.items())
+            self._batches.clear()
+        for endpoint, batch in batches:
+            self.submit(endpoint, write_episodes, endpoint, batch)
+
+    def join(self):
+        """
+        Waits for every job and batch, including those queued while waiting.
+        Raises the first exception raised by any of them once all have finished.
+        """
+        first_error = None
+        while True:
+            self.flush()
+            try:
+                super().join()
+            except Exception as error:
+                if first_error is None:
+                    first_error = error
+            with self._lock:
+                if not self._batches:
+                    break
+        if first_error is not None:
+            raise first_error
+
+def main():
+    """
+    Crawls every season through an ApiBatchScheduler, with the manifest, stores and catalog of scraper.main (see scraper.run_crawl).
+    """
+    parser = argparse.ArgumentParser(description="scrape SU Wikia transcripts through the MediaWiki API")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='crawl threads (default: %(default)s)')
+    parser.add_argument('--per-host', type=int, default=MAX_PER_HOST, help='jobs per host (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=API_BATCH_SIZE, help='transcripts per api.php query (default: %(default)s)')
+    scraper.add_crawl_arguments(parser)
+    args = parser.parse_args()
+    scraper.run_crawl(ApiBatchScheduler(args.workers, args.per_host, args.batch_size), args)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/python3
+"""
+Packed corpus: every transcript in one file, memory-mapped by query.iter_matches instead of opening each file.
+
+File layout:
+- 8-byte little-endian header length, then a JSON header: seasons, interned speakers, and for each episode
+  its season, ordinal, title, relative path and first line, plus a snapshot of the files it was packed from
+- padding to a multiple of 8 bytes
+- line_offsets: 'Q' column, the byte offset of every line in the text, and of the end of the text
+- line_speakers: 'i' column, index into the speaker table (-1 for rows with no speaker)
+- the text: every line of every episode, utf-8, each ending in a newline, in canonical order
+
+A search finds the longest literal the pattern requires with one bytes find over an episode's text,
+and decodes (and runs the regex on) only the lines holding every such literal.
+Episodes where most lines are candidates anyway, or patterns without case-sensitive literals,
+are decoded an episode at a time, which is cheaper than line by line; either way, all reads are from the one mapped file.
+
+Build at scrape time with 'scraper.py --packed', or from an already-scraped output directory with:
+    python3 packed.py
+"""
+
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from threading import Lock
+import json
+import logging
+import mmap
+import os
+import re
+import sys
+
+from constants import OUTPUT_NAME, PACKED_NAME, LOGGING_FILE
+import corpus
+import fts
+import metrics
+import trigram
+
+PACK_VERSION = 1
+COLUMNS = (("line_offsets", "Q"), ("line_speakers", "i"))
+
+def episode_key(relative_path: str):
+    """
+    Returns the canonical sort key of an episode path relative to the output directory.
+    """
+    path = Path(relative_path)
+    return corpus.order_seasons(path.parent), corpus.order_episodes(path)
+
+class PackedCorpusBuilder:
+    """
+    Collects episodes (in any order, from any thread) and writes them out as a packed corpus.
+    """
+
+    def __init__(self, path=PACKED_NAME, keep_existing: bool = True):
+        """
+        If 'keep_existing', starts from the episodes already in the packed corpus at 'path', if there is one,
+        so episodes that are not re-added (e.g. unchanged in an incremental crawl) are kept.
+        """
+        self.path = Path(path)
+        self._lock = Lock()
+        # relative path -> (lines, [relative path, mtime_ns, size] of the file they were read from)
+        self.episodes = {}
+        if keep_existing and self.path.exists():
+            with PackedCorpus(self.path) as packed:
+                for episode_id, (_, _, _, relative_path) in enumerate(packed.episodes):
+                    first, last = packed.episode_lines(episode_id)
+                    self.episodes[relative_path] = ([packed.line(line_id) for line_id in range(first, last)], packed.files[episode_id])
+
+    def add_file(self, episode_file: Path, lines: list):
+        """
+        Adds (or replaces) the episode whose file 'episode_file' holds 'lines'.
+        """
+        relative_path = str(Path(episode_file.parent.name, episode_file.name))
+        stat = episode_file.stat()
+        with self._lock:
+            self.episodes[relative_path] = (lines, [relative_path, stat.st_mtime_ns, stat.st_size])
+
+    def add_episode(self, episode_file: Path, line_list: list):
+        """
+        Adds (or replaces) the (speaker, dialogue) 2-tuples of the episode written to 'episode_file'.
+        """
+        text = "\n".join(("|" if speaker is None else speaker) + ": " + dialogue for speaker, dialogue in line_list)
+        self.add_file(episode_file, text.splitlines())
+
+    def save(self):
+        """
+        Writes the collected episodes to the packed corpus file, atomically.
+        """
+        with self._lock:
+            episodes = sorted(self.episodes.items(), key=lambda item: episode_key(item[0]))
+        seasons = []
+        speakers = {}
+        episode_table = []
+        columns = {name: array(typecode) for name, typecode in COLUMNS}
+        text = bytearray()
+        for relative_path, (lines, _) in episodes:
+            season_name = str(Path(relative_path).parent)
+            if season_name not in seasons:
+                seasons.append(season_name)
+            ordinal, title = corpus.episode_title(Path(relative_path))
+            episode_table.append([seasons.index(season_name), ordinal, title, relative_path, len(columns["line_offsets"])])
+            for line in lines:
+                speaker, _ = fts.split_line(line)
+                columns["line_offsets"].append(len(text))
+                columns["line_speakers"].append(-1 if speaker is None else speakers.setdefault(speaker, len(speakers)))
+                text += line.encode("utf-8") + b"\n"
+        num_lines = len(columns["line_offsets"])
+        columns["line_offsets"].append(len(text))
+        header = {
+            "version": PACK_VERSION,
+            "byteorder": sys.byteorder,
+            "seasons": seasons,
+            "speakers": list(speakers),
+            "episodes": episode_table,
+            "files": [snapshot for _, (_, snapshot) in episodes],
+            "lines": num_lines,
+            }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        padding = -(8 + len(header_bytes)) % 8
+        temp_file = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_file, "wb") as pack_file:
+            pack_file.write(len(header_bytes).to_bytes(8, "little"))
+            pack_file.write(header_bytes + b" " * padding)
+            for name, _ in COLUMNS:
+                columns[name].tofile(pack_file)
+            pack_file.write(text)
+        os.replace(temp_file, self.path)
+        logging.info("Packed %d lines of %d episodes into %r.", num_lines, len(episodes), str(self.path))
+
+    def close(self):
+        """
+        Saves the packed corpus; lets a builder be used as one of scraper.write_episode's 'stores'.
+        """
+        self.save()
+
+class PackedCorpus:
+    """
+    A memory-mapped packed corpus. Close it (or use it as a context manager) to unmap the file.
+    """
+
+    def __init__(self, path=PACKED_NAME):
+        """
+        Maps the packed corpus at 'path'.
+        """
+        with open(path, "rb") as pack_file:
+            self._mmap = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_length = int.from_bytes(self._mmap[:8], "little")
+        header = json.loads(self._mmap[8:8 + header_length].decode("utf-8"))
+        if header["version"] != PACK_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is a version {header['version']} packed corpus; expected {PACK_VERSION}.")
+        self.seasons = header["seasons"]
+        self.speakers = header["speakers"]
+        self.files = header["files"]
+        self.episodes = [(self.seasons[season_id], ordinal, title, relative_path)
+            for season_id, ordinal, title, relative_path, _ in header["episodes"]]
+        self.episode_starts = [first_line for *_, first_line in header["episodes"]] + [header["lines"]]
+        position = 8 + header_length
+        position += -position % 8
+        self._view = memoryview(self._mmap)
+        self._columns = []
+        for name, typecode in COLUMNS:
+            count = header["lines"] + (name == "line_offsets")
+            size = count * array(typecode).itemsize
+            if header["byteorder"] == sys.byteorder:
+                column = self._view[position:position + size].cast(typecode)
+                self._columns.append(column)
+            else:
+                column = array(typecode, self._view[position:position + size].tobytes())
+                column.byteswap()
+            setattr(self, name, column)
+            position += size
+        self.text_start = position
+
+    def __len__(self):
+        return len(self.line_speakers)
+
+    def is_current(self, output_dir: Path):
+        """
+        Returns True if the episode files under 'output_dir' are exactly those packed, unmodified.
+        If the catalog of 'output_dir' is current and matches the files on disk (see corpus.read_catalog),
+        its sizes and mtimes are compared, so the tree is not walked again; otherwise the files are snapshotted.
+        """
+        entries = corpus.read_catalog(Path(output_dir), verify_files=True)
+        if entries is None:
+            return trigram.snapshot(Path(output_dir)) == self.files
+        return [[entry["path"], entry["mtime_ns"], entry["bytes"]] for entry in entries] == self.files
+
+    def episode_lines(self, episode_id: int):
+        """
+        Returns the (first, last) line range of an episode.
+        """
+        return self.episode_starts[episode_id], self.episode_starts[episode_id + 1]
+
+    def line(self, line_id: int):
+        """
+        Decodes one line, without its newline.
+        """
+        start = self.text_start + self.line_offsets[line_id]
+        end = self.text_start + self.line_offsets[line_id + 1] - 1
+        return self._mmap[start:end].decode("utf-8")
+
+    def lines(self, first: int, last: int):
+        """
+        Decodes the lines in range(first, last) at once, without their newlines.
+        """
+        start = self.text_start + self.line_offsets[first]
+        end = self.text_start + self.line_offsets[last]
+        return self._mmap[start:end].decode("utf-8").split("\n")[:-1]
+
+    def speaker(self, line_id: int):
+        speaker_id = self.line_speakers[line_id]
+        return None if speaker_id < 0 else self.speakers[speaker_id]
+
+    def candidate_lines(self, first: int, last: int, literals: list):
+        """
+        Returns the ids of the lines in range(first, last) whose utf-8 text contains every one of the bytes 'literals',
+        searching for the longest one in the mapped text directly.
+        """
+        if not literals:
+            return range(first, last)
+        key = max(literals, key=len)
+        offsets = self.line_offsets
+        base = self.text_start
+        end = base + offsets[last]
+        found = []
+        position = self._mmap.find(key, base + offsets[first], end)
+        while position != -1:
+            line_id = bisect_right(offsets, position - base, first, last) - 1
+            line_start, line_end = base + offsets[line_id], base + offsets[line_id + 1] - 1
+            if all(self._mmap.find(literal, line_start, line_end) != -1 for literal in literals):
+                found.append(line_id)
+            position = self._mmap.find(key, line_end + 1, end)
+        return found
+
+    def iter_matches(self, pattern: str, max_matches: int = None, max_per_file: int = None, candidates: set = None):
+        """
+        Yields (relative path, lineno, line, span) for every line matching 'pattern', as query.iter_matches does
+        for the files packed, with the same limits. If 'candidates' is given, only those relative paths are searched.
+        """
+        regex = re.compile(pattern)
+        literals = [literal.encode("utf-8", "surrogatepass") for literal in trigram.required_literals(pattern, casefold=False)]
+        # case-insensitive literals can still narrow down the lines of a decoded episode
+        folded_literals = [] if literals else trigram.required_literals(pattern)
+        num_matches = 0
+        for episode_id, (_, _, _, relative_path) in enumerate(self.episodes):
+            if max_matches is not None and num_matches >= max_matches:
+                return
+            if candidates is not None and relative_path not in candidates:
+                continue
+            first, last = self.episode_lines(episode_id)
+            num_file_matches = 0
+            with metrics.timer("scan") as scan:
+                line_ids = self.candidate_lines(first, last, literals)
+                # few candidates are decoded one by one, many with the rest of their episode
+                episode_lines = self.lines(first, last) if len(line_ids) * 8 > last - first else None
+                if folded_literals and episode_lines is not None:
+                    line_ids = [first + index for index in trigram.candidate_lines(episode_lines, folded_literals)]
+                for line_id in line_ids:
+                    line = self.line(line_id) if episode_lines is None else episode_lines[line_id - first]
+                    match = regex.search(line)
+                    if match is None:
+                        continue
+                    scan.pause()
+                    yield relative_path, line_id - first + 1, line, match.span()
+                    scan.resume()
+                    num_matches += 1
+                    num_file_matches += 1
+                    if max_matches is not None and num_matches >= max_matches:
+                        break
+                    if max_per_file is not None and num_file_matches >= max_per_file:
+                        break
+            metrics.count("files_scanned")
+            metrics.count("lines_scanned", len(line_ids))
+            metrics.count("matches", num_file_matches)
+
+    def close(self):
+        """
+        Unmaps the file.
+        """
+        for column in self._columns:
+            column.release()
+        self._columns.clear()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def load_packed(packed_name: str = PACKED_NAME):
+    """
+    Returns the PackedCorpus at 'packed_name', or None if there is none (or it is unreadable).
+    """
+    try:
+        return PackedCorpus(packed_name)
+    except (OSError, ValueError) as error:
+        if Path(packed_name).exists():
+            logging.info("Could not load packed corpus %r: %r", packed_name, error)
+        return None
+
+def build_packed(output_name: str = OUTPUT_NAME, packed_name: str = PACKED_NAME):
+    """
+    Packs every transcript under 'output_name' into 'packed_name'.
+    """
+    builder = PackedCorpusBuilder(packed_name, keep_existing=False)
+    for episode_file in corpus.episode_files(Path(output_name)):
+        builder.add_file(episode_file, episode_file.read_text().splitlines())
+    builder.save()
+    return PackedCorpus(packed_name)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    with build_packed() as packed:
+        print("Packed %d lines of %d episodes into %r." % (len(packed), len(packed.episodes), PACKED_NAME))
@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+"""
+Staged crawl pipeline: fetch -> parse -> write.
+- fetch: I/O worker threads (per-host limited), as in scheduler.CrawlScheduler
+- parse: parsing and formatting in a pool of worker processes, so it is not bound to one core by the GIL.
+  The workers are started by forkserver (or spawn), never forked from the crawl threads that feed them,
+  and send back the metrics they record with each page.
+- write: a single writer thread, which also feeds stores and the manifest
+At most 'queue_size' fetched pages wait between the fetch and write stages;
+fetch workers block until there is room, so memory stays bounded.
+
+CrawlPipeline is a drop-in CrawlScheduler: the scraper entry points take either.
+Run a full crawl through it with:
+    python3 pipeline.py [--fetchers N] [--per-host N] [--parsers N] [--queue-size N] [--incremental | --resume] [--sqlite] ...
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+from queue import Queue
+from threading import BoundedSemaphore, Lock, Thread
+import argparse
+import logging
+import os
+
+from constants import MAX_WORKERS, MAX_PER_HOST, PIPELINE_QUEUE_SIZE, LOGGING_FILE
+from scheduler import CrawlScheduler
+import metrics
+import scraper
+
+# forking a process whose other threads may hold locks (the crawl threads, the writer) can deadlock the child
+START_METHOD = "forkserver" if "forkserver" in get_all_start_methods() else "spawn"
+
+def start_parser(record_metrics: bool):
+    """
+    Initializes a parse worker process.
+    """
+    if record_metrics:
+        metrics.enable_worker()
+
+def parse_stage(page_text: str, table_class: str = scraper.TRANSCRIPT_TABLE_CLASS):
+    """
+    Parse stage, in a worker process. Returns (line_list, formatted_lines, recorded), 'recorded' being
+    the metrics recorded while parsing (see metrics.drain), or None if metrics are off.
+    """
+    line_list, formatted_lines = scraper.parse_and_format(page_text, table_class)
+    return line_list, formatted_lines, metrics.drain() if metrics.enabled() else None
+
+class CrawlPipeline(CrawlScheduler):
+    """
+    A CrawlScheduler that splits each episode job (see submit_episode) into fetch, parse and write stages.
+    Every other job (e.g. fetching a season index) runs whole on the fetch workers.
+    """
+
+    def __init__(self, max_fetchers: int = MAX_WORKERS, max_per_host: int = MAX_PER_HOST,
+            max_parsers: int = None, queue_size: int = PIPELINE_QUEUE_SIZE):
+        """
+        Starts the stages. 'max_parsers' defaults to the number of CPUs.
+        """
+        super().__init__(max_fetchers, max_per_host)
+        if queue_size < 1:
+            raise ValueError(f"queue_size := {queue_size} must be positive.")
+        self.max_parsers = max_parsers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self._parsers = ProcessPoolExecutor(max_workers=self.max_parsers, mp_context=get_context(START_METHOD),
+            initializer=start_parser, initargs=(metrics.enabled(),))
+        self._in_flight = BoundedSemaphore(queue_size)
+        self._write_queue = Queue()
+        self._write_errors = []
+        self._errors_lock = Lock()
+        self._writer = Thread(target=self._write_loop, name="crawl-writer", daemon=True)
+        self._writer.start()
+
+    def submit_episode(self, urlname: str, job, *args):
+        """
+        Queues the episode written by 'job(*args)' to go through the stages instead.
+        """
+        return self.submit(urlname, self._fetch_stage, *args)
+
+    def _fetch_stage(self, urlname: str, episode_file, manifest=None, stores=(), table_class=scraper.TRANSCRIPT_TABLE_CLASS):
+        """
+        Fetches the page, then hands it to the parse stage, waiting for room if the pipeline is full,
+        and queues its write before returning, so that every episode fetched is queued once the fetch jobs are done.
+        """
+        fetched = scraper.fetch_episode(urlname, episode_file, manifest)
+        if fetched is None:
+            scraper.restore_episode(episode_file, stores)
+            return
+        page_text, page_hash = fetched
+        self._in_flight.acquire()
+        try:
+            future = self._parsers.submit(parse_stage, page_text, table_class)
+        except BaseException:
+            self._in_flight.release()
+            raise
+        self._write_queue.put((future, urlname, episode_file, page_hash, manifest, stores))
+
+    def _write_loop(self):
+        """
+        Writes each episode, one at a time and in the order fetched, once it is parsed, until shutdown.
+        """
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                self._write_queue.task_done()
+                return
+            future, urlname, episode_file, page_hash, manifest, stores = item
+            try:
+                line_list, formatted_lines, recorded = future.result()
+                if recorded is not None:
+                    metrics.merge(recorded)
+                scraper.save_episode(urlname, episode_file, page_hash, line_list, formatted_lines, manifest, stores)
+            except Exception as error:
+                logging.error("Writing %r from %r failed: %r", str(episode_file), urlname, error)
+                with self._errors_lock:
+                    self._write_errors.append(error)
+            finally:
+                self._in_flight.release()
+                self._write_queue.task_done()
+
+    def join(self):
+        """
+        Waits for every job to be fetched, parsed and written.
+        Raises the first exception raised in any stage once all have finished.
+        """
+        first_error = None
+        try:
+            super().join()
+        except Exception as error:
+            first_error = error
+        # every episode fetched has been queued by its fetch job, and is parsed before it is written
+        self._write_queue.join()
+        with self._errors_lock:
+            if first_error is None and self._write_errors:
+                first_error = self._write_errors[0]
+            self._write_errors.clear()
+        if first_error is not None:
+            raise first_error
+
+    def shutdown(self):
+        """
+        Stops every stage. Jobs already submitted still run to completion.
+        """
+        super().shutdown()
+        self._parsers.shutdown(wait=True)
+        self._write_queue.put(None)
+        self._writer.join()
+
+def main():
+    """
+    Crawls every season through a CrawlPipeline, with the stage sizes given on the command line,
+    and the manifest, stores and catalog of scraper.main (see scraper.run_crawl).
+    """
+    parser = argparse.ArgumentParser(description="scrape SU Wikia transcripts through a staged pipeline")
+    parser.add_argument('--fetchers', type=int, default=MAX_WORKERS, help='fetch threads (default: %(default)s)')
+    parser.add_argument('--per-host', type=int, default=MAX_PER_HOST, help='fetches per host (default: %(default)s)')
+    parser.add_argument('--parsers', type=int, default=None, help='parse processes (default: CPU count)')
+    parser.add_argument('--queue-size', type=int, default=PIPELINE_QUEUE_SIZE, help='pages between fetch and write (default: %(default)s)')
+    scraper.add_crawl_arguments(parser)
+    args = parser.parse_args()
+    scraper.run_crawl(CrawlPipeline(args.fetchers, args.per_host, args.parsers, args.queue_size), args)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    main()
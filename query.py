@@ -8,109 +8,314 @@ Provides option to navigate to matching file via menu interface.
 """
 
 import argparse             # for processing cmdline args
-import os                   # for chdir to OUTPUT_NAME
+import logging              # for reporting a stale index
 import re                   # because this is essentially grep
+import sqlite3              # for full-text query errors
+import sys                  # for the serve subcommand
 import webbrowser           # to open matching file
+from itertools import chain # to page through matches lazily
 from pathlib import Path    # to iterate over files.
 from textwrap import indent  # to display text more cleanly
 
-from constants import OUTPUT_NAME, SEASON_ORDER
+from constants import OUTPUT_NAME, TRIGRAM_INDEX_NAME, SQLITE_NAME, LINESTORE_NAME, PACKED_NAME, SHARDS_NAME, QUERY_CACHE_NAME, \
+    QUERY_SERVER_URL
+# the search backends are imported where they are used, so that e.g. '--server' loads none of them
 
-def compile_matches(pattern: str):
+PAGE_SIZE = 20
+
+def iter_matches(pattern: str, max_matches: int = None, max_per_file: int = None, use_index: bool = True,
+        output_dir=OUTPUT_NAME, index_name: str = TRIGRAM_INDEX_NAME, packed_name: str = PACKED_NAME,
+        shards_name: str = SHARDS_NAME):
+    """
+    Yields (episode_file, lineno, line, span) for every line under 'output_dir' matching the 'pattern' str parameter,
+    as it is found, in canonical episode order. 'span' is the (start, end) of the first match in the line.
+
+    Stops after 'max_matches' matches in all, and moves on to the next file after 'max_per_file' matches in one file.
+    If a current trigram index exists at 'index_name' (see trigram.py), only the episodes and lines that contain
+    every literal the pattern requires are searched.
+    If a current packed corpus exists at 'packed_name' (see packed.py), it is searched instead of the files.
+    If there is no 'output_dir', but there are shards at 'shards_name' (see shards.py), they are scanned instead,
+    with each match's episode_file being the path it would have under 'output_dir'.
+    Results are identical to a full scan.
+    """
+    import corpus
+    import metrics
+    import packed
+    import shards
+    import trigram
+    regex = re.compile(pattern)
+    output_dir = Path(output_dir)
+    if not output_dir.is_dir() and Path(shards_name).is_dir():
+        yield from shards.iter_matches(pattern, max_matches, max_per_file, shards_name, output_dir)
+        return
+    index = trigram.load_index(index_name) if use_index else None
+    literals = []
+    candidates = None
+    if index is not None and index.is_current(output_dir):
+        literals = trigram.required_literals(pattern)
+        candidates = index.candidates(literals)
+    elif index is not None:
+        logging.info("Trigram index is out of date. Scanning all files; rebuild it with trigram.py.")
+
+    packed_corpus = packed.load_packed(packed_name) if use_index else None
+    if packed_corpus is not None:
+        with packed_corpus:
+            if packed_corpus.is_current(output_dir):
+                episode_path, episode_file = None, None
+                for relative_path, lineno, line, span in packed_corpus.iter_matches(pattern, max_matches, max_per_file, candidates):
+                    # matches come grouped by episode
+                    if relative_path != episode_path:
+                        episode_path, episode_file = relative_path, output_dir.joinpath(relative_path)
+                    yield episode_file, lineno, line, span
+                return
+        logging.info("Packed corpus is out of date. Scanning all files; rebuild it with packed.py.")
+
+    num_matches = 0
+    for episode_file in corpus.episode_files(output_dir):
+        if max_matches is not None and num_matches >= max_matches:
+            return
+        if candidates is not None and str(episode_file.relative_to(output_dir)) not in candidates:
+            continue
+        num_file_matches = 0
+        with metrics.timer("scan") as scan:
+            lines = episode_file.read_text().splitlines()
+            line_indices = trigram.candidate_lines(lines, literals) if literals else range(len(lines))
+            for line_index in line_indices:
+                line = lines[line_index]
+                match = regex.search(line)
+                if match is None:
+                    continue
+                # the time spent by the caller between matches is not scan time
+                scan.pause()
+                yield episode_file, line_index + 1, line, match.span()
+                scan.resume()
+                num_matches += 1
+                num_file_matches += 1
+                if max_matches is not None and num_matches >= max_matches:
+                    break
+                if max_per_file is not None and num_file_matches >= max_per_file:
+                    break
+        metrics.count("files_scanned")
+        metrics.count("lines_scanned", len(line_indices))
+        metrics.count("matches", num_file_matches)
+
+def cached_matches(pattern: str, max_matches: int = None, max_per_file: int = None, use_index: bool = True):
+    """
+    Yields the iter_matches results, from the result cache while the corpus is unchanged (see result_cache.py),
+    or as they are found if they are not cached yet. Raises re.error at once if 'pattern' is invalid.
+    """
+    import result_cache
+    return result_cache.cached_search(result_cache.regex_key(pattern, max_matches, max_per_file),
+        lambda: iter_matches(pattern, max_matches, max_per_file, use_index))
+
+def compile_matches(pattern: str, use_index: bool = True, use_cache: bool = False):
     """
-    Compiles a table of files, lines, and line numbers matching the 'pattern' str parameter.
+    Compiles a table of files, lines, and line numbers matching the 'pattern' str parameter:
+    the first matching line of each file. Calls: iter_matches, through the result cache if 'use_cache'
     """
     # compile list of matching files.
     matching_files = []
     matching_lines = []
     matching_linenos = []
-    os.chdir(OUTPUT_NAME)
-
-    # to get matches in order
-    def order_seasons(spath):
-        """
-        Returns index of the season as defined by SEASON_ORDER.
-        spath: pathlib.Path
-        """
-        sstr = str(spath)
-        return SEASON_ORDER.index(sstr)
-
-    # to get matches in order
-    def order_episodes(efile):
-        """
-        Returns ordering of episode in the season.
-
-        efile: pathlib.Path
-        """
-        episode_filename = efile.name
-        if episode_filename == "Movie.txt":
-            return 0
-        episode_num = re.search(r"(\d+).+", episode_filename).group(1)
-        return int(episode_num)
-
-    for season_path in sorted(Path(".").iterdir(), key=order_seasons):
-        for episode_file in sorted(season_path.iterdir(), key=order_episodes):
-            # get text
-            # check if match is found
-            for lineno, line in enumerate(episode_file.read_text().splitlines(), start=1):
-                if re.search(pattern, line) is None:
-                    continue
-                matching_files.append(episode_file)
-                matching_lines.append(line)
-                matching_linenos.append(lineno)
-                break
+    if use_cache:
+        matches = cached_matches(pattern, max_per_file=1, use_index=use_index)
+    else:
+        matches = iter_matches(pattern, max_per_file=1, use_index=use_index)
+    for episode_file, lineno, line, _ in matches:
+        matching_files.append(episode_file)
+        matching_lines.append(line)
+        matching_linenos.append(lineno)
+    return matching_files, matching_lines, matching_linenos
+
+def compile_fts_matches(fts_query: str, limit: int = 50):
+    """
+    Compiles a table of files, lines, and line numbers matching the FTS5 'fts_query' str parameter, best match first.
+    Searches the SQLite database built by fts.py instead of the transcript files.
+    """
+    import fts
+    database = fts.TranscriptDatabase(SQLITE_NAME)
+    try:
+        rows = database.search(fts_query, limit=limit)
+    finally:
+        database.close()
+    matching_files = [Path(OUTPUT_NAME, relative_path) for relative_path, _, _, _ in rows]
+    matching_lines = [("|" if speaker is None else speaker) + ": " + dialogue for _, _, speaker, dialogue in rows]
+    matching_linenos = [lineno for _, lineno, _, _ in rows]
+    return matching_files, matching_lines, matching_linenos
+
+def compile_structured_matches(pattern: str, speaker: str = None, season: str = None, episode: str = None):
+    """
+    Compiles a table of files, lines, and line numbers whose dialogue matches the 'pattern' str parameter,
+    among the lines left by the speaker/season/episode filters (see linestore.LineStore.select).
+    Searches the line store built by linestore.py instead of the transcript files.
+    """
+    import linestore
+    store = linestore.LineStore(LINESTORE_NAME)
+    matching_files = []
+    matching_lines = []
+    matching_linenos = []
+    for relative_path, lineno, line_speaker, dialogue in store.search(pattern, speaker, season, episode):
+        matching_files.append(Path(OUTPUT_NAME, relative_path))
+        matching_lines.append(("|" if line_speaker is None else line_speaker) + ": " + dialogue)
+        matching_linenos.append(lineno)
     return matching_files, matching_lines, matching_linenos
 
-def show_menu(matching_files: list, matching_lines: list, matching_linenos: list):
+def show_menu(matching_files: list, matching_lines: list, matching_linenos: list, page_size: int = PAGE_SIZE):
     """
     Presents a menu that displays files that contain a line that matches the pattern.
 
-    The menu contains a line number, and presents an interface for the user to open the file.
+    The menu contains a line number, and presents an interface for the user to open the file. Calls: page_menu
+    """
+    page_menu(zip(matching_files, matching_linenos, matching_lines), page_size=page_size)
+    # ultimately for clearing space, but functionality-wise entirely optional
+    matching_lines.clear()
+    matching_linenos.clear()
+
+def page_menu(matches, page_size: int = PAGE_SIZE):
+    """
+    Presents the (episode_file, lineno, line, ...) tuples of the 'matches' iterable 'page_size' at a time,
+    pulling each page from 'matches' only when it is shown.
+
+    After each page, the user may pick a number to open that file, or press Enter for the next page.
+    Returns the number of matches shown.
     """
     # present option to navigate to file to search
     prefix = " " * 4
     print()
-    match_indices = set()
     header = "List of Matching Episodes"
     print(indent(header, prefix))
     #print()
     print(indent(("=" * len(header)), prefix))
-    for match_index, episode_file in enumerate(matching_files):
-        episode_name = str(episode_file)
-        print(indent("%3d: %r@L%d" % (match_index, episode_name, matching_linenos[match_index]), prefix))
-        print(indent(matching_lines[match_index], "  " + prefix * 2))
-        match_indices.add(str(match_index))
-    # ultimately for clearing space, but functionality-wise entirely optional
-    matching_lines.clear()
-    matching_linenos.clear()
-    print()
-    print(indent("Please select the number corresponding the file you wish to open: ", prefix), end="")
-    file_to_open = input()
-    print()
-    #breakpoint()
-    if file_to_open in match_indices:
-        file_indexno = int(file_to_open)
-        filename = matching_files[file_indexno]
-        print(indent("Opening %r in browser." % str(filename), prefix))
-        webbrowser.open_new(str(filename))
-    else:
-        print(indent("%r was an invalid selection. Please try again." % file_to_open, prefix))
+    shown_files = []
+    matches = iter(matches)
+    upcoming = next(matches, None)
+    while True:
+        while upcoming is not None:
+            episode_file, lineno, line = upcoming[:3]
+            match_index = len(shown_files)
+            print(indent("%3d: %r@L%d" % (match_index, str(episode_file), lineno), prefix))
+            print(indent(line, "  " + prefix * 2))
+            shown_files.append(episode_file)
+            upcoming = next(matches, None)
+            if len(shown_files) % page_size == 0:
+                break
+        print()
+        if upcoming is None:
+            print(indent("Please select the number corresponding the file you wish to open: ", prefix), end="")
+        else:
+            print(indent("Please select the number corresponding the file you wish to open (Enter for more): ", prefix), end="")
+        file_to_open = input()
+        print()
+        #breakpoint()
+        if file_to_open == "" and upcoming is not None:
+            continue
+        if file_to_open.isdigit() and int(file_to_open) < len(shown_files):
+            filename = shown_files[int(file_to_open)]
+            print(indent("Opening %r in browser." % str(filename), prefix))
+            webbrowser.open_new(str(filename))
+        else:
+            print(indent("%r was an invalid selection. Please try again." % file_to_open, prefix))
+        return len(shown_files)
 
 def main():
     """
     Accepts cmdline argument 'pattern' for which the transcripts are searched.
 
     Presents a menu for the end-user to open a file that contains a matching line.
+    'query.py serve' instead starts the query daemon (see query_server.py), which '--server' sends the pattern to.
     """
+    if sys.argv[1:2] == ["serve"]:
+        import query_server
+        query_server.main(sys.argv[2:])
+        return
     prefix = " " * 4
     parser = argparse.ArgumentParser(description="grep for lines in SU episodes")
-    parser.add_argument('pattern', type=str, nargs=1, help='regex to grep for')
-    pattern = parser.parse_args().pattern.pop()
-    matching_files, matching_lines, matching_linenos = compile_matches(pattern)
-    if not matching_files:
+    parser.add_argument('pattern', type=str, nargs='?', help='regex to grep for')
+    parser.add_argument('--max-per-file', type=int, default=1, help='matching lines to list per episode; 0 for all (default: 1)')
+    parser.add_argument('--max-matches', type=int, default=0, help='stop after this many matches; 0 for no limit (default: 0)')
+    parser.add_argument('--fts', action='store_true', help='treat pattern as a full-text query on %r (see fts.py)' % SQLITE_NAME)
+    parser.add_argument('--limit', type=int, default=50, help='most full-text results to show (default: 50)')
+    parser.add_argument('--speaker', help='only search dialogue by this speaker (uses %r)' % LINESTORE_NAME)
+    parser.add_argument('--season', help='only search this season: number, or name such as Movie (uses %r)' % LINESTORE_NAME)
+    parser.add_argument('--episode', help='only search this episode: number, or title (uses %r)' % LINESTORE_NAME)
+    parser.add_argument('--server', nargs='?', const=QUERY_SERVER_URL,
+        help='search through the query daemon started by "query.py serve" (default: %s)' % QUERY_SERVER_URL)
+    parser.add_argument('--fuzzy', type=int, metavar='K', help='treat pattern as text, and match lines within K edits of it, ignoring case (see fuzzy.py)')
+    parser.add_argument('--batch', metavar='PATTERN_FILE', help='search for every pattern in this file (one per line) at once (see batch.py)')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help='output format of --batch (default: json)')
+    parser.add_argument('--output', help='file to write --batch results to (default: standard output)')
+    parser.add_argument('--no-cache', action='store_true', help='search the corpus even if the results are cached in %r (see result_cache.py)' % QUERY_CACHE_NAME)
+    args = parser.parse_args()
+    if args.batch is not None:
+        import batch
+        patterns = batch.read_patterns(args.batch)
+        try:
+            results = batch.search_batch(patterns)
+        except re.error as error:
+            print(indent("%s is not a valid pattern file: %s" % (args.batch, error), prefix))
+            exit()
+        formatted = batch.format_results(patterns, results, args.format)
+        if args.output is None:
+            print(formatted, end="")
+        else:
+            Path(args.output).write_text(formatted)
+        return
+    if args.pattern is None:
+        parser.error("a pattern, or --batch, is required")
+    pattern = args.pattern
+    if args.speaker is not None or args.season is not None or args.episode is not None:
+        if not Path(LINESTORE_NAME).exists():
+            print(indent("%r does not exist. Build it with linestore.py, or scrape with --linestore." % LINESTORE_NAME, prefix))
+            exit()
+        matching_files, matching_lines, matching_linenos = compile_structured_matches(pattern, args.speaker, args.season, args.episode)
+        matches = zip(matching_files, matching_linenos, matching_lines)
+    elif args.fts:
+        if not Path(SQLITE_NAME).exists():
+            print(indent("%r does not exist. Build it with fts.py, or scrape with --sqlite." % SQLITE_NAME, prefix))
+            exit()
+        try:
+            matching_files, matching_lines, matching_linenos = compile_fts_matches(pattern, limit=args.limit)
+        except sqlite3.OperationalError as error:
+            print(indent("%r is not a valid full-text query: %s" % (pattern, error), prefix))
+            exit()
+        matches = zip(matching_files, matching_linenos, matching_lines)
+    elif args.fuzzy is not None:
+        import fuzzy
+        import result_cache
+        try:
+            found = fuzzy.iter_fuzzy_matches(pattern, args.fuzzy, max_matches=args.max_matches or None, max_per_file=args.max_per_file or None)
+        except ValueError as error:
+            print(indent(str(error), prefix))
+            exit()
+        if args.no_cache:
+            matches = found
+        else:
+            matches = result_cache.cached_search(result_cache.fuzzy_key(pattern, args.fuzzy, args.max_matches or None, args.max_per_file or None),
+                lambda: found)
+    elif args.server:
+        import query_server
+        try:
+            matches = query_server.search(pattern, args.max_matches or None, args.max_per_file or None, args.server)
+        except ValueError as error:
+            print(indent("%r is not a valid pattern: %s" % (pattern, error), prefix))
+            exit()
+        except OSError as error:
+            print(indent("Could not reach the query daemon at %r: %s" % (args.server, error), prefix))
+            exit()
+    elif args.no_cache:
+        matches = iter_matches(pattern, max_matches=args.max_matches or None, max_per_file=args.max_per_file or None)
+    else:
+        try:
+            matches = cached_matches(pattern, max_matches=args.max_matches or None, max_per_file=args.max_per_file or None)
+        except re.error as error:
+            print(indent("%r is not a valid pattern: %s" % (pattern, error), prefix))
+            exit()
+    matches = iter(matches)
+    first_match = next(matches, None)
+    if first_match is None:
         print(indent("The regex pattern %r did not match any dialogue or characters. Please try again." % pattern, prefix))
         exit()
-    show_menu(matching_files, matching_lines, matching_linenos)
+    page_menu(chain([first_match], matches))
 
 if __name__ == '__main__':
     main()
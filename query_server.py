@@ -0,0 +1,282 @@
+#!/usr/bin/python3
+"""
+Query daemon: loads the corpus (and its trigram index, if current) into memory once, and answers searches over HTTP,
+so tools issuing many lookups pay neither interpreter startup nor a directory walk and file reads per pattern.
+- /search?pattern=P[&max_matches=N][&max_per_file=M]: JSON {"matches": [[episode_file, lineno, line, [start, end]], ...]},
+  exactly query.iter_matches's results; 400 with {"error": ...} for a bad pattern
+- /status: JSON {"episodes", "lines", "indexed", "loads"}
+
+The corpus is the output directory, or the shards (see shards.py) if there is none.
+It is reloaded in the background whenever its files change.
+
+Run with:
+    python3 query.py serve [--port PORT]
+and search through it with:
+    python3 query.py --server [URL] PATTERN
+"""
+
+from bisect import bisect_right
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Event, Lock, Thread
+from urllib.parse import parse_qs, urlencode
+from urllib.request import urlopen
+from urllib.error import HTTPError
+import argparse
+import json
+import logging
+import re
+
+from constants import OUTPUT_NAME, TRIGRAM_INDEX_NAME, SHARDS_NAME, QUERY_SERVER_PORT, QUERY_SERVER_URL, QUERY_RELOAD_INTERVAL, LOGGING_FILE
+import corpus
+import metrics
+import shards
+import trigram
+
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern: str):
+    """
+    Returns the compiled 'pattern' and the literals it requires (see trigram.required_literals).
+    """
+    return re.compile(pattern), trigram.required_literals(pattern)
+
+class CorpusCache:
+    """
+    Every episode's lines, held in memory along with their case-folded text,
+    which is also kept joined into one string so a literal can be looked for in every episode at once.
+    """
+
+    def __init__(self, output_dir=OUTPUT_NAME, index_name: str = TRIGRAM_INDEX_NAME, shards_name: str = SHARDS_NAME):
+        self.output_dir = Path(output_dir)
+        self.index_name = index_name
+        self.shards_dir = Path(shards_name)
+        self._lock = Lock()
+        self.loads = 0
+        self.load()
+
+    def snapshot(self):
+        """
+        Returns [path, mtime_ns, size] for every file the corpus is read from.
+        """
+        if self.output_dir.is_dir():
+            return trigram.snapshot(self.output_dir)
+        if self.shards_dir.is_dir():
+            return [[path.name, path.stat().st_mtime_ns, path.stat().st_size] for path in shards.shard_paths(self.shards_dir)]
+        return []
+
+    def load(self):
+        """
+        Reads the corpus and its trigram index. Searches in progress keep using the corpus they started with.
+        """
+        files = self.snapshot()
+        episodes = []
+        if self.output_dir.is_dir():
+            for episode_file in corpus.episode_files(self.output_dir):
+                lines = episode_file.read_text().splitlines()
+                episodes.append((str(episode_file.relative_to(self.output_dir)), episode_file, lines))
+        elif self.shards_dir.is_dir():
+            for shard_path in shards.shard_paths(self.shards_dir):
+                shard = shards.Shard(shard_path)
+                for episode_id, relative_path in enumerate(shard.relative_paths()):
+                    episodes.append((relative_path, self.output_dir.joinpath(relative_path), shard.read_episode(episode_id)))
+        episodes = [(relative_path, episode_file, lines, "\n".join(lines).casefold()) for relative_path, episode_file, lines in episodes]
+        # episodes are separated by a blank line, which no literal spans
+        folded_corpus = "\n\n".join(folded for *_, folded in episodes)
+        episode_starts = []
+        position = 0
+        for *_, folded in episodes:
+            episode_starts.append(position)
+            position += len(folded) + 2
+        index = trigram.load_index(self.index_name)
+        if index is not None and not (self.output_dir.is_dir() and index.files == files):
+            index = None
+        with self._lock:
+            self.files, self.episodes, self.index = files, episodes, index
+            self.folded_corpus, self.episode_starts = folded_corpus, episode_starts
+            self.loads += 1
+        logging.info("Loaded %d episodes from %r (trigram index: %s).", len(episodes),
+            str(self.output_dir if self.output_dir.is_dir() else self.shards_dir), index is not None)
+
+    def reload_if_changed(self):
+        """
+        Reloads the corpus if its files have changed since it was loaded. Returns True if it was reloaded.
+        """
+        if self.snapshot() == self.files:
+            return False
+        self.load()
+        return True
+
+    def episodes_containing(self, literal: str, folded_corpus: str, episode_starts: list):
+        """
+        Returns the ids, in order, of the episodes whose case-folded text contains 'literal'.
+        """
+        found = []
+        position = folded_corpus.find(literal)
+        while position != -1:
+            episode_id = bisect_right(episode_starts, position) - 1
+            found.append(episode_id)
+            if episode_id + 1 == len(episode_starts):
+                break
+            position = folded_corpus.find(literal, episode_starts[episode_id + 1])
+        return found
+
+    def search(self, pattern: str, max_matches: int = None, max_per_file: int = None):
+        """
+        Returns (episode_file, lineno, line, span) for every matching line, as query.iter_matches would.
+        """
+        regex, literals = compile_pattern(pattern)
+        with self._lock:
+            episodes, index = self.episodes, self.index
+            folded_corpus, episode_starts = self.folded_corpus, self.episode_starts
+        candidates = index.candidates(literals) if index is not None and literals else None
+        episode_ids = range(len(episodes))
+        if literals:
+            episode_ids = self.episodes_containing(max(literals, key=len), folded_corpus, episode_starts)
+        matches = []
+        for episode_id in episode_ids:
+            relative_path, episode_file, lines, folded = episodes[episode_id]
+            if max_matches is not None and len(matches) >= max_matches:
+                break
+            if candidates is not None and relative_path not in candidates:
+                continue
+            if literals and not all(literal in folded for literal in literals):
+                continue
+            file_matches = 0
+            line_indices = trigram.candidate_lines(lines, literals, folded) if literals else range(len(lines))
+            for line_index in line_indices:
+                match = regex.search(lines[line_index])
+                if match is None:
+                    continue
+                matches.append((episode_file, line_index + 1, lines[line_index], match.span()))
+                file_matches += 1
+                if max_matches is not None and len(matches) >= max_matches:
+                    break
+                if max_per_file is not None and file_matches >= max_per_file:
+                    break
+        metrics.count("matches", len(matches))
+        return matches
+
+    def status(self):
+        return {"episodes": len(self.episodes), "lines": sum(len(lines) for _, _, lines, _ in self.episodes),
+            "indexed": self.index is not None, "loads": self.loads}
+
+class QueryServer:
+    """
+    Serves a CorpusCache over HTTP, reloading it every 'reload_interval' seconds if it has changed.
+    """
+
+    def __init__(self, cache: CorpusCache, port: int = QUERY_SERVER_PORT, reload_interval: float = QUERY_RELOAD_INTERVAL):
+        self.cache = cache
+        self.reload_interval = reload_interval
+        self._stopped = Event()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.serve(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:%d" % self.httpd.server_address[1]
+
+    def serve(self, handler: BaseHTTPRequestHandler):
+        """
+        Answers one GET request.
+        """
+        path, _, query = handler.path.partition("?")
+        params = {name: values[-1] for name, values in parse_qs(query, keep_blank_values=True).items()}
+        status = 200
+        if path == "/search" and "pattern" in params:
+            try:
+                limits = {name: int(params[name]) for name in ("max_matches", "max_per_file") if params.get(name)}
+                matches = self.cache.search(params["pattern"], **limits)
+                response = {"matches": [[str(episode_file), lineno, line, span] for episode_file, lineno, line, span in matches]}
+            except (re.error, ValueError) as error:
+                status, response = 400, {"error": str(error)}
+        elif path == "/status":
+            response = self.cache.status()
+        else:
+            handler.send_error(404)
+            return
+        body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json; charset=utf-8")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def watch(self):
+        """
+        Reloads the corpus whenever it changes, until the server stops.
+        """
+        while not self._stopped.wait(self.reload_interval):
+            try:
+                if self.cache.reload_if_changed():
+                    logging.info("Corpus changed; reloaded it.")
+            except OSError as error:
+                # e.g. a file removed mid-walk by a crawl; try again next time
+                logging.info("Could not reload corpus: %r", error)
+
+    def start(self):
+        Thread(target=self.httpd.serve_forever, daemon=True).start()
+        Thread(target=self.watch, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+def search(pattern: str, max_matches: int = None, max_per_file: int = None, server_url: str = QUERY_SERVER_URL):
+    """
+    Returns (episode_file, lineno, line, span) for every matching line, from the query daemon at 'server_url'.
+    Raises ValueError for a pattern the daemon rejects, and OSError if it cannot be reached.
+    """
+    params = {"pattern": pattern}
+    if max_matches is not None:
+        params["max_matches"] = max_matches
+    if max_per_file is not None:
+        params["max_per_file"] = max_per_file
+    try:
+        with urlopen(server_url.rstrip("/") + "/search?" + urlencode(params)) as response:
+            matches = json.load(response)["matches"]
+    except HTTPError as error:
+        if error.code == 400:
+            raise ValueError(json.load(error)["error"]) from None
+        raise
+    return [(Path(episode_file), lineno, line, tuple(span)) for episode_file, lineno, line, span in matches]
+
+def main(argv: list = None):
+    """
+    Loads the corpus and serves it until interrupted.
+    """
+    parser = argparse.ArgumentParser(prog="query.py serve", description="serve searches of the SU transcripts from memory")
+    parser.add_argument('--port', type=int, default=QUERY_SERVER_PORT, help='port to listen on, on localhost (default: %(default)s)')
+    parser.add_argument('--reload-interval', type=float, default=QUERY_RELOAD_INTERVAL,
+        help='seconds between checks for a changed corpus (default: %(default)s)')
+    args = parser.parse_args(argv)
+    server = QueryServer(CorpusCache(), args.port, args.reload_interval)
+    print("Serving %d episodes at %s" % (len(server.cache.episodes), server.url))
+    Thread(target=server.watch, daemon=True).start()
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    main()
@@ -2,6 +2,9 @@
 """
 Renames episode transcripts to have zero-padded episode numbers
 that are of length two.
+
+Episodes are listed from the output directory's catalog (see catalog.py), if it is current,
+and the catalog is rewritten afterwards to name the renamed files.
 """
 
 from pathlib import Path
@@ -10,26 +13,36 @@ import logging
 
 #OUTPUT_NAME = "transcripts"
 from constants import OUTPUT_NAME
+import catalog
+import corpus
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(levelname)s:%(module)s.%(funcName)s: %(message)s",
-    )
-
-for season_dir in Path(OUTPUT_NAME).iterdir():
-    for episode_file in season_dir.iterdir():
-        match = re.search("(\d+)-(.+)", episode_file.name)
+def rename_episodes(output_dir: Path = Path(OUTPUT_NAME)):
+    """
+    Renames every 'N-title.txt' episode file under 'output_dir' to 'NN-title.txt'. Returns the number renamed.
+    """
+    renamed = 0
+    for episode_file in list(corpus.episode_files(output_dir)):
+        match = re.fullmatch(r"(\d+)-(.+)", episode_file.name)
         if match is None:
             logging.info("Episode number for '%s' not found. Skipping.", episode_file)
             continue
         episode_num = int(match.group(1))
         episode_name_tail = match.group(2)
         logging.info("Episode number for '%s' found: %d", episode_file, episode_num)
-        new_epnum = "%02d" % episode_num
-        new_epname = new_epnum + "_" + episode_name_tail
+        new_epname = "%02d" % episode_num + "-" + episode_name_tail
+        if new_epname == episode_file.name:
+            continue
         logging.info("Renaming '%s' to '%s'.", episode_file, new_epname)
         episode_file.rename(episode_file.with_name(new_epname))
+        renamed += 1
+    if renamed:
+        catalog.build_catalog(str(output_dir))
+    return renamed
 
 
 if __name__ == '__main__':
-    pass
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(levelname)s:%(module)s.%(funcName)s: %(message)s",
+        )
+    rename_episodes()
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+"""
+Persistent cache of query.py results, in a small SQLite database (QUERY_CACHE_NAME):
+    results(key, version, results, size, last_used)
+
+Entries are keyed by the normalized query (the compiled pattern and its flags, or the case-folded fuzzy query)
+and its limits, and stamped with the version of the corpus they were computed from:
+the path, size and mtime of every episode file (or of every shard, if there is no output directory),
+read from the output directory's catalog (see catalog.py) along with their checksums while it matches the files on disk.
+A lookup against any other version is a miss, and clears every entry of an older version,
+so a rescrape invalidates the whole cache the next time it is used.
+Once the results stored exceed QUERY_CACHE_MAX_BYTES, the least recently used entries are evicted.
+On a miss, results are passed on as they are found, and stored only once the search is complete.
+
+query.py reads through the cache unless given --no-cache.
+"""
+
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+import json
+import re
+import sqlite3
+import time
+
+from constants import OUTPUT_NAME, SHARDS_NAME, QUERY_CACHE_NAME, QUERY_CACHE_MAX_BYTES
+import corpus
+import metrics
+import shards
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    results TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used);
+"""
+
+def corpus_version(output_dir=OUTPUT_NAME, shards_name: str = SHARDS_NAME):
+    """
+    Returns a hex digest that changes whenever the corpus under 'output_dir' (or at 'shards_name') may have:
+    the path, size and mtime of every episode file (or shard), taken with the checksums from the catalog if it is current.
+    Files rewritten in place without the catalog being rebuilt (e.g. by pipeline.py) still change it.
+    """
+    output_dir = Path(output_dir)
+    digest = sha256()
+    if not output_dir.is_dir():
+        for shard_path in shards.shard_paths(shards_name) if Path(shards_name).is_dir() else ():
+            stat = shard_path.stat()
+            digest.update(("shard\0%s\0%d\0%d\n" % (shard_path.name, stat.st_size, stat.st_mtime_ns)).encode("utf-8"))
+        return digest.hexdigest()
+    # the catalog is read once, and its sizes and mtimes checked against the files, which are then not walked again
+    entries = corpus.read_catalog(output_dir, verify_files=True)
+    if entries is not None:
+        for entry in entries:
+            digest.update(("catalog\0%s\0%d\0%d\0%s\n" % (entry["path"], entry["bytes"], entry["mtime_ns"], entry["checksum"])).encode("utf-8"))
+        return digest.hexdigest()
+    for episode_file in corpus.episode_files(output_dir):
+        stat = episode_file.stat()
+        digest.update(("file\0%s\0%d\0%d\n" % (episode_file.relative_to(output_dir), stat.st_size, stat.st_mtime_ns)).encode("utf-8"))
+    return digest.hexdigest()
+
+def regex_key(pattern: str, max_matches: int = None, max_per_file: int = None):
+    """
+    Returns the cache key of a query.iter_matches search. Raises re.error if 'pattern' is invalid.
+    """
+    regex = re.compile(pattern)
+    return json.dumps(["regex", regex.pattern, regex.flags, max_matches, max_per_file])
+
+def fuzzy_key(query: str, max_distance: int, max_matches: int = None, max_per_file: int = None):
+    """
+    Returns the cache key of a fuzzy.iter_fuzzy_matches search.
+    """
+    return json.dumps(["fuzzy", query.casefold(), max_distance, max_matches, max_per_file])
+
+class ResultCache:
+    """
+    The result cache database. Safe to share between threads.
+    """
+
+    def __init__(self, path=QUERY_CACHE_NAME, max_bytes: int = QUERY_CACHE_MAX_BYTES):
+        """
+        Opens (and creates, if need be) the cache at 'path', holding at most 'max_bytes' of results.
+        """
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, key: str, version: str):
+        """
+        Returns the results cached for 'key' at corpus 'version', or None. Clears entries of other versions.
+        """
+        with self._lock, self.connection:
+            row = self.connection.execute("SELECT version, results FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] != version:
+                self.connection.execute("DELETE FROM results WHERE version != ?", (version,))
+                row = None
+            if row is None:
+                return None
+            self.connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        return [(Path(episode_file), lineno, line, tuple(span), *rest) for episode_file, lineno, line, span, *rest in json.loads(row[1])]
+
+    def put(self, key: str, version: str, results: list):
+        """
+        Caches the (episode_file, lineno, line, span, ...) tuples of 'results' for 'key' at corpus 'version',
+        then evicts the least recently used entries beyond the size cap. Results larger than the cap are not cached.
+        """
+        encoded = json.dumps([encode_result(result) for result in results], ensure_ascii=False)
+        size = len(encoded.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM results WHERE version != ?", (version,))
+            self.connection.execute("INSERT OR REPLACE INTO results (key, version, results, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, version, encoded, size, time.time()))
+            evicted = self.connection.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM "
+                "(SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS kept FROM results) WHERE kept > ?)",
+                (self.max_bytes,)).rowcount
+        metrics.count("cache_evictions", evicted)
+
+    def total_bytes(self):
+        """
+        Returns the size of all cached results.
+        """
+        with self._lock:
+            return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+def encode_result(result: tuple):
+    """
+    Returns the JSON-serializable form of an (episode_file, lineno, line, span, ...) result.
+    """
+    episode_file, lineno, line, span, *rest = result
+    return [str(episode_file), lineno, line, list(span), *rest]
+
+def cached_search(key: str, search, output_dir=OUTPUT_NAME, shards_name: str = SHARDS_NAME,
+        cache_name: str = QUERY_CACHE_NAME, max_bytes: int = QUERY_CACHE_MAX_BYTES):
+    """
+    Yields the results of the query 'key' from the cache at 'cache_name', if it holds them for the current corpus.
+    Otherwise yields those of 'search()' as they are found, and caches them once it is exhausted,
+    keeping them in memory only while they might still fit in the cache.
+    """
+    version = corpus_version(output_dir, shards_name)
+    with ResultCache(cache_name, max_bytes) as cache:
+        results = cache.get(key, version)
+    if results is not None:
+        metrics.count("cache_hits")
+        yield from results
+        return
+    metrics.count("cache_misses")
+    results = []
+    # a lower bound of the encoded size: each result's, without the separators
+    size = 0
+    for result in search():
+        if results is not None:
+            size += len(json.dumps(encode_result(result), ensure_ascii=False).encode("utf-8"))
+            if size > max_bytes:
+                results = None
+            else:
+                results.append(result)
+        yield result
+    if results is not None:
+        with ResultCache(cache_name, max_bytes) as cache:
+            cache.put(key, version, results)
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+"""
+Schedules crawl jobs onto a bounded pool of worker threads.
+- Overall concurrency is capped by 'max_workers'.
+- Concurrency against any one host is capped by 'max_per_host', or by its own limit (see limit_host).
+  Jobs wait in a queue per host until a slot is free, and only then take a worker,
+  so jobs queued for a busy host never hold workers that jobs for other hosts could use.
+- Jobs may submit further jobs (e.g. a season index job submitting its episodes).
+"""
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import Lock
+from urllib.parse import urlparse
+import logging
+
+from constants import MAX_WORKERS, MAX_PER_HOST
+import metrics
+
+class _HostQueue:
+    """
+    The jobs of one host: how many may run at once, how many are running, and those waiting for a slot.
+    """
+
+    def __init__(self, max_jobs: int):
+        self.max_jobs = max_jobs
+        self.running = 0
+        self.pending = deque()
+
+class CrawlScheduler:
+    """
+    Runs crawl jobs on a shared worker pool, keyed by the URL each job fetches.
+
+    Usage:
+        with CrawlScheduler() as scheduler:
+            scheduler.submit(urlname, job, *args)
+            scheduler.submit_episode(urlname, scraper.write_episode, urlname, episode_file)
+    Leaving the block waits on every job, including jobs submitted by other jobs.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, max_per_host: int = MAX_PER_HOST):
+        """
+        Creates the worker pool. Both limits must be positive.
+        """
+        if max_workers < 1 or max_per_host < 1:
+            raise ValueError(f"max_workers := {max_workers} and max_per_host := {max_per_host} must both be positive.")
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawl")
+        self._lock = Lock()
+        self._hosts = {}
+        self._futures = []
+
+    def limit_host(self, host: str, max_jobs: int):
+        """
+        Caps concurrency against 'host' (a netloc) at 'max_jobs', instead of 'max_per_host'.
+        Must be called before any job for 'host' is submitted.
+        """
+        if max_jobs < 1:
+            raise ValueError(f"max_jobs := {max_jobs} must be positive.")
+        with self._lock:
+            self._hosts[host] = _HostQueue(max_jobs)
+
+    def submit(self, urlname: str, job, *args):
+        """
+        Queues 'job(*args)' to run once a slot for the host of 'urlname', and then a worker, are free.
+        Returns the job's concurrent.futures.Future.
+        """
+        host = urlparse(urlname).netloc
+        future = Future()
+        with self._lock:
+            self._futures.append(future)
+            if host not in self._hosts:
+                self._hosts[host] = _HostQueue(self.max_per_host)
+            host_queue = self._hosts[host]
+            start = host_queue.running < host_queue.max_jobs
+            if start:
+                host_queue.running += 1
+            else:
+                host_queue.pending.append((future, job, args))
+        if start:
+            self._executor.submit(self._run_job, host_queue, future, job, args)
+        return future
+
+    def _run_job(self, host_queue: _HostQueue, future: Future, job, args: tuple):
+        """
+        Runs a job holding a slot of 'host_queue', then hands the slot to the host's next pending job, if any.
+        """
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    with metrics.profiled():
+                        result = job(*args)
+                except BaseException as error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+        finally:
+            with self._lock:
+                if host_queue.pending:
+                    next_job = host_queue.pending.popleft()
+                else:
+                    host_queue.running -= 1
+                    next_job = None
+            if next_job is not None:
+                self._executor.submit(self._run_job, host_queue, *next_job)
+
+    def submit_episode(self, urlname: str, job, *args):
+        """
+        Queues 'job(*args)', a job writing one episode with the arguments of scraper.write_episode
+        (urlname, episode_file, manifest, stores, table_class). Returns its Future.
+        Schedulers with their own way of writing episodes (e.g. pipeline.CrawlPipeline) override this.
+        """
+        return self.submit(urlname, job, *args)
+
+    def join(self):
+        """
+        Waits for every submitted job, including those submitted while waiting.
+        Raises the first exception raised by any job once all jobs have finished.
+        """
+        first_error = None
+        index = 0
+        while True:
+            with self._lock:
+                if index == len(self._futures):
+                    self._futures.clear()
+                    break
+                future = self._futures[index]
+            error = future.exception()
+            if error is not None:
+                logging.error("Crawl job failed: %r", error)
+                if first_error is None:
+                    first_error = error
+            index += 1
+        if first_error is not None:
+            raise first_error
+
+    def shutdown(self):
+        """
+        Releases the worker threads. Jobs already submitted, waiting for their host or not, still run to completion.
+        """
+        while True:
+            with self._lock:
+                unfinished = [future for future in self._futures if not future.done()]
+            if not unfinished:
+                break
+            wait(unfinished)
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.join()
+        finally:
+            self.shutdown()
+        return False
+
+
+if __name__ == '__main__':
+    pass
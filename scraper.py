@@ -5,50 +5,218 @@ Scrapes the SU Wikia for transcripts.
 2. Fetch episode url roots.
 3. Use roots to navigate to respective transcript URL.
 4. Scrape transcript into text file. 
+
+Every page fetch runs as a job on a shared scheduler.CrawlScheduler,
+and goes through the pooled, caching http_client.
+
+With --stream, each transcript is parsed as it is received and written line by line (see stream_episode),
+so a worker's memory does not grow with the size of the page.
 """
 
+from functools import lru_cache
+from hashlib import sha256
+from html.parser import HTMLParser
 from pathlib import Path
-from threading import Thread
+from tempfile import NamedTemporaryFile
+import argparse
+import filecmp
 import logging
+import os
 import re
 
-from bs4 import BeautifulSoup
-import requests as r
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import HTMLParserTreeBuilder
+
+import catalog
+from constants import WIKIA_ROOT, OUTPUT_NAME, LOGGING_FILE, SQLITE_NAME, LINESTORE_NAME, PACKED_NAME, SHARDS_NAME, TEMP_SUFFIX
+from fts import TranscriptDatabase, read_linelist
+from linestore import LineStoreBuilder
+from manifest import CrawlManifest, content_hash
+from packed import PackedCorpusBuilder
+from scheduler import CrawlScheduler
+from shards import ShardWriter
+import http_client
+import metrics
+
+# class of the transcript table on this wiki; sites.py passes others
+TRANSCRIPT_TABLE_CLASS = "wikitable bgrevo"
+# used to slice the transcript table out of a page before parsing it
+TABLE_TAG = re.compile(r"<(/?)table\b", re.IGNORECASE)
+
+@lru_cache(maxsize=None)
+def table_start(table_class: str):
+    """
+    Returns a regex matching the opening tag of a <table> whose class attribute is exactly 'table_class'.
+    """
+    return re.compile(r"<table\b[^>]*\bclass=[\"']%s[\"']" % re.escape(table_class), re.IGNORECASE)
+
+TRANSCRIPT_TABLE_START = table_start(TRANSCRIPT_TABLE_CLASS)
 
-from constants import WIKIA_ROOT, OUTPUT_NAME, LOGGING_FILE
+# mode of a newly created file under the process umask, which can only be read by setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+FILE_MODE = 0o666 & ~UMASK
 
 def scrape_transcript(urlname: str):
     """
     Scrapes transcript into list of 2-tuples, each of the form (speaker, dialogue)
     """
     logging.info("scrape_transcript(%r)", urlname)
-    response = r.get(urlname)
-    logging.info("Sending GET request")
-    response.raise_for_status()
+    page_text = http_client.get_text(urlname)
     logging.info("Request successful. Commencing table-fetch operation.")
-    transcript_table = BeautifulSoup(response.text, "html.parser").find("table", class_="wikitable bgrevo")
-    logging.info("Fetching <table class='wikitable bgrevo'> tree.")
-    assert transcript_table is not None
-    logging.info("Tree fetched successfully. Searching contents.")
-    line_list = [] # list of tuples
-    for index, tr in enumerate(transcript_table.find_all("tr")):
-        if index == 0:
-            # skip header row of table
-            continue
-        if tr.find("th") is None:
-            speaker = None
-        else:
-            speaker = tr.find("th").text.strip()
-        # 5!Can't Go Back has a blank td tag in its transcript table.
-        if tr.find("td") is None:
-            dialogue = ""
-        else:
-            dialogue = tr.find("td").text.strip()
-        line = (speaker, dialogue)
-        line_list.append(line)
-    logging.info("Scraped (%d) lines successfully. Last line: %s", index, line)
+    return parse_transcript(page_text)
+
+def find_transcript_table(page_text: str, table_class: str = TRANSCRIPT_TABLE_CLASS):
+    """
+    Returns the <table class="wikitable bgrevo"> element (or that of 'table_class') of a transcript page, or None.
+
+    The table is sliced out of the page text, and only that slice is parsed.
+    If the slice cannot be located, the whole page is parsed, keeping only matching tables.
+    """
+    start_match = table_start(table_class).search(page_text)
+    if start_match is not None:
+        depth = 0
+        for tag_match in TABLE_TAG.finditer(page_text, start_match.start()):
+            depth += -1 if tag_match.group(1) else 1
+            if depth == 0:
+                end = page_text.find(">", tag_match.end()) + 1
+                if end:
+                    return BeautifulSoup(page_text[start_match.start():end], "html.parser").table
+                break
+    logging.info("Could not slice transcript table out of page. Parsing whole page.")
+    strainer = SoupStrainer("table", class_=table_class)
+    return BeautifulSoup(page_text, "html.parser", parse_only=strainer).find("table", class_=table_class)
+
+def parse_transcript(page_text: str, table_class: str = TRANSCRIPT_TABLE_CLASS):
+    """
+    Parses the HTML of a transcript page into list of 2-tuples, each of the form (speaker, dialogue)
+    """
+    with metrics.timer("parse"):
+        transcript_table = find_transcript_table(page_text, table_class)
+        assert transcript_table is not None
+        line_list = [] # list of tuples
+        rows = transcript_table.find_all("tr")
+        # skip header row of table
+        for tr in rows[1:]:
+            th = tr.find("th")
+            speaker = None if th is None else th.text.strip()
+            # 5!Can't Go Back has a blank td tag in its transcript table.
+            td = tr.find("td")
+            dialogue = "" if td is None else td.text.strip()
+            line_list.append((speaker, dialogue))
+    metrics.count("lines_scraped", len(line_list))
+    logging.info("Scraped (%d) lines successfully. Last line: %s", len(rows) - 1, line_list[-1] if line_list else None)
     return line_list
 
+class TranscriptRowParser(HTMLParser):
+    """
+    Incremental parser for transcript pages: feed it the page in chunks, and it collects the (speaker, dialogue)
+    2-tuple of each row of the transcript table in 'rows' as soon as the row ends, exactly as parse_transcript gives them.
+    Only the text of the rows being read is kept.
+
+    Elements nest as BeautifulSoup's html.parser tree builder nests them: no tag is closed implicitly,
+    and an end tag closes every element opened since the most recent one of its name.
+    So, as in parse_transcript, every <tr> in the table is a row (those of nested tables included),
+    its speaker is the text of the first <th> inside it and its dialogue that of the first <td>,
+    and an unclosed cell or row goes on until the element around it ends.
+    """
+    # elements closed as soon as they are opened, and elements whose text is left out of a cell's (e.g. <script>)
+    VOID_TAGS = frozenset(HTMLParserTreeBuilder().empty_element_tags)
+    HIDDEN_TAGS = frozenset(HTMLParserTreeBuilder().string_containers)
+
+    def __init__(self, table_class: str = TRANSCRIPT_TABLE_CLASS):
+        super().__init__(convert_charrefs=True)
+        self.table_class = table_class
+        self.rows = []
+        self.found = False
+        # elements open in the transcript table, the table first: [tag, row, number of text collectors it started]
+        self.stack = []
+        # [th pieces, td pieces, ended] of each row not yet handed over, in document order
+        self.pending = []
+        self.rows_seen = 0
+        # text pieces of every cell being read, and the number of open elements hiding their text
+        self.collectors = []
+        self.hidden = 0
+
+    def handle_starttag(self, tag: str, attrs: list):
+        if not self.stack:
+            if not self.found and tag == "table" and dict(attrs).get("class") == self.table_class:
+                self.found = True
+                self.stack.append([tag, None, 0])
+            return
+        if tag in self.VOID_TAGS:
+            return
+        row = None
+        started = 0
+        if tag == "tr":
+            row = [None, None, False]
+            self.pending.append(row)
+        elif tag in ("th", "td"):
+            cell = 0 if tag == "th" else 1
+            for _, open_row, _ in self.stack:
+                if open_row is not None and open_row[cell] is None:
+                    open_row[cell] = []
+                    self.collectors.append(open_row[cell])
+                    started += 1
+        elif tag in self.HIDDEN_TAGS:
+            self.hidden += 1
+        self.stack.append([tag, row, started])
+
+    def handle_endtag(self, tag: str):
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                self.close_elements(index)
+                return
+
+    def handle_data(self, data: str):
+        if not self.hidden:
+            for pieces in self.collectors:
+                pieces.append(data)
+
+    def unknown_decl(self, data: str):
+        # <![CDATA[...]]> is text, as it is to BeautifulSoup
+        if data.upper().startswith("CDATA["):
+            self.handle_data(data[len("CDATA["):])
+
+    def close(self):
+        super().close()
+        self.close_elements(0)
+
+    def close_elements(self, index: int):
+        """
+        Closes the open elements from stack[index] on, and hands over every row that is complete and in order.
+        """
+        while len(self.stack) > index:
+            tag, row, started = self.stack.pop()
+            if started:
+                del self.collectors[-started:]
+            if row is not None:
+                row[2] = True
+            elif tag in self.HIDDEN_TAGS:
+                self.hidden -= 1
+        while self.pending and self.pending[0][2]:
+            speaker, dialogue, _ = self.pending.pop(0)
+            self.rows_seen += 1
+            # skip header row of table
+            if self.rows_seen > 1:
+                self.rows.append((None if speaker is None else "".join(speaker).strip(), "".join(dialogue or ()).strip()))
+
+def iter_transcript_rows(chunks, table_class: str = TRANSCRIPT_TABLE_CLASS):
+    """
+    Yields the (speaker, dialogue) 2-tuples of a transcript page given as an iterable of text 'chunks',
+    each as soon as its row has been read. Raises ValueError if the page has no transcript table.
+    """
+    parser = TranscriptRowParser(table_class)
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.rows:
+            yield from parser.rows
+            parser.rows.clear()
+    parser.close()
+    yield from parser.rows
+    if not parser.found:
+        raise ValueError("No <table class=%r> found." % table_class)
+
 
 def scrape_episodeurls(urlname: str):
     """
@@ -59,12 +227,10 @@ def scrape_episodeurls(urlname: str):
     #assert re.fullmatch(r"https://steven-universe.fandom.com/wiki/Season_[1-5]", urlname) is not None
     #logging.info("%r is of the form, 'https://steven-universe.fandom.com/wiki/Season_[1-5]. Proceeding.", urlname)
     logging.info("scrape_episodeurls(%r)", urlname)
-    response = r.get(urlname)
-    logging.info("Sending GET request.")
-    response.raise_for_status()
+    page_text = http_client.get_text(urlname)
     logging.info("GET request successfully sent.")
     logging.info("Fetching <td style='border-top:0; font-weight:bold !important'> cells.")
-    episode_cells = BeautifulSoup(response.text, "html.parser").find_all("td", style="border-top:0; font-weight:bold !important")
+    episode_cells = BeautifulSoup(page_text, "html.parser").find_all("td", style="border-top:0; font-weight:bold !important")
     logging.info("<td ...> cells successfully fetched. Commencing iteration.")
     episode_urls = []
     for index, td in enumerate(episode_cells):
@@ -87,25 +253,184 @@ def format_linelist(linelist: list):
         Gets a line (2-tuple of (None|str, str), and converts it to a string of the form, '(|\|speaker): dialogue'
         """
         speaker, dialogue = line
-        logging.debug("speaker := %s is of type %s.", speaker, type(speaker))
         if not (isinstance(speaker, str) or speaker is None):
             raise TypeError(f"speaker := {speaker} is of type {type(speaker)}; not None or str-type.")
         assert dialogue is not None
         row_header = ("|" if speaker is None else speaker)
-        logging.debug("row_header := %s is of type %s.", row_header, type(row_header))
         speakerpipe_colon_line = row_header + ": " + dialogue
         return speakerpipe_colon_line
-    formatted_lines = "\n".join(map(speakerpipe_colon_formatter, linelist))
+    with metrics.timer("format"):
+        formatted_lines = "\n".join(map(speakerpipe_colon_formatter, linelist))
     return formatted_lines
 
-def scrape_episodes():
+def fetch_episode(urlname: str, episode_file: Path, manifest: CrawlManifest = None):
+    """
+    Fetch stage of write_episode. Returns (page_text, page_hash), or None if the 'manifest' shows the page is unchanged,
+    or already written by the crawl it resumes.
+    page_hash is None when there is no manifest.
+    """
+    if manifest is not None and manifest.is_done(urlname, episode_file):
+        logging.info("%r already written by the crawl being resumed. Skipping.", urlname)
+        return None
+    page_text, not_modified = http_client.fetch(urlname)
+    if manifest is None:
+        return page_text, None
+    page_hash = content_hash(page_text)
+    if manifest.is_current(urlname, page_hash, episode_file):
+        logging.info("%r unchanged since last crawl (not_modified := %s). Skipping.", urlname, not_modified)
+        manifest.record(urlname, page_hash, episode_file)
+        return None
+    return page_text, page_hash
+
+def parse_and_format(page_text: str, table_class: str = TRANSCRIPT_TABLE_CLASS):
+    """
+    Parse stage of write_episode. Returns (line_list, formatted_lines). Calls: parse_transcript, format_linelist
+    """
+    line_list = parse_transcript(page_text, table_class)
+    return line_list, format_linelist(line_list)
+
+def save_episode(urlname: str, episode_file: Path, page_hash: str, line_list: list, formatted_lines: str,
+        manifest: CrawlManifest = None, stores: tuple = ()):
+    """
+    Write stage of write_episode: writes 'formatted_lines' to 'episode_file', hands 'line_list' to 'stores',
+    and records the fetch in 'manifest'.
+    """
+    if manifest is not None and episode_file.exists() and episode_file.read_text() == formatted_lines:
+        logging.info("%r is identical to the new transcript. Not rewriting.", str(episode_file))
+    else:
+        with metrics.timer("write"):
+            episode_file.write_text(formatted_lines)
+        logging.info("Wrote %d lines from %r to %r", len(line_list), urlname, str(episode_file))
+    for store in stores:
+        store.add_episode(episode_file, line_list)
+    if manifest is not None:
+        manifest.record(urlname, page_hash, episode_file)
+
+def restore_episode(episode_file: Path, stores: tuple = ()):
+    """
+    Skip path of write_episode: hands the lines already in 'episode_file' to 'stores',
+    so stores filled by an incremental or resumed crawl still hold the episodes it did not fetch or rewrite.
+    """
+    if not stores:
+        return
+    line_list = read_linelist(episode_file)
+    for store in stores:
+        store.add_episode(episode_file, line_list)
+
+def write_linelist(episode_file: Path, line_iter):
+    """
+    Writes the (speaker, dialogue) 2-tuples of 'line_iter' to 'episode_file' as format_linelist would, one line at a time,
+    through a temporary file beside it. Returns (temp_file, number of lines); the caller renames or removes the temporary file.
+    """
+    output = NamedTemporaryFile("w", encoding="utf-8", newline="", dir=episode_file.parent,
+        prefix=episode_file.name + ".", suffix=TEMP_SUFFIX, delete=False)
+    temp_file = Path(output.name)
+    num_lines = 0
+    try:
+        with output:
+            # temporary files are private; the transcript it becomes should not be
+            os.chmod(output.fileno(), FILE_MODE)
+            for speaker, dialogue in line_iter:
+                output.write(("\n" if num_lines else "") + ("|" if speaker is None else speaker) + ": " + dialogue)
+                num_lines += 1
+    except BaseException:
+        temp_file.unlink(missing_ok=True)
+        raise
+    return temp_file, num_lines
+
+def stream_episode(urlname: str, episode_file: Path, manifest: CrawlManifest = None, stores: tuple = (),
+        table_class: str = TRANSCRIPT_TABLE_CLASS):
+    """
+    Streaming write_episode: the page is parsed as it is received, and its lines are written as they are parsed,
+    to a temporary file that replaces 'episode_file' once complete. Only the row being parsed is held in memory,
+    unless one of 'stores' needs the whole line list (store.reads_file is not set).
+
+    With a 'manifest', the page hash is only known once the page has been read: an unchanged page is still parsed,
+    but 'episode_file' is left untouched, as it is when its contents would not change.
+    """
+    if manifest is not None and manifest.is_done(urlname, episode_file):
+        logging.info("%r already written by the crawl being resumed. Skipping.", urlname)
+        restore_episode(episode_file, stores)
+        return episode_file
+    page_digest = sha256()
+
+    def hashed_chunks():
+        for chunk in http_client.iter_text(urlname):
+            page_digest.update(chunk.encode("utf-8"))
+            yield chunk
+
+    line_list = None if all(getattr(store, "reads_file", False) for store in stores) else []
+
+    def kept_lines():
+        for line in iter_transcript_rows(hashed_chunks(), table_class):
+            if line_list is not None:
+                line_list.append(line)
+            yield line
+
+    with metrics.timer("parse"):
+        temp_file, num_lines = write_linelist(episode_file, kept_lines())
+    metrics.count("lines_scraped", num_lines)
+    page_hash = page_digest.hexdigest() if manifest is not None else None
+    if manifest is not None and manifest.is_current(urlname, page_hash, episode_file):
+        logging.info("%r unchanged since last crawl. Not rewriting.", urlname)
+        temp_file.unlink()
+    elif manifest is not None and episode_file.exists() and filecmp.cmp(temp_file, episode_file, shallow=False):
+        logging.info("%r is identical to the new transcript. Not rewriting.", str(episode_file))
+        temp_file.unlink()
+    else:
+        os.replace(temp_file, episode_file)
+        logging.info("Wrote %d lines from %r to %r", num_lines, urlname, str(episode_file))
+    for store in stores:
+        store.add_episode(episode_file, line_list)
+    if manifest is not None:
+        manifest.record(urlname, page_hash, episode_file)
+    return episode_file
+
+class StreamingScheduler(CrawlScheduler):
+    """
+    A CrawlScheduler that writes episodes with stream_episode.
+    """
+
+    def submit_episode(self, urlname: str, job, *args):
+        return self.submit(urlname, stream_episode, *args)
+
+def write_episode(urlname: str, episode_file: Path, manifest: CrawlManifest = None, stores: tuple = (),
+        table_class: str = TRANSCRIPT_TABLE_CLASS):
+    """
+    Scrapes the transcript at 'urlname' and writes it to 'episode_file'. Calls: fetch_episode, parse_and_format, save_episode
+
+    If a 'manifest' is given, pages that are unchanged since the last crawl are not reparsed,
+    files whose contents would not change are not rewritten, and the fetch is recorded.
+    Each of 'stores' (e.g. fts.TranscriptDatabase) is also given the parsed lines, via store.add_episode,
+    or the lines already in 'episode_file' if the page was skipped (see restore_episode).
+    'table_class' is the class of the transcript table, for wikis other than this one.
+
+    pipeline.CrawlPipeline runs the three stages separately.
+    """
+    fetched = fetch_episode(urlname, episode_file, manifest)
+    if fetched is None:
+        restore_episode(episode_file, stores)
+        return episode_file
+    page_text, page_hash = fetched
+    line_list, formatted_lines = parse_and_format(page_text, table_class)
+    save_episode(urlname, episode_file, page_hash, line_list, formatted_lines, manifest, stores)
+    return episode_file
+
+def scrape_episodes(scheduler: CrawlScheduler = None, manifest: CrawlManifest = None, stores: tuple = (), num_seasons: int = 5):
     """
     Loop over all seasons.
     Create directories for each one.
     Create file in accordance with 'episode_name' str-parameter.
     Write to file using 'format_linelist' function.
+
+    Season index pages and episode transcripts are all fetched as jobs on 'scheduler';
+    a scheduler is created (and waited on) if none is given.
+    Pass a 'manifest' to skip episodes that are unchanged since the last crawl,
+    and 'stores' to save each episode's lines anywhere besides its text file (see write_episode).
     """
-    num_seasons = 5
+    if scheduler is None:
+        with CrawlScheduler() as scheduler:
+            return scrape_episodes(scheduler, manifest, stores, num_seasons)
     output_dir = Path(OUTPUT_NAME)
     output_dir.mkdir(exist_ok=True)
     logging.info("Created %r output directory.", OUTPUT_NAME)
@@ -116,12 +441,12 @@ def scrape_episodes():
         """
         assert isinstance(snum, int)
         assert 1 <= snum <= num_seasons # from outer environment
-        # everything here is just so hard-coupled
-        return "https://steven-universe.fandom.com/wiki/Season_%d" % snum
+        # hard-coupled to this wiki; sites.py crawls any wiki described in sites.json
+        return WIKIA_ROOT + "/wiki/Season_%d" % snum
 
     def scrape_season(snum: int):
         """
-        Scrapes all episodes from a given season.
+        Scrapes the episode list of a given season, and queues a job for each of its episodes.
         """
         season_dir = output_dir.joinpath("Season_%d" % snum)
         season_dir.mkdir(exist_ok=True)
@@ -129,94 +454,150 @@ def scrape_episodes():
         season_url = get_seasonurl(snum)
         logging.info("Scraping %r for episode list of Season_%d.", season_url, snum)
         episode_urls = scrape_episodeurls(season_url)
-        #logging.info("Episode list for Season_%d found. %d episodes found.", snum, len(episode_urls))
-        episode_indexno = 1
-        for episode_name, episode_url in episode_urls:
-            line_list = scrape_transcript(WIKIA_ROOT + episode_url + "/Transcript")
-            logging.info("Scraping transcript for episode_name := %r from episode_url := %r", episode_name, WIKIA_ROOT + episode_url)
-            formatted_lines = format_linelist(line_list)
+        for episode_indexno, (episode_name, episode_url) in enumerate(episode_urls, start=1):
+            transcript_url = WIKIA_ROOT + episode_url + "/Transcript"
             episode_file = season_dir.joinpath("%02d" % episode_indexno + "-" + episode_name + ".txt")
-            episode_file.write_text(formatted_lines)
-            logging.info("Episode transcript for Season_%d!%r written to %r", snum, episode_name, str(episode_file))
-            episode_indexno += 1
+            logging.info("Queueing Season_%d!%r from %r", snum, episode_name, transcript_url)
+            scheduler.submit_episode(transcript_url, write_episode, transcript_url, episode_file, manifest, stores)
 
-    # definitely implement threading for each season
-    # also, put this in a while-loop so that it works for lots of shows
-    thread_list = []
+    # for lots of shows, see sites.py
     for season_num in range(1, num_seasons + 1):
-        scrapejob = Thread(target=scrape_season, args=[season_num])
-        thread_list.append(scrapejob)
-    for scrapejob in thread_list:
-        scrapejob.start()
-        scrapejob.join()
+        scheduler.submit(get_seasonurl(season_num), scrape_season, season_num)
 
-def scrape_movie():
+def scrape_movie(scheduler: CrawlScheduler = None, manifest: CrawlManifest = None, stores: tuple = ()):
     """
-    Scrapes transcript for SU: The Movie. Calls: scrape_transcript, format_linelist
+    Scrapes transcript for SU: The Movie. Calls: write_episode
     """
-    urlname = "https://steven-universe.fandom.com/wiki/Steven_Universe:_The_Movie/Transcript"
+    if scheduler is None:
+        with CrawlScheduler() as scheduler:
+            return scrape_movie(scheduler, manifest, stores)
+    urlname = WIKIA_ROOT + "/wiki/Steven_Universe:_The_Movie/Transcript"
     logging.info("Scraping 'Steven Universe: The Movie' transcript from %r.", urlname)
-    line_list = scrape_transcript(urlname)
-    formatted_lines = format_linelist(line_list)
     output_dir = Path(OUTPUT_NAME, "Movie")
-    output_dir.mkdir(exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
     logging.info("Created %r output directory.", str(output_dir))
     output_file = output_dir.joinpath("Movie.txt")
-    output_file.write_text(formatted_lines)
-    logging.info("Successfully wrote 'Steven Universe: The Movie' transcript to %r.", str(output_file))
+    scheduler.submit_episode(urlname, write_episode, urlname, output_file, manifest, stores)
 
-def scrape_future():
+def scrape_future(scheduler: CrawlScheduler = None, manifest: CrawlManifest = None, stores: tuple = ()):
     """
-    Scrapes Future episodes. Calls: scrape_episodeurls, scrape_transcript, format_linelist
+    Scrapes Future episodes. Calls: scrape_episodeurls, write_episode
     """
-    urlname = "https://steven-universe.fandom.com/wiki/Steven_Universe_Future"
-    logging.info("Scraping 'Steven Universe: Future' episode list from %r.", urlname)
-    episode_urls = scrape_episodeurls(urlname)
+    if scheduler is None:
+        with CrawlScheduler() as scheduler:
+            return scrape_future(scheduler, manifest, stores)
+    urlname = WIKIA_ROOT + "/wiki/Steven_Universe_Future"
     output_dir = Path(OUTPUT_NAME, "Future")
-    output_dir.mkdir(exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
     logging.info("Created %r output directory.", str(output_dir))
-    episode_indexno = 1
-    # implement threading here, maybe?
-    for episode_name, episode_url in episode_urls:
-        logging.info("Scraping Future!%r transcript from %r.", episode_name, episode_url)
-        line_list = scrape_transcript(WIKIA_ROOT + episode_url + "/Transcript")
-        formatted_lines = format_linelist(line_list)
-        episode_file = output_dir.joinpath("%02d" % episode_indexno + "-" + episode_name + ".txt")
-        episode_file.write_text(formatted_lines)
-        episode_indexno += 1
-
-def scrape_shorts():
+
+    def scrape_index():
+        """
+        Scrapes the Future episode list, and queues a job for each episode.
+        """
+        logging.info("Scraping 'Steven Universe: Future' episode list from %r.", urlname)
+        episode_urls = scrape_episodeurls(urlname)
+        for episode_indexno, (episode_name, episode_url) in enumerate(episode_urls, start=1):
+            logging.info("Queueing Future!%r transcript from %r.", episode_name, episode_url)
+            transcript_url = WIKIA_ROOT + episode_url + "/Transcript"
+            episode_file = output_dir.joinpath("%02d" % episode_indexno + "-" + episode_name + ".txt")
+            scheduler.submit_episode(transcript_url, write_episode, transcript_url, episode_file, manifest, stores)
+
+    scheduler.submit(urlname, scrape_index)
+
+def scrape_shorts(scheduler: CrawlScheduler = None, manifest: CrawlManifest = None, stores: tuple = ()):
     """
     Scrapes shorts into ./output/Shorts/
     """
+    if scheduler is None:
+        with CrawlScheduler() as scheduler:
+            return scrape_shorts(scheduler, manifest, stores)
+    urlname = WIKIA_ROOT + "/wiki/Category:Shorts"
     output_dir = Path(OUTPUT_NAME, "Shorts")
-    output_dir.mkdir(exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
     logging.info("Created %r output directory.", str(output_dir))
-    # get list of URLs to scrape from.
-    response = r.get("https://steven-universe.fandom.com/wiki/Category:Shorts")
-    response.raise_for_status()
-    shorts_cells = BeautifulSoup(response.text, 'html.parser').find_all("div", class_="category-page__member-left")
-    for index, cell in enumerate(shorts_cells):
-        if not index:
-            # skip 'Classroom Shorts' link
-            continue
-        # get URL, then scrape from it
-        #print(cell)
-        source_url = WIKIA_ROOT + cell.find("a")['href'] + "/Transcript"
-        short_title = cell.find('a')['title']
-        # get transcript, then format to writeable format
-        line_list = scrape_transcript(source_url)
-        formatted_lines = format_linelist(line_list)
-        # write to file
-        output_file = output_dir.joinpath("%02d" % index + "-" + short_title + ".txt")
-        output_file.write_text(formatted_lines)
-        logging.info("Short #%d found: %r. Scraped and wrote %d lines to %r", index, short_title, len(line_list), str(output_file))
+
+    def scrape_index():
+        """
+        Gets list of URLs to scrape from, and queues a job for each short.
+        """
+        page_text = http_client.get_text(urlname)
+        shorts_cells = BeautifulSoup(page_text, 'html.parser').find_all("div", class_="category-page__member-left")
+        for index, cell in enumerate(shorts_cells):
+            if not index:
+                # skip 'Classroom Shorts' link
+                continue
+            source_url = WIKIA_ROOT + cell.find("a")['href'] + "/Transcript"
+            short_title = cell.find('a')['title']
+            output_file = output_dir.joinpath("%02d" % index + "-" + short_title + ".txt")
+            logging.info("Short #%d found: %r. Queueing %r", index, short_title, source_url)
+            scheduler.submit_episode(source_url, write_episode, source_url, output_file, manifest, stores)
+
+    scheduler.submit(urlname, scrape_index)
+
+def add_crawl_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the cmdline arguments every crawler's main takes (see run_crawl):
+    - '--incremental', which skips episodes that are unchanged since the last crawl.
+    - '--resume', which also skips episodes already written by an interrupted crawl, without fetching them.
+    - '--sqlite', which also stores transcripts in the SQLite full-text database (see fts.py).
+    - '--linestore', which also stores transcripts in the columnar line store (see linestore.py).
+    - '--packed', which also packs transcripts into one memory-mappable file for query.py (see packed.py).
+    - '--shards', which also writes each season as one compressed shard, to copy to query hosts (see shards.py).
+    """
+    parser.add_argument('--incremental', action='store_true', help='only rewrite new or changed episodes (see manifest.py)')
+    parser.add_argument('--resume', action='store_true', help='like --incremental, and skip episodes written by an interrupted crawl')
+    parser.add_argument('--sqlite', action='store_true', help='also store transcripts in %r (see fts.py)' % SQLITE_NAME)
+    parser.add_argument('--linestore', action='store_true', help='also store transcripts in %r (see linestore.py)' % LINESTORE_NAME)
+    parser.add_argument('--packed', action='store_true', help='also pack transcripts into %r (see packed.py)' % PACKED_NAME)
+    parser.add_argument('--shards', choices=['gzip', 'xz'], nargs='?', const='gzip',
+        help='also write compressed season shards into %r (see shards.py; default codec: gzip)' % SHARDS_NAME)
+
+def run_crawl(scheduler: CrawlScheduler, args: argparse.Namespace):
+    """
+    Crawls every season through 'scheduler', with the manifest and stores chosen by the add_crawl_arguments in 'args'.
+    Then saves the manifest, closes the stores, and writes the episode catalog of the output directory (see catalog.py).
+    """
+    manifest = CrawlManifest(resume=args.resume) if args.incremental or args.resume else None
+    stores = []
+    if args.sqlite:
+        stores.append(TranscriptDatabase())
+    if args.linestore:
+        stores.append(LineStoreBuilder())
+    if args.packed:
+        stores.append(PackedCorpusBuilder())
+    if args.shards:
+        stores.append(ShardWriter(codec=args.shards))
+    finished = False
+    try:
+        with scheduler:
+            scrape_episodes(scheduler, manifest, stores)
+        finished = True
+    finally:
+        if manifest is not None:
+            manifest.save(finished)
+        for store in stores:
+            store.close()
+        if Path(OUTPUT_NAME).is_dir():
+            catalog.build_catalog(OUTPUT_NAME)
+
+def main():
+    """
+    Crawls every season, then writes the episode catalog of the output directory (see run_crawl).
+    Accepts the cmdline arguments of add_crawl_arguments, and:
+    - '--stream', which parses and writes each transcript as it is received (see stream_episode).
+    """
+    parser = argparse.ArgumentParser(description="scrape SU Wikia transcripts")
+    add_crawl_arguments(parser)
+    parser.add_argument('--stream', action='store_true', help='parse and write each transcript as it is received, in constant memory')
+    args = parser.parse_args()
+    run_crawl((StreamingScheduler if args.stream else CrawlScheduler)(), args)
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
     scrape_or_no = "y"
     output_dir = Path(OUTPUT_NAME)
-    scrape_episodes()
+    main()
     #scrape_shorts()
     """
     while scrape_or_no not in ("y", "n") and output_dir.exists():
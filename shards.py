@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+"""
+Compressed corpus shards: each season's transcripts in one file under SHARDS_NAME, for copying to query hosts.
+
+File layout (<season>.shard.gz, or <season>.shard.xz):
+- 8-byte little-endian header length, then a JSON header: the season, the codec, and for each episode
+  its zero-padded ordinal, title, file name, line count, and the offset and size of its compressed frame
+- one frame per episode, in canonical order: its lines, utf-8, each ending in a newline, compressed on its own
+
+query.iter_matches reads the shards when there is no output directory: frames are decompressed as a stream,
+a line at a time, straight from the shard file, and an episode is abandoned as soon as its matches are found.
+Episode files need not be renamed (see renamer.py), since ordinals are kept zero-padded in the header.
+
+Build at scrape time with 'scraper.py --shards', or from an already-scraped output directory with:
+    python3 shards.py [--xz]
+"""
+
+from pathlib import Path
+from threading import Lock
+import argparse
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+import re
+
+from constants import OUTPUT_NAME, SHARDS_NAME, LOGGING_FILE
+import corpus
+import metrics
+
+SHARD_VERSION = 1
+# codec -> (file suffix, compress, open a decompressing stream over a binary file)
+CODECS = {
+    "gzip": (".shard.gz", lambda data: gzip.compress(data, mtime=0), lambda shard_file: gzip.GzipFile(fileobj=shard_file)),
+    "xz": (".shard.xz", lzma.compress, lzma.LZMAFile),
+    }
+
+def shard_paths(shards_dir: Path):
+    """
+    Returns the shard files under 'shards_dir', in canonical season order.
+    """
+    suffixes = tuple(suffix for suffix, _, _ in CODECS.values())
+    paths = [path for path in Path(shards_dir).iterdir() if path.name.endswith(suffixes)]
+    return sorted(paths, key=lambda path: corpus.order_seasons(Path(path.name.split(".shard.")[0])))
+
+class Shard:
+    """
+    The header of one shard file, and streaming access to its episodes.
+    """
+
+    def __init__(self, path):
+        """
+        Reads the header of the shard at 'path'.
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as shard_file:
+            header_length = int.from_bytes(shard_file.read(8), "little")
+            header = json.loads(shard_file.read(header_length).decode("utf-8"))
+        if header["version"] != SHARD_VERSION:
+            raise ValueError(f"{path} is a version {header['version']} shard; expected {SHARD_VERSION}.")
+        self.season = header["season"]
+        self.codec = header["codec"]
+        # [ordinal ("01"), title, file name, number of lines, frame offset, frame size]
+        self.episodes = header["episodes"]
+        self.frames_start = 8 + header_length
+
+    def relative_paths(self):
+        return [str(Path(self.season, file_name)) for _, _, file_name, _, _, _ in self.episodes]
+
+    def iter_lines(self, shard_file, episode_id: int):
+        """
+        Yields the lines of an episode, decompressing its frame from the open binary 'shard_file' as they are read.
+        """
+        _, _, _, num_lines, offset, _ = self.episodes[episode_id]
+        shard_file.seek(self.frames_start + offset)
+        _, _, open_stream = CODECS[self.codec]
+        text = io.TextIOWrapper(open_stream(shard_file), encoding="utf-8", newline="\n")
+        for _ in range(num_lines):
+            yield text.readline()[:-1]
+
+    def read_episode(self, episode_id: int):
+        """
+        Returns the lines of an episode.
+        """
+        with open(self.path, "rb") as shard_file:
+            return list(self.iter_lines(shard_file, episode_id))
+
+class ShardWriter:
+    """
+    Collects episodes (in any order, from any thread) and writes them out as one shard per season.
+    """
+
+    def __init__(self, path=SHARDS_NAME, codec: str = "gzip", keep_existing: bool = True):
+        """
+        If 'keep_existing', starts from the episodes already in the shards under 'path',
+        so episodes that are not re-added (e.g. unchanged in an incremental crawl) are kept.
+        """
+        if codec not in CODECS:
+            raise ValueError("Unknown shard codec %r; expected one of %s." % (codec, ", ".join(CODECS)))
+        self.path = Path(path)
+        self.codec = codec
+        self._lock = Lock()
+        # season -> {file name: lines}
+        self.seasons = {}
+        if keep_existing and self.path.is_dir():
+            for shard_path in shard_paths(self.path):
+                shard = Shard(shard_path)
+                episodes = self.seasons.setdefault(shard.season, {})
+                for episode_id, (_, _, file_name, _, _, _) in enumerate(shard.episodes):
+                    episodes[file_name] = shard.read_episode(episode_id)
+
+    def add_file(self, episode_file: Path, lines: list):
+        """
+        Adds (or replaces) the episode whose file 'episode_file' holds 'lines'.
+        """
+        with self._lock:
+            self.seasons.setdefault(episode_file.parent.name, {})[episode_file.name] = lines
+
+    def add_episode(self, episode_file: Path, line_list: list):
+        """
+        Adds (or replaces) the (speaker, dialogue) 2-tuples of the episode written to 'episode_file'.
+        """
+        text = "\n".join(("|" if speaker is None else speaker) + ": " + dialogue for speaker, dialogue in line_list)
+        self.add_file(episode_file, text.splitlines())
+
+    def save(self):
+        """
+        Writes every season's shard, atomically, replacing any shard of it in another codec.
+        """
+        suffix, compress, _ = CODECS[self.codec]
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            seasons = {season: dict(episodes) for season, episodes in self.seasons.items()}
+        for season, episodes in seasons.items():
+            episode_table = []
+            frames = []
+            offset = 0
+            for file_name in sorted(episodes, key=lambda file_name: corpus.order_episodes(Path(file_name))):
+                lines = episodes[file_name]
+                with metrics.timer("compress"):
+                    frame = compress("".join(line + "\n" for line in lines).encode("utf-8"))
+                ordinal, title = corpus.episode_title(Path(file_name))
+                episode_table.append(["%02d" % ordinal, title, file_name, len(lines), offset, len(frame)])
+                frames.append(frame)
+                offset += len(frame)
+            header = {"version": SHARD_VERSION, "season": season, "codec": self.codec, "episodes": episode_table}
+            header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+            shard_path = self.path.joinpath(season + suffix)
+            temp_file = shard_path.with_name(shard_path.name + ".tmp")
+            with open(temp_file, "wb") as shard_file:
+                shard_file.write(len(header_bytes).to_bytes(8, "little"))
+                shard_file.write(header_bytes)
+                for frame in frames:
+                    shard_file.write(frame)
+            os.replace(temp_file, shard_path)
+            for other_suffix, _, _ in CODECS.values():
+                if other_suffix != suffix:
+                    self.path.joinpath(season + other_suffix).unlink(missing_ok=True)
+            logging.info("Wrote %d episodes of %s to %r (%d bytes compressed).", len(episode_table), season, str(shard_path), offset)
+
+    def close(self):
+        """
+        Saves the shards; lets a writer be used as one of scraper.write_episode's 'stores'.
+        """
+        self.save()
+
+def iter_matches(pattern: str, max_matches: int = None, max_per_file: int = None, shards_dir=SHARDS_NAME,
+        output_dir=OUTPUT_NAME, candidates: set = None):
+    """
+    Yields (episode_file, lineno, line, span) for every line in the shards under 'shards_dir' matching 'pattern',
+    as query.iter_matches does for the files they were built from, with the same limits.
+    'episode_file' is the path the episode would have under 'output_dir'.
+    If 'candidates' is given, only those relative paths are searched.
+    """
+    regex = re.compile(pattern)
+    output_dir = Path(output_dir)
+    num_matches = 0
+    for shard_path in shard_paths(shards_dir):
+        shard = Shard(shard_path)
+        with open(shard.path, "rb") as shard_file:
+            for episode_id, relative_path in enumerate(shard.relative_paths()):
+                if max_matches is not None and num_matches >= max_matches:
+                    return
+                if candidates is not None and relative_path not in candidates:
+                    continue
+                episode_file = output_dir.joinpath(relative_path)
+                num_file_matches = 0
+                num_lines = 0
+                with metrics.timer("scan") as scan:
+                    for num_lines, line in enumerate(shard.iter_lines(shard_file, episode_id), start=1):
+                        match = regex.search(line)
+                        if match is None:
+                            continue
+                        scan.pause()
+                        yield episode_file, num_lines, line, match.span()
+                        scan.resume()
+                        num_matches += 1
+                        num_file_matches += 1
+                        if max_matches is not None and num_matches >= max_matches:
+                            break
+                        if max_per_file is not None and num_file_matches >= max_per_file:
+                            break
+                metrics.count("files_scanned")
+                metrics.count("lines_scanned", num_lines)
+                metrics.count("matches", num_file_matches)
+
+def build_shards(output_name: str = OUTPUT_NAME, shards_name: str = SHARDS_NAME, codec: str = "gzip"):
+    """
+    Writes every transcript under 'output_name' into shards under 'shards_name'.
+    """
+    writer = ShardWriter(shards_name, codec, keep_existing=False)
+    for episode_file in corpus.episode_files(Path(output_name)):
+        writer.add_file(episode_file, episode_file.read_text().splitlines())
+    writer.save()
+    return writer
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    parser = argparse.ArgumentParser(description="compress the scraped transcripts into one shard per season")
+    parser.add_argument('--xz', action='store_true', help='compress with xz instead of gzip (smaller, slower)')
+    args = parser.parse_args()
+    writer = build_shards(codec="xz" if args.xz else "gzip")
+    print("Wrote %d seasons into %r." % (len(writer.seasons), SHARDS_NAME))
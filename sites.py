@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+"""
+Crawls the transcripts of many wikis at once, each described in a config file (SITES_CONFIG, JSON):
+    {"sites": [{
+        "name": "steven-universe",                  unique name, for --site
+        "root": "https://steven-universe.fandom.com",
+        "output": "output",                         directory of the corpus (default: corpora/<name>)
+        "transcript_suffix": "/Transcript",         appended to an episode's URL for its transcript
+        "transcript_table": "wikitable bgrevo",     class of the transcript <table>
+        "indexes": [{                               pages listing episodes
+            "url": "/wiki/Season_{n}",              relative to root; {n} runs over "numbers", if given
+            "numbers": [1, 5],                      first and last {n}, inclusive
+            "directory": "Season_{n}",              where its episodes are written, as NN-<name>.txt
+            "episode_cells": "td.episode",          CSS selector of the cells holding each episode's link
+            "skip": 0,                              leading cells to ignore
+            "name": "text"                          episode name from the cell's "text" or its link's "title"
+            }],
+        "pages": [{"url": "/wiki/The_Movie", "file": "Movie/Movie.txt"}],   single transcripts
+        "order": ["Season_1", "Movie"],             season directories in canonical order (see corpus.py)
+        "requests_per_second": 4,                   optional rate limit on the site's host
+        "max_per_host": 8                           optional cap on simultaneous jobs against it
+        }]}
+
+Every site's index and transcript fetches share one scheduler (and so one worker pool)
+and one pooled http_client, limited per host.
+Run with:
+    python3 sites.py [--config FILE] [--site NAME ...] [--workers N] [--api] [--incremental | --resume]
+"""
+
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+import argparse
+import json
+import logging
+
+from bs4 import BeautifulSoup
+
+import catalog
+from constants import SITES_CONFIG, MAX_WORKERS, MAX_PER_HOST, LOGGING_FILE
+from manifest import CrawlManifest
+from mwapi import ApiBatchScheduler
+from scheduler import CrawlScheduler
+import http_client
+import scraper
+
+class Site:
+    """
+    One wiki's entry in the sites config.
+    """
+    REQUIRED = ("name", "root", "indexes")
+
+    def __init__(self, definition: dict):
+        """
+        Checks 'definition' and fills in defaults. Raises ValueError if a required field is missing.
+        """
+        missing = [field for field in Site.REQUIRED if field not in definition]
+        if missing:
+            raise ValueError("Site definition %r lacks %s." % (definition.get("name"), ", ".join(missing)))
+        for index in definition["indexes"]:
+            if "url" not in index or "episode_cells" not in index:
+                raise ValueError("An index of site %r lacks url or episode_cells." % definition["name"])
+        self.name = definition["name"]
+        self.root = definition["root"].rstrip("/")
+        self.output = Path(definition.get("output", Path("corpora", self.name)))
+        self.transcript_suffix = definition.get("transcript_suffix", "/Transcript")
+        self.transcript_table = definition.get("transcript_table", scraper.TRANSCRIPT_TABLE_CLASS)
+        self.indexes = definition["indexes"]
+        self.pages = definition.get("pages", [])
+        self.order = definition.get("order", [])
+        self.requests_per_second = definition.get("requests_per_second")
+        self.max_per_host = definition.get("max_per_host")
+        self.host = urlsplit(self.root).netloc
+
+    def index_pages(self):
+        """
+        Yields (urlname, directory, index) for every index page, expanding {n} over its numbers.
+        """
+        for index in self.indexes:
+            first, last = index.get("numbers", (None, None))
+            numbers = [None] if first is None else range(first, last + 1)
+            for number in numbers:
+                yield (urljoin(self.root, index["url"].format(n=number)),
+                    self.output.joinpath(index.get("directory", "").format(n=number)), index)
+
+def load_sites(config_name: str = SITES_CONFIG):
+    """
+    Returns the Site of every definition in the config file 'config_name'.
+    """
+    sites = [Site(definition) for definition in json.loads(Path(config_name).read_text())["sites"]]
+    names = [site.name for site in sites]
+    if len(set(names)) != len(names):
+        raise ValueError("Site names in %r are not unique." % config_name)
+    return sites
+
+def episode_links(page_text: str, index: dict):
+    """
+    Returns (episode_name, href) for every episode cell of an index page, in order.
+    """
+    cells = BeautifulSoup(page_text, "html.parser").select(index["episode_cells"])
+    episodes = []
+    for cell in cells[index.get("skip", 0):]:
+        link = cell if cell.name == "a" else cell.find("a")
+        if link is None or not link.get("href"):
+            continue
+        if index.get("name", "text") == "title":
+            episode_name = link["title"]
+        else:
+            episode_name = cell.text.strip().strip('"')
+        episodes.append((episode_name, link["href"]))
+    return episodes
+
+def scrape_index(site: Site, urlname: str, directory: Path, index: dict, scheduler: CrawlScheduler, manifest: CrawlManifest = None,
+        stores: tuple = ()):
+    """
+    Scrapes the episode list at 'urlname', and queues a job writing each episode into 'directory' (and to 'stores').
+    """
+    logging.info("Scraping %s episode list from %r.", site.name, urlname)
+    episodes = episode_links(http_client.get_text(urlname), index)
+    logging.info("Found (%d) %s episodes at %r.", len(episodes), site.name, urlname)
+    for episode_indexno, (episode_name, href) in enumerate(episodes, start=1):
+        transcript_url = urljoin(site.root, href) + site.transcript_suffix
+        episode_file = directory.joinpath("%02d" % episode_indexno + "-" + episode_name + ".txt")
+        scheduler.submit_episode(transcript_url, scraper.write_episode, transcript_url, episode_file, manifest, stores, site.transcript_table)
+
+def crawl_site(site: Site, scheduler: CrawlScheduler, manifest: CrawlManifest = None, stores: tuple = ()):
+    """
+    Queues every index page and single transcript of 'site' on 'scheduler'. Episodes are also handed to 'stores'.
+    """
+    for urlname, directory, index in site.index_pages():
+        directory.mkdir(parents=True, exist_ok=True)
+        scheduler.submit(urlname, scrape_index, site, urlname, directory, index, scheduler, manifest, stores)
+    for page in site.pages:
+        transcript_url = urljoin(site.root, page["url"]) + site.transcript_suffix
+        output_file = site.output.joinpath(page["file"])
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        scheduler.submit_episode(transcript_url, scraper.write_episode, transcript_url, output_file, manifest, stores, site.transcript_table)
+
+def build_catalogs(sites: list):
+    """
+    Rebuilds the catalog of every site's output directory that exists, walking its tree.
+    """
+    for site in sites:
+        if site.output.is_dir():
+            catalog.build_catalog(str(site.output), site.order)
+
+def crawl_sites(sites: list, scheduler: CrawlScheduler = None, manifest: CrawlManifest = None, stores: dict = None):
+    """
+    Crawls every one of 'sites' concurrently on 'scheduler', applying each site's per-host limits.
+    'stores' maps a site's name to the stores its episodes are also handed to (see scraper.write_episode).
+    A scheduler is created (and waited on) if none is given; then each site's catalog (see catalog.py) is rebuilt too.
+    """
+    if scheduler is None:
+        with CrawlScheduler() as scheduler:
+            crawl_sites(sites, scheduler, manifest, stores)
+        build_catalogs(sites)
+        return
+    for site in sites:
+        if site.max_per_host:
+            scheduler.limit_host(site.host, site.max_per_host)
+        if site.requests_per_second:
+            http_client.default_client.limit_rate(site.host, site.requests_per_second)
+    for site in sites:
+        logging.info("Crawling %s from %r into %r.", site.name, site.root, str(site.output))
+        crawl_site(site, scheduler, manifest, (stores or {}).get(site.name, ()))
+
+def main():
+    """
+    Crawls the sites named on the command line (default: all of them).
+    """
+    parser = argparse.ArgumentParser(description="scrape transcripts from every wiki in a sites config")
+    parser.add_argument('--config', default=SITES_CONFIG, help='sites config (default: %(default)s)')
+    parser.add_argument('--site', action='append', help='only crawl this site (repeatable)')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='crawl threads (default: %(default)s)')
+    parser.add_argument('--per-host', type=int, default=MAX_PER_HOST, help='jobs per host, unless a site sets max_per_host (default: %(default)s)')
+    schedulers = parser.add_mutually_exclusive_group()
+    schedulers.add_argument('--api', action='store_true', help='fetch transcripts in batches through api.php (see mwapi.py)')
+    schedulers.add_argument('--stream', action='store_true', help='parse and write each transcript as it is received, in constant memory')
+    parser.add_argument('--incremental', action='store_true', help='only rewrite new or changed episodes (see manifest.py)')
+    parser.add_argument('--resume', action='store_true', help='like --incremental, and skip episodes written by an interrupted crawl')
+    args = parser.parse_args()
+    sites = load_sites(args.config)
+    if args.site:
+        unknown = set(args.site) - {site.name for site in sites}
+        if unknown:
+            parser.error("unknown sites: %s" % ", ".join(sorted(unknown)))
+        sites = [site for site in sites if site.name in args.site]
+    manifest = CrawlManifest(resume=args.resume) if args.incremental or args.resume else None
+    finished = False
+    try:
+        scheduler_class = ApiBatchScheduler if args.api else scraper.StreamingScheduler if args.stream else CrawlScheduler
+        with scheduler_class(args.workers, args.per_host) as scheduler:
+            crawl_sites(sites, scheduler, manifest)
+        finished = True
+    finally:
+        if manifest is not None:
+            manifest.save(finished)
+        build_catalogs(sites)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    main()
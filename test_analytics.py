@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+"""
+Tests analytics.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import logging
+import os
+import unittest
+
+from fixture_corpus import write_corpus
+import analytics
+import catalog
+from constants import LOGGING_FILE
+
+# its own corpus, with continuation lines and a speaker per season to count
+EPISODES = {
+    "Season_1/01-Gem Glow.txt": "Steven: Cookie Cat!\nGarnet: Steven.\n|: The Gems leave.\nSteven: Wait!\nI want a Cookie Cat too\n",
+    "Season_1/02-Laser Light Cannon.txt": "Amethyst: Steven, it's a cat.\nSteven: Cat cat.\n",
+    "Season_2/01-Full Disclosure.txt": "Connie: Steven?\nSteven: Connie!\n",
+}
+
+class AnalyticsTest(unittest.TestCase):
+    """
+    Defines unit tests for analytics.* methods.
+    """
+
+    def test_build_analytics(self):
+        """
+        Tests the speaker and term counts, continuation lines, and season and episode lookups.
+        """
+        with TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir, "output")
+            write_corpus(output_dir, EPISODES)
+            stats = analytics.build_analytics(output_dir, Path(temp_dir, "shards"))
+        self.assertEqual(stats.seasons, ["Season_1", "Season_2"])
+        self.assertEqual(stats.speaker_totals(), [("Steven", 4, 12), ("Garnet", 1, 1), ("|", 1, 3),
+            ("Amethyst", 1, 4), ("Connie", 1, 1)])
+        self.assertEqual(stats.speaker_totals("2"), [("Steven", 1, 1), ("Connie", 1, 1)])
+        self.assertEqual(stats.episode_speakers("gem glow"), [("Steven", 2, 9), ("Garnet", 1, 1), ("|", 1, 3)])
+        self.assertEqual(stats.term_frequencies("CAT"), {"Season_1": 5, "Season_2": 0})
+        self.assertEqual(stats.term_frequencies("it's"), {"Season_1": 1, "Season_2": 0})
+        self.assertEqual(stats.top_terms(top=2), [("cat", 5), ("steven", 3)])
+        self.assertEqual(stats.top_terms("Season_2", 1), [("connie", 1)])
+        with self.assertRaises(KeyError):
+            stats.season_id("9")
+        with self.assertRaises(KeyError):
+            stats.episode_id("Cheeseburger Backpack")
+
+    def test_load_analytics(self):
+        """
+        Tests that the .npy cache is reused while the corpus is unchanged, and rebuilt once it changes.
+        """
+        with TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir, "output")
+            cache_dir = Path(temp_dir, "analytics")
+            write_corpus(output_dir, EPISODES)
+            built = analytics.load_analytics(output_dir, cache_dir, Path(temp_dir, "shards"))
+            self.assertTrue(cache_dir.joinpath("line_counts.npy").is_file())
+            cached = analytics.load_analytics(output_dir, cache_dir, Path(temp_dir, "shards"))
+            self.assertEqual(cached.checksum, built.checksum)
+            self.assertEqual(cached.speaker_totals(), built.speaker_totals())
+            self.assertEqual(cached.top_terms(top=100), built.top_terms(top=100))
+            output_dir.joinpath("Season_2/01-Full Disclosure.txt").write_text("Connie: Steven?\nConnie: Bye.\n")
+            rebuilt = analytics.load_analytics(output_dir, cache_dir, Path(temp_dir, "shards"))
+            self.assertNotEqual(rebuilt.checksum, built.checksum)
+            self.assertEqual(rebuilt.speaker_totals("2"), [("Connie", 2, 2)])
+            logging.info("Assert: a file rewritten in place under a catalog still invalidates the cache.")
+            catalog.build_catalog(str(output_dir))
+            cached = analytics.load_analytics(output_dir, cache_dir, Path(temp_dir, "shards"))
+            episode_file = output_dir.joinpath("Season_2/01-Full Disclosure.txt")
+            episode_file.write_text("Connie: Steven?\nConnie: Bye.\nConnie: Bye!\n")
+            stat = episode_file.stat()
+            os.utime(episode_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            rewritten = analytics.load_analytics(output_dir, cache_dir, Path(temp_dir, "shards"))
+            self.assertNotEqual(rewritten.checksum, cached.checksum)
+            self.assertEqual(rewritten.speaker_totals("2"), [("Connie", 3, 3)])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+Tests batch.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import csv
+import io
+import json
+import logging
+import re
+import unittest
+
+from fixture_corpus import write_corpus
+import batch
+import query
+from constants import LOGGING_FILE
+
+class BatchTest(unittest.TestCase):
+    """
+    Defines unit tests for batch.* methods, over a small corpus in a temporary directory.
+    """
+
+    def setUp(self):
+        """
+        Writes a small corpus into a temporary output directory.
+        """
+        self.tempdir = TemporaryDirectory()
+        self.output_dir = Path(self.tempdir.name, "output")
+        write_corpus(self.output_dir)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def scan(self, pattern: str):
+        """
+        Runs query.iter_matches over the temporary corpus's files.
+        """
+        none = str(Path(self.tempdir.name, "none"))
+        return list(query.iter_matches(pattern, output_dir=self.output_dir, index_name=none, packed_name=none, shards_name=none))
+
+    def test_search_batch(self):
+        """
+        Tests that each pattern of a batch matches exactly what it matches on its own, overlapping or not.
+        """
+        patterns = ["Cookie Cat", "Cookie", "Cook", "ookie", "Cookie Cat", "Steven", "Steven: Cookie Cat!", "Café ♪", "lapis",
+            "(?i)cookie cat", "light|Other", r"(\w)\1", "(?P<word>Nye)", "^$", "", r"St\w+n:", "(?x) Nye # a comment", "(?a)\\w+é"]
+        results = batch.search_batch(patterns, self.output_dir, str(Path(self.tempdir.name, "none")))
+        for pattern, matches in zip(patterns, results):
+            logging.info("Assert: %r matches the same lines in a batch and on its own.", pattern)
+            self.assertEqual(matches, self.scan(pattern), pattern)
+        with self.assertRaises(re.error):
+            batch.PatternSet(["Cookie", "(unclosed"])
+
+    def test_format_results(self):
+        """
+        Tests the JSON and CSV output, and reading a pattern file.
+        """
+        pattern_file = Path(self.tempdir.name, "patterns.txt")
+        pattern_file.write_text("# catchphrases\nCookie Cat\n\nNye\n")
+        patterns = batch.read_patterns(pattern_file)
+        self.assertEqual(patterns, ["Cookie Cat", "Nye"])
+        results = batch.search_batch(patterns, self.output_dir)
+        as_json = json.loads(batch.format_results(patterns, results, "json"))
+        self.assertEqual([(entry["pattern"], entry["count"]) for entry in as_json["patterns"]], [("Cookie Cat", 2), ("Nye", 1)])
+        self.assertEqual(as_json["patterns"][1]["matches"][0]["span"], [8, 11])
+        rows = list(csv.reader(io.StringIO(batch.format_results(patterns, results, "csv"))))
+        self.assertEqual(rows[0], ["pattern", "file", "lineno", "start", "end", "line"])
+        self.assertEqual(rows[-1], ["Nye", str(self.output_dir.joinpath("Season_1/01-Gem Glow.txt")), "3", "8", "11", "Garnet: Nye."])
+        with self.assertRaises(ValueError):
+            batch.format_results(patterns, results, "xml")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
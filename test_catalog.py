@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""
+Tests catalog.py, and its use by corpus.episode_files and renamer.py.
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+import json
+import logging
+import os
+import unittest
+
+from fixture_corpus import BACKPACK, EPISODES, write_corpus
+import catalog
+import corpus
+import renamer
+from constants import CATALOG_NAME, LOGGING_FILE
+
+class CatalogTest(unittest.TestCase):
+    """
+    Defines unit tests for catalog.CatalogBuilder, over a small corpus in a temporary directory.
+    """
+
+    def setUp(self):
+        """
+        Writes a small corpus into a temporary output directory.
+        """
+        self.tempdir = TemporaryDirectory()
+        self.output_dir = Path(self.tempdir.name, "output")
+        write_corpus(self.output_dir, {**EPISODES, **BACKPACK})
+        self.walked = list(corpus.episode_files(self.output_dir))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_catalog(self):
+        """
+        Tests that the catalog lists episodes in canonical order, and is read instead of walking the tree while current.
+        """
+        # so the new file below changes it, however coarse the file system's timestamps
+        os.utime(self.output_dir.joinpath("Season_2"), ns=(0, 0))
+        catalog.build_catalog(str(self.output_dir))
+        entries = corpus.read_catalog(self.output_dir)
+        self.assertEqual([entry["path"] for entry in entries], [str(path.relative_to(self.output_dir)) for path in self.walked])
+        self.assertEqual(entries[0], {"season": "Season_1", "ordinal": 1, "title": "Gem Glow", "path": "Season_1/01-Gem Glow.txt",
+            "lines": 3, "bytes": 48, "mtime_ns": self.output_dir.joinpath("Season_1", "01-Gem Glow.txt").stat().st_mtime_ns,
+            "checksum": entries[0]["checksum"]})
+        self.assertEqual(entries[-1]["title"], "Movie")
+        with patch("pathlib.Path.iterdir", side_effect=AssertionError("walked the tree")):
+            self.assertEqual(list(corpus.episode_files(self.output_dir)), self.walked)
+        logging.info("Assert: a new episode file makes the catalog stale.")
+        self.output_dir.joinpath("Season_2", "02-Lion 3.txt").write_text("Steven: Lion!")
+        self.assertIsNone(corpus.read_catalog(self.output_dir))
+        self.assertEqual(len(list(corpus.episode_files(self.output_dir))), len(self.walked) + 1)
+
+    def test_builder(self):
+        """
+        Tests that a builder keeps the entries not re-added while their files exist, and replaces those that are.
+        """
+        catalog.build_catalog(str(self.output_dir))
+        episode_file = self.output_dir.joinpath("Season_1", "01-Gem Glow.txt")
+        episode_file.write_text("Lapis: Hi.")
+        self.output_dir.joinpath("Movie", "Movie.txt").unlink()
+        builder = catalog.CatalogBuilder(self.output_dir)
+        builder.add_episode(episode_file, [("Lapis", "Hi.")])
+        builder.save()
+        entries = corpus.read_catalog(self.output_dir)
+        self.assertEqual([entry["path"] for entry in entries], [str(path.relative_to(self.output_dir)) for path in self.walked[:-1]])
+        self.assertEqual((entries[0]["lines"], entries[0]["bytes"]), (1, 10))
+        self.assertEqual(json.loads(self.output_dir.joinpath(CATALOG_NAME).read_text())["version"], corpus.CATALOG_VERSION)
+
+    def test_partial_catalog(self):
+        """
+        Tests that a catalog not listing every file on disk is not read, and that build_catalog
+        lists them all, rereading only the files rewritten since the last catalog.
+        """
+        episode_file = self.output_dir.joinpath("Season_1", "01-Gem Glow.txt")
+        builder = catalog.CatalogBuilder(self.output_dir, keep_existing=False)
+        builder.add_file(episode_file)
+        builder.save()
+        self.assertIsNone(corpus.read_catalog(self.output_dir))
+        self.assertEqual(list(corpus.episode_files(self.output_dir)), self.walked)
+        catalog.build_catalog(str(self.output_dir))
+        self.assertEqual(len(corpus.read_catalog(self.output_dir, verify_files=True)), len(self.walked))
+        logging.info("Assert: an episode rewritten in place is caught by verify_files, and reread by build_catalog alone.")
+        episode_file.write_text("Lapis: Hi.")
+        stat = episode_file.stat()
+        os.utime(episode_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(len(corpus.read_catalog(self.output_dir)), len(self.walked))
+        self.assertIsNone(corpus.read_catalog(self.output_dir, verify_files=True))
+        with patch("catalog.CatalogBuilder.add_file", autospec=True, side_effect=catalog.CatalogBuilder.add_file) as mock_add:
+            catalog.build_catalog(str(self.output_dir))
+        self.assertEqual([call.args[1] for call in mock_add.call_args_list], [episode_file])
+        entries = corpus.read_catalog(self.output_dir, verify_files=True)
+        self.assertEqual((entries[0]["lines"], entries[0]["bytes"]), (1, 10))
+
+    def test_temp_files(self):
+        """
+        Tests that temporary files left beside the episodes by an interrupted write are not listed, catalogued or not.
+        """
+        self.output_dir.joinpath("Season_1", "01-Gem Glow.txt.x1y2z3.tmp").write_text("Steven: Cookie")
+        self.assertEqual(list(corpus.episode_files(self.output_dir)), self.walked)
+        catalog.build_catalog(str(self.output_dir))
+        self.assertEqual(len(corpus.read_catalog(self.output_dir, verify_files=True)), len(self.walked))
+        self.assertEqual(list(corpus.episode_files(self.output_dir)), self.walked)
+
+    def test_renamer(self):
+        """
+        Tests that renamer.py pads episode numbers, and rewrites the catalog to match.
+        """
+        self.output_dir.joinpath("Season_1", "01-Gem Glow.txt").rename(self.output_dir.joinpath("Season_1", "1-Gem Glow.txt"))
+        catalog.build_catalog(str(self.output_dir))
+        self.assertEqual(renamer.rename_episodes(self.output_dir), 1)
+        self.assertEqual(renamer.rename_episodes(self.output_dir), 0)
+        self.assertEqual([entry["path"] for entry in corpus.read_catalog(self.output_dir)][0], "Season_1/01-Gem Glow.txt")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
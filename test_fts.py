@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""
+Tests fts.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import logging
+import unittest
+
+import fts
+from constants import LOGGING_FILE
+
+class FtsTest(unittest.TestCase):
+    """
+    Defines unit tests for fts.TranscriptDatabase, on a database in a temporary directory.
+    """
+
+    def setUp(self):
+        """
+        Stores two episodes.
+        """
+        self.tempdir = TemporaryDirectory()
+        self.database = fts.TranscriptDatabase(Path(self.tempdir.name, "transcripts.sqlite3"))
+        self.database.add_episode(Path("output", "Season_1", "01-Gem Glow.txt"), [
+            ("Steven", "Cookie Cat! He's a pet for your tummy!"),
+            (None, "Steven runs to the temple"),
+            ("Garnet", "Cookie cats are discontinued."),
+            ])
+        self.database.add_episode(Path("output", "Movie", "Movie.txt"), [
+            ("Spinel", "Other friends!\nCould've been a set of other friends!"),
+            ("Steven", "Hi, Spinel."),
+            ])
+
+    def tearDown(self):
+        self.database.close()
+        self.tempdir.cleanup()
+
+    def test_search(self):
+        """
+        Tests word, phrase, prefix, boolean and column queries.
+        """
+        paths = lambda rows: [(path, lineno) for path, lineno, _, _ in rows]
+        self.assertEqual(len(self.database.search("cookie")), 2)
+        self.assertEqual(paths(self.database.search('"cookie cat"')), [("Season_1/01-Gem Glow.txt", 1)])
+        self.assertEqual(len(self.database.search("cook*")), 2)
+        self.assertEqual(paths(self.database.search("cookie NOT tummy")), [("Season_1/01-Gem Glow.txt", 3)])
+        self.assertEqual(paths(self.database.search("speaker:steven spinel")), [("Movie/Movie.txt", 3)])
+        self.assertEqual(self.database.search("temple")[0][2], None)
+        self.assertEqual(sorted(paths(self.database.search("other OR hi"))), [("Movie/Movie.txt", 1), ("Movie/Movie.txt", 3)])
+        self.assertEqual(len(self.database.search("cookie", limit=1)), 1)
+
+    def test_replace_episode(self):
+        """
+        Tests that storing an episode again replaces its lines in the full-text index.
+        """
+        self.database.add_episode(Path("output", "Season_1", "01-Gem Glow.txt"), [("Steven", "Lion!")])
+        self.assertEqual(self.database.search("cookie"), [])
+        self.assertEqual(self.database.search("lion"), [("Season_1/01-Gem Glow.txt", 1, "Steven", "Lion!")])
+
+    def test_load_corpus(self):
+        """
+        Tests that a database loaded from the files holds the rows the scraper gives a database, multi-line dialogue included.
+        """
+        output_dir = Path(self.tempdir.name, "output")
+        output_dir.joinpath("Movie").mkdir(parents=True)
+        output_dir.joinpath("Movie", "Movie.txt").write_text("Spinel: Other friends!\nCould've been a set of other friends!\nSteven: Hi, Spinel.")
+        database = fts.load_corpus(str(output_dir), Path(self.tempdir.name, "loaded.sqlite3"))
+        try:
+            for query in ("friends", "spinel", "hi"):
+                logging.info("Assert: %r finds the same rows in the loaded database.", query)
+                self.assertEqual(database.search(query), self.database.search(query), query)
+        finally:
+            database.close()
+
+    def test_split_line(self):
+        """
+        Tests split_line as the inverse of scraper.format_linelist.
+        """
+        self.assertEqual(fts.split_line("|: dances fervently"), (None, "dances fervently"))
+        self.assertEqual(fts.split_line("Ronald: We ain't gonna do magic, then?"), ("Ronald", "We ain't gonna do magic, then?"))
+        self.assertEqual(fts.split_line("continued dialogue"), (None, "continued dialogue"))
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
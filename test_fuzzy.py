@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+"""
+Tests fuzzy.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+import io
+import logging
+import os
+import random
+import unittest
+
+import fuzzy
+import query
+import trigram
+from constants import LOGGING_FILE
+
+def naive_distance(pattern: str, text: str):
+    """
+    Returns the least edit distance between 'pattern' and any substring of 'text', by dynamic programming.
+    """
+    row = [0] * (len(text) + 1)
+    for pattern_index, pattern_char in enumerate(pattern, start=1):
+        previous, row = row, [pattern_index] + [0] * len(text)
+        for text_index, text_char in enumerate(text, start=1):
+            row[text_index] = min(previous[text_index] + 1, row[text_index - 1] + 1,
+                previous[text_index - 1] + (pattern_char != text_char))
+    return min(row)
+
+class FuzzyTest(unittest.TestCase):
+    """
+    Defines unit tests for fuzzy.* methods.
+    """
+
+    def test_myers_search(self):
+        """
+        Tests the bit-parallel distance against dynamic programming, and the spans it reports.
+        """
+        rng = random.Random(20)
+        for _ in range(500):
+            pattern = "".join(rng.choice("abc") for _ in range(rng.randint(1, 12)))
+            text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 30)))
+            distance, span = fuzzy.fuzzy_span(pattern, text)
+            self.assertEqual(distance, naive_distance(pattern, text), (pattern, text))
+            if distance < len(pattern):
+                self.assertEqual(naive_distance(pattern, text[span[0]:span[1]]), distance, (pattern, text, span))
+        self.assertEqual(fuzzy.fuzzy_span("cookie cat", "steven: cookie kat!"), (1, (8, 18)))
+        self.assertEqual(fuzzy.fuzzy_span("cookie cat", "steven: cooki cat!"), (1, (8, 17)))
+        self.assertEqual(fuzzy.myers_search("cat", ""), (3, 0))
+
+    def test_iter_fuzzy_matches(self):
+        """
+        Tests that the q-gram filters (with and without a trigram index) lose no line within the distance.
+        """
+        words = "cookie cat steven garnet pearl amethyst cookei catt stevne gem fusion".split()
+        rng = random.Random(21)
+        with TemporaryDirectory() as tempdir:
+            output_dir = Path(tempdir, "output")
+            lines = {}
+            for episode_num in range(1, 6):
+                episode_file = output_dir.joinpath("Season_1", "%02d-Episode %d.txt" % (episode_num, episode_num))
+                episode_file.parent.mkdir(parents=True, exist_ok=True)
+                lines[episode_file] = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 6))) for _ in range(40)]
+                episode_file.write_text("\n".join(lines[episode_file]))
+            index_name = str(Path(tempdir, "trigram_index.json"))
+            for query in ("Cookie Cat", "steven garnet", "ab"):
+                for max_distance in range(4):
+                    expected = [(episode_file, lineno, distance)
+                        for episode_file, episode_lines in lines.items() for lineno, line in enumerate(episode_lines, start=1)
+                        for distance in [naive_distance(query.casefold(), line)] if distance <= max_distance]
+                    for use_index in (False, True):
+                        if use_index:
+                            trigram.build_index(str(output_dir), index_name)
+                        found = fuzzy.iter_fuzzy_matches(query, max_distance, output_dir=output_dir,
+                            index_name=index_name if use_index else str(Path(tempdir, "none.json")))
+                        logging.info("Assert: %r within %d edits matches as by dynamic programming.", query, max_distance)
+                        self.assertEqual([(episode_file, lineno, distance) for episode_file, lineno, _, _, distance in found],
+                            expected, (query, max_distance, use_index))
+            self.assertEqual(len(list(fuzzy.iter_fuzzy_matches("cookie", 1, max_matches=3, output_dir=output_dir))), 3)
+            with self.assertRaises(ValueError):
+                fuzzy.FuzzyQuery("cookie", -1)
+
+    def test_negative_distance(self):
+        """
+        Tests that 'query.py --fuzzy' with a negative distance prints the error instead of failing, cached or not.
+        """
+        working_dir = os.getcwd()
+        with TemporaryDirectory() as tempdir:
+            os.chdir(tempdir)
+            try:
+                for cache_args in (["--no-cache"], []):
+                    logging.info("Assert: a negative --fuzzy is reported (with %r).", cache_args)
+                    with patch("sys.argv", ["query.py", "--fuzzy", "-1", *cache_args, "ab"]), patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                        with self.assertRaises(SystemExit):
+                            query.main()
+                    self.assertIn("must not be negative", stdout.getvalue())
+            finally:
+                os.chdir(working_dir)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+"""
+Tests http_client.py against a local stand-in HTTP server.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest.mock import patch
+import logging
+import os
+import unittest
+
+import requests as r
+
+import http_client
+from constants import LOGGING_FILE
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves '/page' with an ETag, '/plain' without one, and 404 for anything else.
+    '/flaky' answers 503 'failures' times before serving the page; '/throttled' always answers 429.
+    Counts the full (200) responses sent, and all requests.
+    """
+    body = b"<html><body>transcript</body></html>"
+    etag = '"v1"'
+    full_responses = 0
+    requests = 0
+    failures = 0
+
+    def do_GET(self):
+        StandInHandler.requests += 1
+        if self.path == "/throttled" or (self.path == "/flaky" and StandInHandler.failures > 0):
+            StandInHandler.failures -= 1
+            self.send_response(429 if self.path == "/throttled" else 503)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/flaky":
+            self.path = "/plain"
+        if self.path == "/page" and self.headers.get("If-None-Match") == StandInHandler.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        if self.path not in ("/page", "/plain"):
+            self.send_error(404)
+            return
+        StandInHandler.full_responses += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(StandInHandler.body)))
+        if self.path == "/page":
+            self.send_header("ETag", StandInHandler.etag)
+        self.end_headers()
+        self.wfile.write(StandInHandler.body)
+
+    def log_message(self, *args):
+        pass
+
+class HttpClientTest(unittest.TestCase):
+    """
+    Defines unit tests for http_client.HttpClient.
+    """
+
+    def setUp(self):
+        """
+        Starts the stand-in server, and a client whose cache lives in a temporary directory.
+        """
+        StandInHandler.full_responses = 0
+        StandInHandler.requests = 0
+        StandInHandler.etag = '"v1"'
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.root = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self.cache_dir = TemporaryDirectory()
+        self.client = http_client.HttpClient(cache_dir=self.cache_dir.name)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.cache_dir.cleanup()
+
+    def test_revalidate(self):
+        """
+        Tests that a cached page is revalidated with a 304, and refetched once its ETag changes.
+        """
+        text, not_modified = self.client.fetch(self.root + "/page")
+        self.assertEqual(text, StandInHandler.body.decode())
+        self.assertFalse(not_modified)
+        text, not_modified = self.client.fetch(self.root + "/page")
+        self.assertEqual(text, StandInHandler.body.decode())
+        self.assertTrue(not_modified)
+        self.assertEqual(StandInHandler.full_responses, 1)
+        # a fresh client reuses the on-disk cache
+        fresh_client = http_client.HttpClient(cache_dir=self.cache_dir.name)
+        self.assertTrue(fresh_client.fetch(self.root + "/page")[1])
+        StandInHandler.etag = '"v2"'
+        self.assertFalse(self.client.fetch(self.root + "/page")[1])
+        self.assertEqual(StandInHandler.full_responses, 2)
+
+    def test_uncacheable(self):
+        """
+        Tests that pages without validators are always refetched, and that errors are raised.
+        """
+        self.assertEqual(self.client.get_text(self.root + "/plain"), StandInHandler.body.decode())
+        self.assertFalse(self.client.fetch(self.root + "/plain")[1])
+        self.assertEqual(StandInHandler.full_responses, 2)
+        with self.assertRaises(r.HTTPError):
+            self.client.fetch(self.root + "/missing")
+
+    def test_retry(self):
+        """
+        Tests that failed requests are retried with backoff, that throttling slows the host down,
+        and that client errors are not retried.
+        """
+        client = http_client.HttpClient(cache_dir=None, max_retries=3, backoff=0.001)
+        StandInHandler.failures = 2
+        self.assertEqual(client.get_text(self.root + "/flaky"), StandInHandler.body.decode())
+        self.assertEqual(StandInHandler.requests, 3)
+        host = self.root.split("//")[1]
+        self.assertIn(host, client._throttles)
+        StandInHandler.requests = 0
+        with self.assertRaises(r.HTTPError):
+            client.fetch(self.root + "/throttled")
+        self.assertEqual(StandInHandler.requests, 4)
+        self.assertGreater(client._throttles[host][0], http_client.MIN_THROTTLE)
+        StandInHandler.requests = 0
+        with self.assertRaises(r.HTTPError):
+            client.fetch(self.root + "/missing")
+        self.assertEqual(StandInHandler.requests, 1)
+        # successes relax the throttle until it is gone
+        for _ in range(8):
+            client.fetch(self.root + "/plain")
+        self.assertNotIn(host, client._throttles)
+
+    def test_iter_text(self):
+        """
+        Tests that a streamed page arrives in chunks, is cached as it streams, and is then served from the cache on a 304.
+        """
+        chunks = list(self.client.iter_text(self.root + "/page", chunk_size=8))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), StandInHandler.body.decode())
+        self.assertEqual(self.client.fetch(self.root + "/page"), (StandInHandler.body.decode(), True))
+        self.assertEqual("".join(self.client.iter_text(self.root + "/page", chunk_size=8)), StandInHandler.body.decode())
+        self.assertEqual(StandInHandler.full_responses, 1)
+        self.assertEqual("".join(self.client.iter_text(self.root + "/plain")), StandInHandler.body.decode())
+        with self.assertRaises(r.HTTPError):
+            list(self.client.iter_text(self.root + "/missing"))
+
+    def test_write_cache(self):
+        """
+        Tests that concurrent writes of one cached page leave no temporary files, and replace the metadata last.
+        """
+        urlname = self.root + "/page"
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda version: self.client._write_cache(urlname, {"url": urlname, "etag": '"v%d"' % version},
+                "body %d" % version), range(32)))
+        self.assertEqual(sorted(path.suffix for path in Path(self.cache_dir.name).iterdir()), [".html", ".json"])
+        _, text = self.client._read_cache(urlname)
+        self.assertTrue(text.startswith("body "))
+        with patch("os.replace", wraps=os.replace) as mockreplace:
+            self.client._write_cache(urlname, {"url": urlname, "etag": '"v1"'}, "body")
+        self.assertEqual([Path(target).suffix for _, target in (call.args for call in mockreplace.call_args_list)], [".html", ".json"])
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
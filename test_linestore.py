@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+"""
+Tests linestore.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import logging
+import unittest
+
+import linestore
+from constants import LOGGING_FILE
+
+class LineStoreTest(unittest.TestCase):
+    """
+    Defines unit tests for linestore.LineStoreBuilder and linestore.LineStore, on a store in a temporary directory.
+    """
+
+    def setUp(self):
+        """
+        Builds a store of three episodes, added out of order.
+        """
+        self.tempdir = TemporaryDirectory()
+        self.store_file = Path(self.tempdir.name, "linestore.bin")
+        builder = linestore.LineStoreBuilder(self.store_file)
+        builder.add_episode(Path("output", "Movie", "Movie.txt"), [
+            ("Spinel", "Other friends!\nCould've been a set of other friends!"),
+            ("Steven", "Hi, Spinel."),
+            ])
+        builder.add_episode(Path("output", "Season_1", "02-Laser Light Cannon.txt"), [
+            ("Pearl", "The light cannon."),
+            ("Garnet", "Steven, the cannon."),
+            ])
+        builder.add_episode(Path("output", "Season_1", "01-Gem Glow.txt"), [
+            ("Steven", "Cookie Cat!"),
+            (None, "Steven runs to the temple"),
+            ("Garnet", "Cookie cats are discontinued."),
+            ])
+        builder.save()
+        self.store = linestore.LineStore(self.store_file)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_layout(self):
+        """
+        Tests that episodes are stored in canonical order, with interned speakers and file line numbers.
+        """
+        self.assertEqual(len(self.store), 7)
+        self.assertEqual([episode[3] for episode in self.store.episodes],
+            ["Season_1/01-Gem Glow.txt", "Season_1/02-Laser Light Cannon.txt", "Movie/Movie.txt"])
+        self.assertEqual(self.store.speakers, ["Steven", "Garnet", "Pearl", "Spinel"])
+        self.assertEqual(self.store.speaker(1), None)
+        self.assertEqual(self.store.dialogue(5), "Other friends!\nCould've been a set of other friends!")
+        self.assertEqual(list(self.store.linenos[5:]), [1, 3])
+
+    def test_search(self):
+        """
+        Tests the speaker, season and episode filters.
+        """
+        paths = lambda results: [(path, lineno) for path, lineno, _, _ in results]
+        self.assertEqual(paths(self.store.search("(?i)cannon", speaker="garnet")), [("Season_1/02-Laser Light Cannon.txt", 2)])
+        self.assertEqual(paths(self.store.search("Steven", season="1")), [("Season_1/01-Gem Glow.txt", 2), ("Season_1/02-Laser Light Cannon.txt", 2)])
+        self.assertEqual(paths(self.store.search("", season="Movie", speaker="Steven")), [("Movie/Movie.txt", 3)])
+        self.assertEqual(paths(self.store.search("Cookie", episode="gem glow")), [("Season_1/01-Gem Glow.txt", 1), ("Season_1/01-Gem Glow.txt", 3)])
+        self.assertEqual(paths(self.store.search("", season="Season_1", episode="2", speaker="Pearl")), [("Season_1/02-Laser Light Cannon.txt", 1)])
+        self.assertEqual(list(self.store.search("", speaker="Lapis")), [])
+
+    def test_keep_existing(self):
+        """
+        Tests that a builder keeps the episodes of an existing store that it is not given again.
+        """
+        builder = linestore.LineStoreBuilder(self.store_file)
+        builder.add_episode(Path("output", "Movie", "Movie.txt"), [("Steven", "Hi.")])
+        builder.save()
+        store = linestore.LineStore(self.store_file)
+        self.assertEqual(len(store), 6)
+        self.assertEqual(list(store.search("", season="Movie")), [("Movie/Movie.txt", 1, "Steven", "Hi.")])
+
+    def test_build_linestore(self):
+        """
+        Tests that a store built from the files holds the rows the scraper gives a store, multi-line dialogue included.
+        """
+        output_dir = Path(self.tempdir.name, "output")
+        output_dir.joinpath("Movie").mkdir(parents=True)
+        output_dir.joinpath("Movie", "Movie.txt").write_text("Spinel: Other friends!\nCould've been a set of other friends!\nSteven: Hi, Spinel.")
+        store = linestore.build_linestore(str(output_dir), str(Path(self.tempdir.name, "built.bin")))
+        self.assertEqual(list(store.search("", season="Movie")), list(self.store.search("", season="Movie")))
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+"""
+Tests metrics.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+import cProfile
+import logging
+import pstats
+import time
+import unittest
+
+from scheduler import CrawlScheduler
+import metrics
+import query
+import scraper
+from constants import LOGGING_FILE
+
+class MetricsTest(unittest.TestCase):
+    """
+    Defines unit tests for metrics.* methods.
+    """
+
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_disabled(self):
+        """
+        Tests that nothing is recorded while metrics are off.
+        """
+        with patch.object(metrics, "_enabled", False):
+            with metrics.timer("parse"):
+                pass
+            metrics.count("lines_scraped", 3)
+        self.assertEqual(metrics.summary(), {"stages": {}, "counters": {}})
+
+    def test_enabled(self):
+        """
+        Tests that stages and counters are recorded by the instrumented scraper functions.
+        """
+        with patch.object(metrics, "_enabled", True):
+            line_list = scraper.parse_transcript("<table class='wikitable bgrevo'><tr><th>A</th></tr><tr><th>Ronald</th><td>Ha!</td></tr></table>")
+            scraper.format_linelist(line_list)
+            scraper.format_linelist(line_list)
+        summary = metrics.summary()
+        logging.info("metrics.summary() := %r", summary)
+        self.assertEqual(summary["stages"]["parse"]["calls"], 1)
+        self.assertEqual(summary["stages"]["format"]["calls"], 2)
+        self.assertGreaterEqual(summary["stages"]["format"]["max_seconds"], summary["stages"]["format"]["mean_seconds"])
+        self.assertEqual(summary["counters"], {"lines_scraped": 1})
+
+    def test_profiled_job(self):
+        """
+        Tests that crawl jobs run, and are profiled, while the main thread is being profiled.
+        """
+        line_list = [("Ronald", "Ha!"), (None, "dances")]
+        with TemporaryDirectory() as temp_dir:
+            profile_path = Path(temp_dir, "crawl.prof")
+            with patch.object(metrics, "_profile_path", str(profile_path)), patch.object(metrics, "_profiles", []), \
+                    patch.object(metrics, "_json_path", None):
+                # as enable() does
+                main_profile = cProfile.Profile()
+                main_profile.enable()
+                metrics._profiles.append(main_profile)
+                try:
+                    with CrawlScheduler(max_workers=2) as scheduler:
+                        future = scheduler.submit("https://example.com/a", scraper.format_linelist, line_list)
+                finally:
+                    metrics.dump()
+            self.assertEqual(future.result(), "Ronald: Ha!\n|: dances")
+            profiled_functions = {function_name for _, _, function_name in pstats.Stats(str(profile_path)).stats}
+            self.assertIn("format_linelist", profiled_functions)
+
+    def test_scan_timer(self):
+        """
+        Tests that iter_matches yields as it scans, and that the time its caller spends between matches is not scan time.
+        """
+        with TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir, "output")
+            episode_file = output_dir.joinpath("Season_1", "01-Gem Glow.txt")
+            episode_file.parent.mkdir(parents=True)
+            episode_file.write_text("Steven: Cookie Cat!\nGarnet: Steven.\nPearl: Steven!")
+            with patch.object(metrics, "_enabled", True):
+                matches = query.iter_matches("Steven", use_index=False, output_dir=output_dir)
+                self.assertEqual(next(matches)[1], 1)
+                self.assertNotIn("matches", metrics.summary()["counters"])
+                time.sleep(0.2)
+                self.assertEqual([lineno for _, lineno, _, _ in matches], [2, 3])
+        summary = metrics.summary()
+        self.assertEqual(summary["counters"]["matches"], 3)
+        self.assertLess(summary["stages"]["scan"]["total_seconds"], 0.2)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+"""
+Tests mwapi.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
+import json
+import logging
+import os
+import unittest
+
+from fixture_server import WikiFixtureServer, episode_name, transcript_page, transcript_wikitext
+from manifest import CrawlManifest
+from mwapi import ApiBatchScheduler, page_title, parse_wikitext_transcript, query_revisions
+from scheduler import CrawlScheduler
+import benchmark
+import mwapi
+import scraper
+from constants import LOGGING_FILE, MANIFEST_NAME, CATALOG_NAME, SQLITE_NAME
+
+class MwapiTest(unittest.TestCase):
+    """
+    Defines unit tests for mwapi.py, against a generated wiki (and its api.php) served locally.
+    """
+
+    def crawl(self, scheduler, root: str, output_dir: Path, manifest: CrawlManifest = None, stores: tuple = ()):
+        """
+        Crawls every entry point into 'output_dir' through 'scheduler'.
+        Returns {relative path: contents} of the files written.
+        """
+        with benchmark.pointed_at(root, str(output_dir)):
+            with scheduler:
+                scraper.scrape_episodes(scheduler, manifest, stores, num_seasons=2)
+                scraper.scrape_movie(scheduler, manifest, stores)
+                scraper.scrape_future(scheduler, manifest, stores)
+                scraper.scrape_shorts(scheduler, manifest, stores)
+        return {str(path.relative_to(output_dir)): path.read_text() for path in output_dir.glob("*/*.txt")}
+
+    def test_parse_wikitext_transcript(self):
+        """
+        Tests that the wikitext of a transcript parses into what its HTML does, and that cell markup is stripped.
+        """
+        name = episode_name(1, 1)
+        self.assertEqual(parse_wikitext_transcript(transcript_wikitext(name, 50)), scraper.parse_transcript(transcript_page(name, 50)))
+        wikitext = "\n".join([
+            '{| class="wikitable"',
+            "|Not this table",
+            "|}",
+            '{| class="wikitable bgrevo"',
+            "! Character !! Dialogue",
+            "|-",
+            '! style="color:red" | [[Steven Universe|Steven]]',
+            "| ''(Gasps)'' I'm a [[Gem]]!{{Ref|ep}}<br />",
+            "|-",
+            '| colspan="2" | <i>[Scene &amp; setting]</i>',
+            "|-",
+            "!Pearl",
+            "| multi-line",
+            "dialogue",
+            "|-",
+            "!Garnet",
+            "|}",
+            ])
+        self.assertEqual(parse_wikitext_transcript(wikitext), [
+            ("Steven", "(Gasps) I'm a Gem!"),
+            (None, "[Scene & setting]"),
+            ("Pearl", "multi-line\ndialogue"),
+            ("Garnet", ""),
+            ])
+
+    def test_same_output(self):
+        """
+        Tests that crawling through api.php writes exactly what crawling the HTML pages does, in fewer requests.
+        """
+        with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons=2, num_episodes=4, num_lines=20) as server:
+            expected = self.crawl(CrawlScheduler(max_workers=4), server.root, Path(tempdir, "html"))
+            html_requests = server.requests_served
+            written = self.crawl(ApiBatchScheduler(max_workers=4, batch_size=3), server.root, Path(tempdir, "api"))
+            api_requests = server.requests_served - html_requests
+        self.assertEqual(len(expected), 2 * 4 + 1 + 4 + 4)
+        self.assertEqual(written, expected)
+        # 4 index pages, and 17 transcripts in batches of at most 3 from 4 index jobs and the Movie
+        self.assertLessEqual(api_requests, 4 + 2 + 2 + 2 + 2 + 1)
+
+    def test_incremental(self):
+        """
+        Tests that only pages with a new revision are fetched again, and that missing pages are reported.
+        """
+        with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons=2, num_episodes=3, num_lines=5) as server:
+            output_dir = Path(tempdir, "output")
+            manifest = CrawlManifest(Path(tempdir, "manifest.json"))
+            self.crawl(ApiBatchScheduler(), server.root, output_dir, manifest)
+            changed_file = output_dir.joinpath("Season_1", "01-%s.txt" % episode_name(1, 1))
+            changed_file.write_text("stale")
+            unchanged_file = output_dir.joinpath("Season_1", "02-%s.txt" % episode_name(1, 2))
+            mtime = unchanged_file.stat().st_mtime_ns
+            server.revisions[episode_name(1, 1) + "/Transcript"] += 1
+            store = Mock(spec=["add_episode"])
+            written = self.crawl(ApiBatchScheduler(), server.root, output_dir, manifest, (store,))
+            self.assertNotEqual(changed_file.read_text(), "stale")
+            self.assertEqual(unchanged_file.stat().st_mtime_ns, mtime)
+            logging.info("Assert: a fresh store is given every episode, skipped or not.")
+            stored = {str(episode_file.relative_to(output_dir)): line_list for (episode_file, line_list), _ in store.add_episode.call_args_list}
+            self.assertEqual(stored, {relative_path: scraper.read_linelist(output_dir.joinpath(relative_path)) for relative_path in written})
+
+            with benchmark.pointed_at(server.root, str(output_dir)):
+                titles = [page_title(server.root + "/wiki/Short_1/Transcript"), "No such page"]
+                self.assertEqual(list(query_revisions(server.root + "/api.php", titles, content=False)), [titles[0]])
+                with self.assertRaises(LookupError):
+                    with ApiBatchScheduler() as scheduler:
+                        scheduler.submit_episode(server.root, scraper.write_episode, server.root + "/wiki/No_such_page", output_dir.joinpath("missing.txt"))
+                        scraper.scrape_movie(scheduler)
+            self.assertTrue(output_dir.joinpath("Movie", "Movie.txt").exists())
+            self.assertFalse(output_dir.joinpath("missing.txt").exists())
+
+    def test_main(self):
+        """
+        Tests that mwapi.main keeps a manifest, feeds the stores asked for, and writes the catalog, as scraper.main does.
+        """
+        working_dir = os.getcwd()
+        with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons=5, num_episodes=1, num_lines=3) as server:
+            os.chdir(tempdir)
+            try:
+                with benchmark.pointed_at(server.root, "output"), patch("sys.argv", ["mwapi.py", "--resume", "--sqlite"]):
+                    mwapi.main()
+                written = sorted(str(path.relative_to("output")) for path in Path("output").glob("*/*.txt"))
+                catalogued = [entry["path"] for entry in json.loads(Path("output", CATALOG_NAME).read_text())["episodes"]]
+                self.assertEqual(len(written), 5)
+                self.assertEqual(sorted(catalogued), written)
+                self.assertTrue(Path(MANIFEST_NAME).is_file())
+                self.assertTrue(Path(SQLITE_NAME).is_file())
+            finally:
+                os.chdir(working_dir)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+"""
+Tests packed.py, and its use by query.iter_matches.
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+import logging
+import os
+import unittest
+
+from fixture_corpus import write_corpus
+import catalog
+import corpus
+import packed
+import query
+import trigram
+from constants import LOGGING_FILE
+
+class PackedTest(unittest.TestCase):
+    """
+    Defines unit tests for packed.* methods, over a small corpus in a temporary directory.
+    """
+
+    def setUp(self):
+        """
+        Writes a small corpus into a temporary output directory.
+        """
+        self.tempdir = TemporaryDirectory()
+        self.output_dir = Path(self.tempdir.name, "output")
+        self.packed_name = str(Path(self.tempdir.name, "transcripts.pack"))
+        write_corpus(self.output_dir)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def search(self, pattern: str, use_index: bool, **limits):
+        """
+        Runs query.iter_matches over the temporary corpus, with or without the packed corpus.
+        """
+        return list(query.iter_matches(pattern, use_index=use_index, output_dir=self.output_dir,
+            index_name=str(Path(self.tempdir.name, "none.json")), packed_name=self.packed_name, **limits))
+
+    def test_iter_matches(self):
+        """
+        Tests that searching the packed corpus gives exactly the results of scanning the files.
+        """
+        with packed.build_packed(str(self.output_dir), self.packed_name) as packed_corpus:
+            self.assertEqual(len(packed_corpus.episodes), 4)
+            self.assertEqual(packed_corpus.episodes[0], ("Season_1", 1, "Gem Glow", "Season_1/01-Gem Glow.txt"))
+            self.assertEqual(packed_corpus.speaker(1), None)
+            self.assertEqual(packed_corpus.speaker(2), "Garnet")
+            self.assertEqual(packed_corpus.line(4), "Steven: Dad!")
+            self.assertTrue(packed_corpus.is_current(self.output_dir))
+        patterns = ["Cookie Cat", "(?i)cookie cat", "(?i)sorry", "Café", r"Caf\w", "caf.", "Nye", "light|Other", r"St\w+n:",
+            "lapis", "", "^\\|", "^$", "Cookie\nCat", "^.{4}$"]
+        for pattern in patterns:
+            logging.info("Assert: %r matches the same lines in the packed corpus and in the files.", pattern)
+            self.assertEqual(self.search(pattern, True), self.search(pattern, False), pattern)
+        for limits in ({"max_per_file": 1}, {"max_matches": 2}, {"max_matches": 3, "max_per_file": 1}):
+            self.assertEqual(self.search("Cookie", True, **limits), self.search("Cookie", False, **limits), limits)
+
+    def test_stale(self):
+        """
+        Tests that a modified corpus is scanned from its files, and that a builder keeps the episodes not re-added.
+        """
+        packed.build_packed(str(self.output_dir), self.packed_name).close()
+        episode_file = self.output_dir.joinpath("Season_1/02-Laser Light Cannon.txt")
+        episode_file.write_text("Lapis: Hi.")
+        self.assertEqual(len(self.search("Lapis", True)), 1)
+        builder = packed.PackedCorpusBuilder(self.packed_name)
+        builder.add_episode(episode_file, [("Lapis", "Hi.")])
+        builder.save()
+        with packed.PackedCorpus(self.packed_name) as packed_corpus:
+            self.assertTrue(packed_corpus.is_current(self.output_dir))
+            self.assertEqual(len(packed_corpus), 11)
+        self.assertEqual(self.search("(Lapis|Steven):", True), self.search("(Lapis|Steven):", False))
+
+    def test_is_current_catalog(self):
+        """
+        Tests that with a current catalog, is_current compares against it instead of stat'ing every file.
+        """
+        catalog.build_catalog(str(self.output_dir))
+        with packed.build_packed(str(self.output_dir), self.packed_name) as packed_corpus, \
+                patch("trigram.snapshot", wraps=trigram.snapshot) as mocksnapshot:
+            self.assertTrue(packed_corpus.is_current(self.output_dir))
+            mocksnapshot.assert_not_called()
+            logging.info("Assert: an episode added since the corpus was packed makes it stale, catalogued or not.")
+            self.output_dir.joinpath("Season_2", "02-Open Book.txt").write_text("Connie: Hi.")
+            self.assertFalse(packed_corpus.is_current(self.output_dir))
+            mocksnapshot.assert_called_once()
+            catalog.build_catalog(str(self.output_dir))
+            self.assertFalse(packed_corpus.is_current(self.output_dir))
+            mocksnapshot.assert_called_once()
+
+    def test_is_current_rewritten(self):
+        """
+        Tests that an episode rewritten in place since the corpus was packed makes it stale, though the catalog lists it.
+        """
+        catalog.build_catalog(str(self.output_dir))
+        with packed.build_packed(str(self.output_dir), self.packed_name) as packed_corpus:
+            self.assertTrue(packed_corpus.is_current(self.output_dir))
+            episode_file = self.output_dir.joinpath("Season_1", "01-Gem Glow.txt")
+            episode_file.write_text("Lapis: Hi.")
+            stat = episode_file.stat()
+            os.utime(episode_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            self.assertIsNotNone(corpus.read_catalog(self.output_dir))
+            self.assertFalse(packed_corpus.is_current(self.output_dir))
+            self.assertEqual(self.search("Lapis", True), self.search("Lapis", False))
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
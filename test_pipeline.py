@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""
+Tests pipeline.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
+import json
+import logging
+import os
+import unittest
+
+from fixture_server import WikiFixtureServer
+from manifest import CrawlManifest
+from pipeline import CrawlPipeline
+from scheduler import CrawlScheduler
+import benchmark
+import metrics
+import pipeline
+import scraper
+from constants import LOGGING_FILE, MANIFEST_NAME, CATALOG_NAME, LINESTORE_NAME
+
+class PipelineTest(unittest.TestCase):
+    """
+    Defines unit tests for pipeline.CrawlPipeline, against a generated wiki served locally.
+    """
+
+    def crawl(self, scheduler, root: str, output_dir: Path, manifest: CrawlManifest = None, stores: tuple = ()):
+        """
+        Crawls every entry point into 'output_dir' through 'scheduler'.
+        Returns {relative path: contents} of the files written.
+        """
+        with benchmark.pointed_at(root, str(output_dir)):
+            with scheduler:
+                scraper.scrape_episodes(scheduler, manifest, stores, num_seasons=2)
+                scraper.scrape_movie(scheduler, manifest, stores)
+                scraper.scrape_future(scheduler, manifest, stores)
+                scraper.scrape_shorts(scheduler, manifest, stores)
+        return {str(path.relative_to(output_dir)): path.read_text() for path in output_dir.glob("*/*.txt")}
+
+    def test_same_output(self):
+        """
+        Tests that the pipeline writes exactly what the plain scheduler writes, even with a one-page queue.
+        """
+        with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons=2, num_episodes=4, num_lines=20) as server:
+            expected = self.crawl(CrawlScheduler(max_workers=4), server.root, Path(tempdir, "scheduler"))
+            written = self.crawl(CrawlPipeline(max_fetchers=4, max_parsers=2, queue_size=1), server.root, Path(tempdir, "pipeline"))
+        self.assertEqual(len(expected), 2 * 4 + 1 + 4 + 4)
+        self.assertEqual(written, expected)
+
+    def test_incremental(self):
+        """
+        Tests that a fresh store is given every episode by an incremental crawl, including those it skips as unchanged.
+        """
+        with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons=2, num_episodes=2, num_lines=5) as server:
+            output_dir = Path(tempdir, "output")
+            manifest = CrawlManifest(Path(tempdir, "manifest.json"))
+            expected = self.crawl(CrawlPipeline(max_fetchers=2, max_parsers=1), server.root, output_dir, manifest)
+            store = Mock(spec=["add_episode"])
+            written = self.crawl(CrawlPipeline(max_fetchers=2, max_parsers=1), server.root, output_dir, manifest, (store,))
+        self.assertEqual(written, expected)
+        stored = {str(episode_file.relative_to(output_dir)) for (episode_file, _), _ in store.add_episode.call_args_list}
+        self.assertEqual(stored, set(expected))
+
+    def test_metrics(self):
+        """
+        Tests that the parse stage's metrics are recorded in the worker processes and sent back.
+        """
+        metrics.reset()
+        try:
+            with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons=2, num_episodes=2, num_lines=5) as server:
+                with patch.object(metrics, "_enabled", True):
+                    written = self.crawl(CrawlPipeline(max_fetchers=2, max_parsers=2), server.root, Path(tempdir, "output"))
+            summary = metrics.summary()
+        finally:
+            metrics.reset()
+        self.assertEqual(summary["stages"]["parse"]["calls"], len(written))
+        self.assertEqual(summary["stages"]["format"]["calls"], len(written))
+        self.assertEqual(summary["counters"]["lines_scraped"], sum(len(text.splitlines()) for text in written.values()))
+
+    def test_main(self):
+        """
+        Tests that pipeline.main keeps a manifest, feeds the stores asked for, and writes the catalog, as scraper.main does.
+        """
+        working_dir = os.getcwd()
+        with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons=5, num_episodes=1, num_lines=3) as server:
+            os.chdir(tempdir)
+            try:
+                with benchmark.pointed_at(server.root, "output"), \
+                        patch("sys.argv", ["pipeline.py", "--parsers", "1", "--incremental", "--linestore"]):
+                    pipeline.main()
+                written = sorted(str(path.relative_to("output")) for path in Path("output").glob("*/*.txt"))
+                catalogued = [entry["path"] for entry in json.loads(Path("output", CATALOG_NAME).read_text())["episodes"]]
+                self.assertEqual(len(written), 5)
+                self.assertEqual(sorted(catalogued), written)
+                self.assertTrue(Path(MANIFEST_NAME).is_file())
+                self.assertTrue(Path(LINESTORE_NAME).is_file())
+            finally:
+                os.chdir(working_dir)
+
+    def test_errors(self):
+        """
+        Tests that a page which cannot be parsed is reported once every other page is written.
+        """
+        with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons=1, num_episodes=2, num_lines=5) as server:
+            output_dir = Path(tempdir, "output")
+            output_dir.mkdir()
+            with benchmark.pointed_at(server.root, str(output_dir)):
+                with self.assertRaises(AssertionError):
+                    with CrawlPipeline(max_fetchers=2, max_parsers=1) as pipeline:
+                        # an index page has no transcript table
+                        pipeline.submit_episode(server.root, scraper.write_episode, server.root + "/wiki/Season_1", output_dir.joinpath("bad.txt"))
+                        scraper.scrape_movie(pipeline)
+            self.assertTrue(output_dir.joinpath("Movie", "Movie.txt").exists())
+            self.assertFalse(output_dir.joinpath("bad.txt").exists())
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
@@ -2,6 +2,8 @@
 """
 Contains unit tests for query.py.
 - compile_matches(pattern: str)
+- iter_matches(pattern: str, ...)
+- page_menu(matches, page_size: int)
 - show_menu(pattern: str, matching_files: list, matching_lines: list, matching_linenos: list)
 - main()
 """
@@ -9,8 +11,12 @@ Contains unit tests for query.py.
 import logging
 import os
 import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest.mock import patch
 import argparse
+import subprocess
+import sys
 
 import query
 from constants import LOGGING_FILE
@@ -70,9 +76,6 @@ class TestQuery(unittest.TestCase):
         assert len(matching_files) == 1
         assert len(matching_lines) == 1
         assert len(matching_linenos) == 1
-        logging.info("Currently in %r.", os.getcwd())
-        os.chdir('..')
-        logging.info("chdir ..; Currently in %r.", os.getcwd())
         pattern = "lapis"
         logging.info("pattern := %r", pattern)
         logging.info("Assert: Return value has length 0.")
@@ -80,9 +83,59 @@ class TestQuery(unittest.TestCase):
         assert len(matching_files) == 0
         assert len(matching_lines) == 0
         assert len(matching_linenos) == 0
-        logging.info("Currently in %r.", os.getcwd())
-        os.chdir('..')
-        logging.info("chdir ..; Currently in %r.", os.getcwd())
+
+    def test_iter_matches(self):
+        """
+        Tests iter_matches over a temporary corpus, with and without limits.
+        """
+        with TemporaryDirectory() as tempdir:
+            for season_name, episode_name, text in (
+                    ("Season_1", "01-Gem Glow.txt", "Steven: Cookie Cat!\nGarnet: Cookie cats are discontinued."),
+                    ("Season_1", "02-Laser Light Cannon.txt", "Pearl: Cookie?\nSteven: Cookie!"),
+                    ("Movie", "Movie.txt", "Steven: Cookie Cat, he's a pet for your tummy")):
+                Path(tempdir, season_name).mkdir(exist_ok=True)
+                Path(tempdir, season_name, episode_name).write_text(text)
+            matches = list(query.iter_matches("Cookie", use_index=False, output_dir=tempdir))
+            self.assertEqual(len(matches), 5)
+            episode_file, lineno, line, span = matches[1]
+            self.assertEqual((episode_file.name, lineno, line, span), ("01-Gem Glow.txt", 2, "Garnet: Cookie cats are discontinued.", (8, 14)))
+            logging.info("Assert: max_per_file and max_matches limit the results.")
+            self.assertEqual([match[1] for match in query.iter_matches("Cookie", max_per_file=1, use_index=False, output_dir=tempdir)], [1, 1, 1])
+            self.assertEqual(len(list(query.iter_matches("Cookie", max_matches=3, use_index=False, output_dir=tempdir))), 3)
+            self.assertEqual(len(list(query.iter_matches("Cookie", max_matches=3, max_per_file=1, use_index=False, output_dir=tempdir))), 3)
+
+    @patch("webbrowser.open_new")
+    @patch("builtins.input")
+    def test_page_menu(self, mockinput, mockopener):
+        """
+        Tests that page_menu pulls matches one page at a time, and can open a match from an earlier page.
+
+        Mocks: webbrowser.open_new
+        """
+        pulled = []
+
+        def matches():
+            for index in range(5):
+                pulled.append(index)
+                yield "file%d" % index, index + 1, "line %d" % index
+
+        mockinput.side_effect = ["", "1"]
+        self.assertEqual(query.page_menu(matches(), page_size=2), 4)
+        self.assertEqual(pulled, [0, 1, 2, 3, 4])
+        mockopener.assert_called_once_with("file1")
+        mockinput.side_effect = ["q"]
+        pulled.clear()
+        self.assertEqual(query.page_menu(matches(), page_size=2), 2)
+        self.assertEqual(pulled, [0, 1, 2])
+
+    def test_lazy_imports(self):
+        """
+        Tests that importing query.py loads none of the search backends, which '--server' has no use for.
+        """
+        backends = ["batch", "corpus", "fts", "fuzzy", "linestore", "metrics", "packed", "query_server", "result_cache", "shards", "trigram"]
+        loaded = subprocess.run([sys.executable, "-c", "import sys, query; print(*sorted(set(%r) & set(sys.modules)))" % backends],
+            cwd=Path(query.__file__).parent, capture_output=True, text=True, check=True).stdout.split()
+        self.assertEqual(loaded, [])
 
     @unittest.skip # not really decoupled from the other two, and therefore not really a unit test. Note: Research how to do integration tests.
     def test_main(self):
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""
+Tests query_server.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import logging
+import os
+import unittest
+
+from fixture_corpus import write_corpus
+import query
+import query_server
+import shards
+from constants import LOGGING_FILE
+
+class QueryServerTest(unittest.TestCase):
+    """
+    Defines unit tests for query_server.CorpusCache and query_server.QueryServer, over a small corpus in a temporary directory.
+    """
+
+    def setUp(self):
+        """
+        Writes a small corpus into a temporary output directory.
+        """
+        self.tempdir = TemporaryDirectory()
+        self.output_dir = Path(self.tempdir.name, "output")
+        self.paths = {name: str(Path(self.tempdir.name, name)) for name in ("none.json", "none.pack", "shards")}
+        write_corpus(self.output_dir)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def cache(self):
+        return query_server.CorpusCache(self.output_dir, self.paths["none.json"], self.paths["shards"])
+
+    def scan(self, pattern: str, **limits):
+        """
+        Runs query.iter_matches over the temporary corpus's files.
+        """
+        return list(query.iter_matches(pattern, output_dir=self.output_dir, index_name=self.paths["none.json"],
+            packed_name=self.paths["none.pack"], shards_name=self.paths["shards"], **limits))
+
+    def test_search(self):
+        """
+        Tests that the daemon answers exactly as a scan of the files does, and rejects bad patterns.
+        """
+        patterns = ["Cookie Cat", "(?i)cookie cat", "(?i)sorry", "Café", "light|Other", "", "^$", "Cookie\nCat"]
+        with query_server.QueryServer(self.cache(), port=0) as server:
+            for pattern in patterns:
+                logging.info("Assert: the daemon matches the same lines as a scan for %r.", pattern)
+                self.assertEqual(query_server.search(pattern, server_url=server.url), self.scan(pattern), pattern)
+            for limits in ({"max_per_file": 1}, {"max_matches": 2}, {"max_matches": 3, "max_per_file": 1}):
+                self.assertEqual(query_server.search("Cookie", server_url=server.url, **limits), self.scan("Cookie", **limits), limits)
+            with self.assertRaises(ValueError):
+                query_server.search("(unclosed", server_url=server.url)
+
+    def test_reload(self):
+        """
+        Tests that the cache reloads only when the corpus changes, and serves the shards when there is no output directory.
+        """
+        cache = self.cache()
+        self.assertFalse(cache.reload_if_changed())
+        episode_file = self.output_dir.joinpath("Season_1/02-Laser Light Cannon.txt")
+        episode_file.write_text("Lapis: Hi.")
+        os.utime(episode_file, ns=(0, 0))
+        self.assertTrue(cache.reload_if_changed())
+        self.assertEqual(cache.search("Lapis"), self.scan("Lapis"))
+        self.assertEqual(cache.status()["loads"], 2)
+        shards.build_shards(str(self.output_dir), self.paths["shards"])
+        sharded = query_server.CorpusCache(Path(self.tempdir.name, "elsewhere"), self.paths["none.json"], self.paths["shards"])
+        self.assertEqual([match[1:] for match in sharded.search("(?i)cookie")], [match[1:] for match in self.scan("(?i)cookie")])
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+"""
+Tests result_cache.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
+import logging
+import os
+import unittest
+
+import catalog
+import query
+import result_cache
+from constants import LOGGING_FILE
+
+class ResultCacheTest(unittest.TestCase):
+    """
+    Defines unit tests for result_cache.* methods.
+    """
+
+    def test_cached_search(self):
+        """
+        Tests that repeated queries are answered from the cache, and that changing the corpus invalidates it,
+        whether or not the output directory has a catalog.
+        """
+        with TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir, "output")
+            episode_file = output_dir.joinpath("Season_1", "01-Gem Glow.txt")
+            episode_file.parent.mkdir(parents=True)
+            episode_file.write_text("Steven: Cookie Cat!\nGarnet: Steven.")
+            cache_name = Path(temp_dir, "cache.sqlite3")
+            key = result_cache.regex_key("Steven", max_per_file=1)
+            self.assertEqual(key, result_cache.regex_key("Steven", None, 1))
+            self.assertNotEqual(key, result_cache.regex_key("(?i)Steven", None, 1))
+            expected = list(query.iter_matches("Steven", max_per_file=1, output_dir=output_dir))
+            for with_catalog in (False, True):
+                if with_catalog:
+                    catalog.build_catalog(str(output_dir))
+                    # a current catalog gives the version without a second pass over the files
+                    with patch("corpus.episode_files", side_effect=AssertionError("walked the tree")):
+                        result_cache.corpus_version(output_dir, Path(temp_dir, "shards"))
+                search = Mock(side_effect=lambda: query.iter_matches("Steven", max_per_file=1, output_dir=output_dir))
+                for _ in range(3):
+                    results = list(result_cache.cached_search(key, search, output_dir, Path(temp_dir, "shards"), cache_name))
+                    self.assertEqual(results, expected)
+                self.assertEqual(search.call_count, 1)
+                logging.info("Assert: a rescrape invalidates cached results (with_catalog := %s).", with_catalog)
+                # rewritten in place, as pipeline.py and mwapi.py do, without rebuilding the catalog
+                episode_file.write_text("Garnet: Steven.\nSteven: Cookie Cat!")
+                stat = episode_file.stat()
+                os.utime(episode_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+                results = list(result_cache.cached_search(key, search, output_dir, Path(temp_dir, "shards"), cache_name))
+                self.assertEqual(search.call_count, 2)
+                self.assertEqual(results, [(episode_file, 1, "Garnet: Steven.", (8, 14))])
+                self.assertEqual(list(query.iter_matches("Steven", max_per_file=1, output_dir=output_dir)), results)
+                episode_file.write_text("Steven: Cookie Cat!\nGarnet: Steven.")
+                os.utime(episode_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+                expected = list(query.iter_matches("Steven", max_per_file=1, output_dir=output_dir))
+
+    def test_streaming(self):
+        """
+        Tests that a miss passes results on as they are found, and caches them only once the search is complete and they fit.
+        """
+        results = [(Path("output", "Season_1", "01-Gem Glow.txt"), lineno, "x" * 100, (0, 1)) for lineno in range(1, 4)]
+        searched = []
+        def search():
+            for result in results:
+                searched.append(result)
+                yield result
+        with TemporaryDirectory() as temp_dir:
+            cache_name = Path(temp_dir, "cache.sqlite3")
+            output_dir = Path(temp_dir, "output")
+            matches = result_cache.cached_search("key", search, output_dir, Path(temp_dir, "shards"), cache_name)
+            self.assertEqual(next(matches), results[0])
+            self.assertEqual(searched, results[:1])
+            matches.close()
+            logging.info("Assert: an abandoned search is not cached.")
+            with result_cache.ResultCache(cache_name) as cache:
+                self.assertIsNone(cache.get("key", result_cache.corpus_version(output_dir, Path(temp_dir, "shards"))))
+                self.assertEqual(cache.total_bytes(), 0)
+            self.assertEqual(list(result_cache.cached_search("key", search, output_dir, Path(temp_dir, "shards"), cache_name, 200)), results)
+            with result_cache.ResultCache(cache_name) as cache:
+                self.assertEqual(cache.total_bytes(), 0)
+            self.assertEqual(list(result_cache.cached_search("key", search, output_dir, Path(temp_dir, "shards"), cache_name)), results)
+            searched.clear()
+            self.assertEqual(list(result_cache.cached_search("key", search, output_dir, Path(temp_dir, "shards"), cache_name)), results)
+            self.assertEqual(searched, [])
+
+    def test_eviction(self):
+        """
+        Tests that the least recently used entries are evicted beyond the size cap, and that stale entries are cleared.
+        """
+        line = "x" * 100
+        results = [(Path("output", "Season_1", "01-Gem Glow.txt"), 1, line, (0, 1))]
+        with TemporaryDirectory() as temp_dir, result_cache.ResultCache(Path(temp_dir, "cache.sqlite3"), max_bytes=400) as cache:
+            cache.put("a", "v1", results)
+            cache.put("b", "v1", results)
+            self.assertEqual(cache.get("a", "v1"), results)
+            cache.put("c", "v1", results)
+            self.assertLessEqual(cache.total_bytes(), 400)
+            # 'b' was used least recently
+            self.assertIsNone(cache.get("b", "v1"))
+            self.assertEqual(cache.get("a", "v1"), results)
+            self.assertEqual(cache.get("c", "v1"), results)
+            cache.put("big", "v1", results * 10)
+            self.assertIsNone(cache.get("big", "v1"))
+            logging.info("Assert: a lookup at a new corpus version clears every older entry.")
+            self.assertIsNone(cache.get("a", "v2"))
+            self.assertEqual(cache.total_bytes(), 0)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+"""
+Tests scheduler.py
+"""
+
+from threading import Event, Lock
+import logging
+import time
+import unittest
+
+from scheduler import CrawlScheduler
+from constants import LOGGING_FILE
+
+class SchedulerTest(unittest.TestCase):
+    """
+    Defines unit tests for scheduler.CrawlScheduler.
+    """
+
+    def setUp(self):
+        """
+        Defines a job that records how many jobs are running at once, overall and per host.
+        """
+        self.lock = Lock()
+        self.running = {}
+        self.peak = {}
+
+        def job(host: str, result):
+            with self.lock:
+                self.running[host] = self.running.get(host, 0) + 1
+                self.running["*"] = self.running.get("*", 0) + 1
+                for key in (host, "*"):
+                    self.peak[key] = max(self.peak.get(key, 0), self.running[key])
+            time.sleep(0.02)
+            with self.lock:
+                self.running[host] -= 1
+                self.running["*"] -= 1
+            return result
+
+        self.job = job
+
+    def test_limits(self):
+        """
+        Tests that neither the overall nor the per-host limit is exceeded, and that jobs do run concurrently.
+        """
+        with CrawlScheduler(max_workers=6, max_per_host=2) as scheduler:
+            futures = []
+            for index in range(12):
+                host = "host%d" % (index % 3)
+                futures.append(scheduler.submit("http://%s/page/%d" % (host, index), self.job, host, index))
+        self.assertEqual([future.result() for future in futures], list(range(12)))
+        logging.info("Peak concurrency: %r", self.peak)
+        self.assertLessEqual(self.peak["*"], 6)
+        self.assertGreater(self.peak["*"], 1)
+        for host in ("host0", "host1", "host2"):
+            self.assertLessEqual(self.peak[host], 2)
+
+    def test_busy_host(self):
+        """
+        Tests that jobs waiting on a busy host do not hold the workers that another host's jobs need.
+        """
+        released = Event()
+        with CrawlScheduler(max_workers=2, max_per_host=1) as scheduler:
+            try:
+                for index in range(4):
+                    scheduler.submit("http://busy/%d" % index, released.wait)
+                other = scheduler.submit("http://other/page", self.job, "other", "done")
+                self.assertEqual(other.result(timeout=5), "done")
+            finally:
+                released.set()
+        self.assertEqual(self.peak["other"], 1)
+
+    def test_nested_submit(self):
+        """
+        Tests that jobs submitted by other jobs are waited on.
+        """
+        results = []
+
+        def index_job(scheduler):
+            for index in range(5):
+                scheduler.submit("http://host/%d" % index, results.append, index)
+
+        with CrawlScheduler(max_workers=2) as scheduler:
+            scheduler.submit("http://host/index", index_job, scheduler)
+        self.assertEqual(sorted(results), list(range(5)))
+
+    def test_join_raises(self):
+        """
+        Tests that a failing job does not stop the others, and that its exception is re-raised.
+        """
+        results = []
+
+        def failing_job():
+            raise RuntimeError("page not found")
+
+        with self.assertRaises(RuntimeError):
+            with CrawlScheduler(max_workers=2) as scheduler:
+                scheduler.submit("http://host/bad", failing_job)
+                for index in range(3):
+                    scheduler.submit("http://host/%d" % index, results.append, index)
+        self.assertEqual(sorted(results), list(range(3)))
+        with self.assertRaises(ValueError):
+            CrawlScheduler(max_workers=0)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
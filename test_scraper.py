@@ -3,13 +3,21 @@
 Tests scraper.py
 """
 
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
 import logging
+import os
 import unittest
 
+from fixture_server import WikiFixtureServer, transcript_page
+from scheduler import CrawlScheduler
+import benchmark
 import scraper
 import requests as r
 
 from constants import LOGGING_FILE, WIKIA_ROOT
+from manifest import CrawlManifest
 
 class ScraperTest(unittest.TestCase):
     """
@@ -37,6 +45,105 @@ class ScraperTest(unittest.TestCase):
                 assert TypeError("speaker := %s is not None or str-type")
             assert isinstance(dialogue, str)
 
+    def test_parse_transcript(self):
+        """
+        Tests parse_transcript against the original full-page parser, on the fixture page and on a page it cannot slice.
+        """
+        page_text = Path(benchmark.FIXTURES_NAME, "transcript_page.html").read_text()
+        expected = benchmark.parse_transcript_reference(page_text)
+        self.assertEqual(scraper.parse_transcript(page_text), expected)
+        # class attribute with extra whitespace: not sliced, so the whole page is parsed
+        unsliceable = "<table class = 'wikitable bgrevo'><tr><th>A</th></tr><tr><td></td></tr><tr><th>Ronald</th><td>Ha <i>ha</i></td></tr></table>"
+        self.assertEqual(scraper.parse_transcript(unsliceable), [(None, ""), ("Ronald", "Ha ha")])
+
+    def test_iter_transcript_rows(self):
+        """
+        Tests the incremental parser against parse_transcript, with the page fed in chunks of various sizes,
+        and on nested tables and unclosed cells.
+        """
+        page_text = Path(benchmark.FIXTURES_NAME, "transcript_page.html").read_text()
+        for page in (page_text, transcript_page("Gem Glow", 40)):
+            expected = scraper.parse_transcript(page)
+            for chunk_size in (1, 7, 4096, len(page)):
+                chunks = (page[index:index + chunk_size] for index in range(0, len(page), chunk_size))
+                self.assertEqual(list(scraper.iter_transcript_rows(chunks)), expected)
+        logging.info("Assert: nested tables and unclosed tags are read as parse_transcript reads them.")
+        nested = ("<table class='other'><tr><th>No</th></tr></table><table class='wikitable bgrevo'><tr><th>A</th></tr>"
+            "<tr><th>Pearl</th><td>See <table><tr><td>inner</td></tr></table> &amp; that<script>x</script></td></tr>"
+            "<tr><th> Lars </th></tr></table>")
+        unclosed = "<table class='wikitable bgrevo'><tr><th>H</th></tr><tr><th>A<td>1<tr><th>B<td>2</table>"
+        for page, expected in ((nested, [("Pearl", "See inner & that"), (None, "inner"), ("Lars", "")]),
+                (unclosed, [("A1B2", "1B2"), ("B2", "2")])):
+            self.assertEqual(scraper.parse_transcript(page), expected)
+            self.assertEqual(list(scraper.iter_transcript_rows(page[index:index + 5] for index in range(0, len(page), 5))), expected)
+        with self.assertRaises(ValueError):
+            list(scraper.iter_transcript_rows(["<table class='wikitable'><tr><td>x</td></tr></table>"]))
+
+    @patch("http_client.iter_text")
+    def test_stream_episode(self, mockiter):
+        """
+        Tests that stream_episode writes what write_episode would, leaves unchanged files untouched,
+        and only keeps the line list for stores that need it.
+
+        Mocks: http_client.iter_text
+        """
+        page = "<table class='wikitable bgrevo'><tr><th>Speaker</th><th>Dialogue</th></tr><tr><th>Ronald</th><td>%s</td></tr><tr><td>dances</td></tr></table>"
+        catalog, store = Mock(reads_file=True), Mock(spec=["add_episode"])
+        with TemporaryDirectory() as tempdir:
+            episode_file = Path(tempdir, "01-Political Power.txt")
+            manifest = CrawlManifest(Path(tempdir, "manifest.json"))
+            mockiter.side_effect = lambda urlname: iter([page[:50], page[50:] % "Ha!"])
+            scraper.stream_episode(self.transcript_page, episode_file, manifest, (catalog, store))
+            self.assertEqual(episode_file.read_text(), "Ronald: Ha!\n|: dances")
+            store.add_episode.assert_called_once_with(episode_file, [("Ronald", "Ha!"), (None, "dances")])
+            catalog.add_episode.assert_called_once_with(episode_file, [("Ronald", "Ha!"), (None, "dances")])
+            logging.info("Assert: with only file-reading stores, no line list is kept.")
+            catalog.reset_mock()
+            scraper.stream_episode(self.transcript_page, episode_file, None, (catalog,))
+            catalog.add_episode.assert_called_once_with(episode_file, None)
+            logging.info("Assert: an unchanged page is not rewritten, and no temporary file is left behind.")
+            modified = episode_file.stat().st_mtime_ns
+            os.utime(episode_file, ns=(modified - 10 ** 9, modified - 10 ** 9))
+            scraper.stream_episode(self.transcript_page, episode_file, manifest)
+            self.assertEqual(episode_file.stat().st_mtime_ns, modified - 10 ** 9)
+            self.assertEqual(sorted(path.name for path in Path(tempdir).iterdir()), ["01-Political Power.txt", "manifest.json.journal"])
+            logging.info("Assert: a changed page is rewritten.")
+            mockiter.side_effect = lambda urlname: iter([page % "Ha ha!"])
+            scraper.stream_episode(self.transcript_page, episode_file, manifest)
+            self.assertEqual(episode_file.read_text(), "Ronald: Ha ha!\n|: dances")
+            self.assertEqual(episode_file.stat().st_mode & 0o777, scraper.FILE_MODE)
+            logging.info("Assert: concurrent writes of one episode get temporary files of their own.")
+            temp_files = [scraper.write_linelist(episode_file, [("Ronald", "Ha!")])[0] for _ in range(2)]
+            self.assertNotEqual(temp_files[0], temp_files[1])
+            for temp_file in temp_files:
+                temp_file.unlink()
+
+    def test_read_linelist(self):
+        """
+        Tests that read_linelist reads back what format_linelist wrote, multi-line dialogue included.
+        """
+        line_list = self.line_list + [("Pearl", "multi-line\ndialogue"), (None, "Steven: Cookie Cat!"), ("Garnet", "")]
+        with TemporaryDirectory() as tempdir:
+            episode_file = Path(tempdir, "01-Political Power.txt")
+            episode_file.write_text(scraper.format_linelist(line_list))
+            self.assertEqual(scraper.read_linelist(episode_file), line_list)
+
+    def test_submit_episode(self):
+        """
+        Tests that schedulers run episode jobs as given, or their own way, whatever the job is.
+        """
+        job = Mock(return_value="written")
+        with patch("scraper.stream_episode", return_value="streamed") as mockstream:
+            with CrawlScheduler(max_workers=1) as scheduler:
+                self.assertEqual(scheduler.submit_episode(self.transcript_page, job, self.transcript_page, "a.txt").result(), "written")
+            with scraper.StreamingScheduler(max_workers=1) as scheduler:
+                self.assertEqual(scheduler.submit_episode(self.transcript_page, job, self.transcript_page, "b.txt").result(), "streamed")
+                logging.info("Assert: any other job runs as submitted.")
+                self.assertEqual(scheduler.submit(self.transcript_page, job, self.transcript_page, "c.txt").result(), "written")
+        job.assert_any_call(self.transcript_page, "a.txt")
+        job.assert_any_call(self.transcript_page, "c.txt")
+        mockstream.assert_called_once_with(self.transcript_page, "b.txt")
+
     def test_scrape_episodeurls(self):
         """
         Tests scrape_episodeurls to see if it compiles valid episode URLs.
@@ -73,6 +180,89 @@ class ScraperTest(unittest.TestCase):
         expected = "|: dances fervently\nRonald: We ain't gonna do magic, then?"
         self.assertEqual(expected, formatted_lines)
 
+    def test_scrape_fixture_wiki(self):
+        """
+        Tests a full crawl of every entry point against a generated wiki served locally.
+        """
+        with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons=2, num_episodes=3, num_lines=5) as server:
+            output_dir = Path(tempdir, "output")
+            with benchmark.pointed_at(server.root, str(output_dir)):
+                with CrawlScheduler(max_workers=4, max_per_host=2) as scheduler:
+                    scraper.scrape_episodes(scheduler, num_seasons=2)
+                    scraper.scrape_movie(scheduler)
+                    scraper.scrape_future(scheduler)
+                    scraper.scrape_shorts(scheduler)
+            written = sorted(str(path.relative_to(output_dir)) for path in output_dir.glob("*/*.txt"))
+            self.assertEqual(written, [
+                "Future/01-Future Episode 1.txt", "Future/02-Future Episode 2.txt", "Future/03-Future Episode 3.txt",
+                "Movie/Movie.txt",
+                "Season_1/01-Season 1 Episode 1.txt", "Season_1/02-Season 1 Episode 2.txt", "Season_1/03-Season 1 Episode 3.txt",
+                "Season_2/01-Season 2 Episode 1.txt", "Season_2/02-Season 2 Episode 2.txt", "Season_2/03-Season 2 Episode 3.txt",
+                "Shorts/01-Short 1.txt", "Shorts/02-Short 2.txt", "Shorts/03-Short 3.txt",
+                ])
+            self.assertEqual(len(output_dir.joinpath("Season_1", "01-Season 1 Episode 1.txt").read_text().splitlines()), 5)
+            self.assertEqual(server.requests_served, 2 + 6 + 1 + 1 + 3 + 1 + 3)
+
+    @patch("http_client.fetch")
+    def test_write_episode_incremental(self, mockfetch):
+        """
+        Tests write_episode with a manifest: unchanged pages are neither reparsed nor rewritten.
+
+        Mocks: http_client.fetch
+        """
+        page = "<table class='wikitable bgrevo'><tr><th>Speaker</th><th>Dialogue</th></tr><tr><th>Ronald</th><td>%s</td></tr></table>"
+        with TemporaryDirectory() as tempdir:
+            episode_file = Path(tempdir, "01-Political Power.txt")
+            manifest = CrawlManifest(Path(tempdir, "manifest.json"))
+            mockfetch.return_value = (page % "Ha!", False)
+            scraper.write_episode(self.transcript_page, episode_file, manifest)
+            self.assertEqual(episode_file.read_text(), "Ronald: Ha!")
+            manifest.save()
+            manifest = CrawlManifest(Path(tempdir, "manifest.json"))
+            self.assertIn(self.transcript_page, manifest.entries)
+            logging.info("Assert: an unchanged page is not reparsed, but its stores are still given its lines.")
+            store = Mock(spec=["add_episode"])
+            with patch("scraper.parse_transcript") as mockparse:
+                scraper.write_episode(self.transcript_page, episode_file, manifest, (store,))
+                mockparse.assert_not_called()
+            store.add_episode.assert_called_once_with(episode_file, [("Ronald", "Ha!")])
+            logging.info("Assert: a changed page is rewritten.")
+            mockfetch.return_value = (page % "Ha ha!", False)
+            scraper.write_episode(self.transcript_page, episode_file, manifest)
+            self.assertEqual(episode_file.read_text(), "Ronald: Ha ha!")
+
+    @patch("http_client.fetch")
+    def test_write_episode_resume(self, mockfetch):
+        """
+        Tests that a crawl interrupted before saving its manifest resumes without refetching the episodes it wrote.
+
+        Mocks: http_client.fetch
+        """
+        page = "<table class='wikitable bgrevo'><tr><th>Speaker</th><th>Dialogue</th></tr><tr><th>Ronald</th><td>Ha!</td></tr></table>"
+        mockfetch.return_value = (page, False)
+        with TemporaryDirectory() as tempdir:
+            manifest_path = Path(tempdir, "manifest.json")
+            written_file, failed_file = Path(tempdir, "01-Political Power.txt"), Path(tempdir, "02-Failed.txt")
+            manifest = CrawlManifest(manifest_path)
+            scraper.write_episode(self.transcript_page, written_file, manifest)
+            # interrupted: the manifest is never saved, and the second episode never written
+            manifest = CrawlManifest(manifest_path, resume=True)
+            self.assertIn(self.transcript_page, manifest.entries)
+            mockfetch.reset_mock()
+            store = Mock(spec=["add_episode"])
+            scraper.write_episode(self.transcript_page, written_file, manifest, (store,))
+            mockfetch.assert_not_called()
+            store.add_episode.assert_called_once_with(written_file, [("Ronald", "Ha!")])
+            scraper.write_episode(self.transcript_page + "2", failed_file, manifest)
+            mockfetch.assert_called_once()
+            logging.info("Assert: the journal outlives an unfinished crawl, and is removed once one finishes.")
+            manifest.save(finished=False)
+            self.assertTrue(manifest.journal_path.exists())
+            self.assertTrue(CrawlManifest(manifest_path, resume=True).is_done(self.transcript_page + "2", failed_file))
+            manifest.save()
+            self.assertFalse(manifest.journal_path.exists())
+            self.assertFalse(CrawlManifest(manifest_path, resume=True).is_done(self.transcript_page, written_file))
+
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
     #help(unittest.main)
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+"""
+Tests shards.py, and its use by query.iter_matches.
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import logging
+import unittest
+
+from fixture_corpus import BACKPACK, EPISODES, write_corpus
+import query
+import shards
+from constants import LOGGING_FILE
+
+class ShardsTest(unittest.TestCase):
+    """
+    Defines unit tests for shards.* methods, over a small corpus in a temporary directory.
+    """
+
+    def setUp(self):
+        """
+        Writes a small corpus into a temporary output directory.
+        """
+        self.tempdir = TemporaryDirectory()
+        self.output_dir = Path(self.tempdir.name, "output")
+        self.shards_dir = Path(self.tempdir.name, "shards")
+        write_corpus(self.output_dir, {**EPISODES, **BACKPACK})
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def search(self, pattern: str, output_dir: Path, **limits):
+        """
+        Runs query.iter_matches with no index or packed corpus; 'output_dir' is absent when the shards are searched.
+        """
+        return list(query.iter_matches(pattern, output_dir=output_dir, index_name=str(Path(self.tempdir.name, "none.json")),
+            packed_name=str(Path(self.tempdir.name, "none.pack")), shards_name=str(self.shards_dir), **limits))
+
+    def test_iter_matches(self):
+        """
+        Tests that searching the shards gives exactly the results of scanning the files, in either codec.
+        """
+        # the same paths, but with no output directory
+        sharded_dir = Path(self.tempdir.name, "elsewhere", "output")
+        patterns = ["Cookie Cat", "(?i)cookie cat", "(?i)sorry", "Café", "Nye", "light|Other", "", "^\\|", "^$", "^.{4}$"]
+        for codec in ("gzip", "xz"):
+            shards.build_shards(str(self.output_dir), str(self.shards_dir), codec)
+            self.assertEqual(len(list(self.shards_dir.iterdir())), 3)
+            shard = shards.Shard(self.shards_dir.joinpath("Season_1" + shards.CODECS[codec][0]))
+            self.assertEqual([episode[:3] for episode in shard.episodes],
+                [["01", "Gem Glow", "01-Gem Glow.txt"], ["02", "Laser Light Cannon", "02-Laser Light Cannon.txt"],
+                ["10", "Cheeseburger Backpack", "10-Cheeseburger Backpack.txt"]])
+            self.assertEqual(shard.read_episode(1), ["Pearl: The light cannon.", "Steven: Dad!", "Pearl: Cookie Cat? Cookie Cat."])
+            for pattern in patterns:
+                logging.info("Assert: %r matches the same lines in the %s shards and in the files.", pattern, codec)
+                expected = [(sharded_dir.joinpath(path.relative_to(self.output_dir)), *rest) for path, *rest in self.search(pattern, self.output_dir)]
+                self.assertEqual(self.search(pattern, sharded_dir), expected, pattern)
+            for limits in ({"max_per_file": 1}, {"max_matches": 2}, {"max_matches": 3, "max_per_file": 1}):
+                self.assertEqual(len(self.search("Cookie", sharded_dir, **limits)), len(self.search("Cookie", self.output_dir, **limits)), limits)
+
+    def test_writer(self):
+        """
+        Tests that a writer keeps the episodes not re-added, and replaces those that are.
+        """
+        shards.build_shards(str(self.output_dir), str(self.shards_dir))
+        writer = shards.ShardWriter(self.shards_dir, "xz")
+        writer.add_episode(self.output_dir.joinpath("Season_1", "02-Laser Light Cannon.txt"), [("Lapis", "Hi."), (None, "Lapis waves")])
+        writer.save()
+        self.assertEqual(sorted(path.name for path in self.shards_dir.iterdir()),
+            ["Movie.shard.xz", "Season_1.shard.xz", "Season_2.shard.xz"])
+        shard = shards.Shard(self.shards_dir.joinpath("Season_1.shard.xz"))
+        self.assertEqual(len(shard.episodes), 3)
+        self.assertEqual(shard.read_episode(1), ["Lapis: Hi.", "|: Lapis waves"])
+        self.assertEqual(shard.read_episode(0), ["Steven: Cookie Cat!", "|: Steven gasps", "Garnet: Nye."])
+        with self.assertRaises(ValueError):
+            shards.ShardWriter(self.shards_dir, "zip")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
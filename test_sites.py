@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+"""
+Tests sites.py
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import json
+import logging
+import unittest
+
+from fixture_server import WikiFixtureServer
+from scheduler import CrawlScheduler
+import benchmark
+import corpus
+import http_client
+import scraper
+import sites
+from constants import LOGGING_FILE, SEASON_ORDER, SITES_CONFIG, WIKIA_ROOT
+
+class SitesTest(unittest.TestCase):
+    """
+    Defines unit tests for sites.py, against generated wikis served locally.
+    """
+
+    def fixture_site(self, name: str, root: str, output_dir: Path):
+        """
+        Returns the checked-in Steven Universe definition, pointed at 'root' and 'output_dir', with 2 seasons.
+        """
+        definition = json.loads(Path(SITES_CONFIG).read_text())["sites"][0]
+        definition.update(name=name, root=root, output=str(output_dir), requests_per_second=1000, max_per_host=2)
+        definition["indexes"][0]["numbers"] = [1, 2]
+        return definition
+
+    def test_load_sites(self):
+        """
+        Tests that the checked-in config describes the wiki scraper.py crawls, and that bad configs are refused.
+        """
+        site, = sites.load_sites()
+        self.assertEqual(site.root, WIKIA_ROOT)
+        self.assertEqual(site.order, SEASON_ORDER)
+        self.assertEqual([urlname for urlname, _, _ in site.index_pages()][:2], [WIKIA_ROOT + "/wiki/Season_1", WIKIA_ROOT + "/wiki/Season_2"])
+        with TemporaryDirectory() as tempdir:
+            config = Path(tempdir, "sites.json")
+            config.write_text(json.dumps({"sites": [{"name": "no-root", "indexes": []}]}))
+            with self.assertRaises(ValueError):
+                sites.load_sites(str(config))
+            config.write_text(json.dumps({"sites": [{"name": "twice", "root": "http://a", "indexes": []}] * 2}))
+            with self.assertRaises(ValueError):
+                sites.load_sites(str(config))
+
+    def test_crawl_sites(self):
+        """
+        Tests that two wikis crawled at once are each written as scraper.py would write them.
+        """
+        with TemporaryDirectory() as tempdir, WikiFixtureServer(num_seasons=2, num_episodes=3, num_lines=10) as first, \
+                WikiFixtureServer(num_seasons=2, num_episodes=2, num_lines=10) as second:
+            expected = {}
+            for server in (first, second):
+                output_dir = Path(tempdir, "scraper-" + server.root.rsplit(":", 1)[1])
+                with benchmark.pointed_at(server.root, str(output_dir)), CrawlScheduler() as scheduler:
+                    scraper.scrape_episodes(scheduler, num_seasons=2)
+                    scraper.scrape_movie(scheduler)
+                    scraper.scrape_future(scheduler)
+                    scraper.scrape_shorts(scheduler)
+                expected[server.root] = {str(path.relative_to(output_dir)): path.read_text() for path in corpus.episode_files(output_dir)}
+            config = Path(tempdir, "sites.json")
+            config.write_text(json.dumps({"sites": [
+                self.fixture_site("first", first.root, Path(tempdir, "first")),
+                self.fixture_site("second", second.root, Path(tempdir, "second")),
+                ]}))
+            loaded = sites.load_sites(str(config))
+            with benchmark.pointed_at(first.root, str(Path(tempdir, "unused"))):
+                sites.crawl_sites(loaded)
+                self.assertIn(loaded[0].host, http_client.default_client._min_intervals)
+            for site, server in zip(loaded, (first, second)):
+                written = {str(path.relative_to(site.output)): path.read_text() for path in corpus.episode_files(site.output, site.order)}
+                self.assertEqual(list(written), list(expected[server.root]))
+                self.assertEqual(written, expected[server.root])
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
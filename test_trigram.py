@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+"""
+Tests trigram.py, and its use by query.compile_matches.
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import logging
+import os
+import unittest
+
+from fixture_corpus import write_corpus
+import query
+import trigram
+from constants import LOGGING_FILE, OUTPUT_NAME
+
+class TrigramTest(unittest.TestCase):
+    """
+    Defines unit tests for trigram.* methods, over a small corpus in a temporary directory.
+    """
+
+    def setUp(self):
+        """
+        Writes a small corpus under a temporary OUTPUT_NAME directory, and moves into its parent.
+        """
+        self.cwd = os.getcwd()
+        self.tempdir = TemporaryDirectory()
+        os.chdir(self.tempdir.name)
+        write_corpus(OUTPUT_NAME)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+    def compile(self, pattern: str, use_index: bool):
+        """
+        Runs query.compile_matches from the temporary directory.
+        """
+        try:
+            return query.compile_matches(pattern, use_index=use_index)
+        finally:
+            os.chdir(self.tempdir.name)
+
+    def test_required_literals(self):
+        """
+        Tests that only mandatory literal runs are extracted from a pattern.
+        """
+        self.assertEqual(trigram.required_literals("Cookie Cat"), ["cookie cat"])
+        self.assertEqual(trigram.required_literals(r"Coo(kie)+ \w+at"), ["coo", "kie", " ", "at"])
+        self.assertEqual(trigram.required_literals("(?i)st(e|a)ven?"), ["t", "ve"])
+        self.assertEqual(trigram.required_literals("Lapis|Peridot"), [])
+        self.assertEqual(trigram.required_literals("Cookie (?i:cat) Tummy", casefold=False), ["Cookie ", " Tummy"])
+        self.assertEqual(trigram.required_literals("(?i)Cookie", casefold=False), [])
+
+    def test_ignorecase_literals(self):
+        """
+        Tests that case-insensitive literals stop at the letters IGNORECASE and str.casefold disagree on,
+        so that no line a pattern matches is filtered out by the index.
+        """
+        self.assertEqual(trigram.required_literals("(?i)hi"), ["h"])
+        self.assertEqual(trigram.required_literals("Hi (?i:hi)"), ["hi h"])
+        self.assertEqual(trigram.required_literals("(?i)Cookie (?-i:Kat)"), ["coo", "e kat"])
+        self.assertEqual(trigram.required_literals("(?i)lapis", casefold=False), [])
+        Path(OUTPUT_NAME, "Season_2/02-Open Book.txt").write_text("Lapıs: Hı!\nPearl: HİS \u212aelvin.")
+        trigram.build_index()
+        for pattern in ["(?i)hi", "(?i)lapis: hi", "(?i)his", "(?i)kelvin", "(?i)s ke"]:
+            logging.info("Assert: %r matches the same lines with and without the index.", pattern)
+            self.assertEqual(self.compile(pattern, True), self.compile(pattern, False), pattern)
+        self.assertEqual(self.compile("(?i)lapis: hi", True)[1], ["Lapıs: Hı!"])
+
+    def test_compile_matches(self):
+        """
+        Tests that compile_matches returns the same results with and without the index.
+        """
+        trigram.build_index()
+        patterns = ["Cookie Cat", "(?i)cookie cat", "(?i)sorry", "Nye", "light|Other", r"St\w+n:", "lapis", "", "^\\|"]
+        for pattern in patterns:
+            logging.info("Assert: %r matches the same lines with and without the index.", pattern)
+            self.assertEqual(self.compile(pattern, True), self.compile(pattern, False), pattern)
+        logging.info("Assert: a modified corpus is not searched through the stale index.")
+        Path(OUTPUT_NAME, "Season_1/02-Laser Light Cannon.txt").write_text("Lapis: Hi.")
+        index = trigram.load_index()
+        self.assertFalse(index.is_current(Path(OUTPUT_NAME)))
+        self.assertEqual(len(self.compile("Lapis", True)[0]), 1)
+
+    def test_candidates(self):
+        """
+        Tests that the index narrows a pattern down to the episodes holding its literals.
+        """
+        index = trigram.build_index()
+        self.assertEqual(index.candidates(["cookie cat"]), {"Season_1/01-Gem Glow.txt", "Season_1/02-Laser Light Cannon.txt", "Movie/Movie.txt"})
+        self.assertEqual(index.candidates(["lapis"]), set())
+        self.assertIsNone(index.candidates(["st"]))
+
+    def test_candidate_lines(self):
+        """
+        Tests that candidate_lines finds exactly the lines whose case-folded text contains every literal, once each.
+        """
+        lines = ["Steven: Cookie Cat!", "|: Steven gasps", "Pearl: COOKIE CAT? Cookie cat.", "", "Spinel: Cookie", "Cat", "I'm ſorry."]
+        self.assertEqual(trigram.candidate_lines(lines, ["cookie cat"]), [0, 2])
+        self.assertEqual(trigram.candidate_lines(lines, ["sorry"]), [6])
+        self.assertEqual(trigram.candidate_lines(lines, ["lapis"]), [])
+        for literals in (["cookie", "steven"], ["cat", "pearl"], ["steven"], ["cookie", "cat"], [":", "c"], ["cookie\ncat"]):
+            logging.info("Assert: candidate_lines finds the lines a line-by-line check finds for %r.", literals)
+            expected = [index for index, line in enumerate(lines) if all(literal in line.casefold() for literal in literals)]
+            self.assertEqual(trigram.candidate_lines(lines, literals), expected, literals)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    unittest.main()
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+"""
+Persistent trigram index over the scraped transcripts, used by query.compile_matches.
+
+The index maps each trigram of the case-folded transcript text to the set of episode files containing it,
+stored as a bitset over the episode files in canonical order.
+A regex is narrowed down by the literal strings every match must contain:
+only episodes holding all of their trigrams, and only lines holding all of the literals, are searched.
+
+Build with:
+    python3 trigram.py
+"""
+
+from pathlib import Path
+import json
+import logging
+import os
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError: # python < 3.11
+    import sre_parse
+
+from constants import OUTPUT_NAME, TRIGRAM_INDEX_NAME, LOGGING_FILE
+import corpus
+
+INDEX_VERSION = 1
+# letters that IGNORECASE may match to a character which case-folds differently (e.g. 'i' to 'ı' or 'İ'),
+# and the letters with such non-ASCII case partners (the Kelvin sign, the long s)
+CASEFOLD_UNSAFE = frozenset("IiİıKkKSsſ")
+
+def trigrams(text: str):
+    """
+    Returns the set of 3-character substrings of 'text'.
+    """
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+def required_literals(pattern: str, casefold: bool = True):
+    """
+    Returns case-folded strings, each of which occurs in every string that 'pattern' matches.
+    Parts of the pattern that are optional, alternated or otherwise unsure only end a literal; they never add one.
+    So do the CASEFOLD_UNSAFE letters of parts matched case-insensitively, since IGNORECASE and str.casefold disagree on them:
+    '(?i)hi' matches 'hı', whose case-folded text does not contain 'hi'.
+    If not 'casefold', the strings keep their case, and parts matched case-insensitively end a literal too.
+    """
+    literals = []
+    run = []
+    parsed = sre_parse.parse(pattern)
+    if not casefold and parsed.state.flags & re.IGNORECASE:
+        return literals
+
+    def flush():
+        if run:
+            literals.append("".join(run).casefold() if casefold else "".join(run))
+            run.clear()
+
+    def visit(items, ignorecase: bool):
+        for opcode, argument in items:
+            if opcode is sre_parse.LITERAL:
+                if ignorecase and chr(argument) in CASEFOLD_UNSAFE:
+                    flush()
+                else:
+                    run.append(chr(argument))
+            elif opcode is sre_parse.SUBPATTERN:
+                _, add_flags, del_flags, body = argument
+                if not casefold and add_flags & re.IGNORECASE:
+                    flush()
+                    continue
+                # group contents are matched in place, so runs continue through them
+                visit(body, (ignorecase or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE)
+            elif opcode in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, "POSSESSIVE_REPEAT", None)):
+                flush()
+                min_count, _, body = argument
+                if min_count >= 1:
+                    visit(body, ignorecase)
+                    flush()
+            elif opcode is getattr(sre_parse, "ATOMIC_GROUP", None):
+                visit(argument, ignorecase)
+            else:
+                flush()
+
+    visit(parsed, bool(parsed.state.flags & re.IGNORECASE))
+    flush()
+    return [literal for literal in literals if literal]
+
+def candidate_lines(lines: list, literals: list, folded: str = None):
+    """
+    Returns the indices, in order, of the 'lines' whose case-folded text contains every one of 'literals'.
+    Scans for occurrences of the longest literal in the whole text at once, rather than line by line.
+    'folded' is the case-folded text of the lines joined by newlines, if already at hand.
+    """
+    # no character case-folds into a line break, so folded lines stay aligned with 'lines'
+    if folded is None:
+        folded = "\n".join(lines).casefold()
+    if not all(literal in folded for literal in literals):
+        return []
+    key = max(literals, key=len)
+    found = []
+    line_index = 0
+    scanned = 0
+    position = folded.find(key)
+    while position != -1:
+        line_index += folded.count("\n", scanned, position)
+        line_start = folded.rfind("\n", 0, position) + 1
+        line_end = folded.find("\n", position)
+        if line_end == -1:
+            line_end = len(folded)
+        folded_line = folded[line_start:line_end]
+        if all(literal in folded_line for literal in literals):
+            found.append(line_index)
+        scanned = position
+        position = folded.find(key, line_end)
+    return found
+
+def snapshot(output_dir: Path):
+    """
+    Returns [path, mtime_ns, size] for every episode file under 'output_dir', in canonical order.
+    Paths are relative to 'output_dir'.
+    """
+    files = []
+    for episode_file in corpus.episode_files(output_dir):
+        stat = episode_file.stat()
+        files.append([str(episode_file.relative_to(output_dir)), stat.st_mtime_ns, stat.st_size])
+    return files
+
+def build_index(output_name: str = OUTPUT_NAME, index_name: str = TRIGRAM_INDEX_NAME):
+    """
+    Builds the trigram index over the transcripts in 'output_name' and writes it to 'index_name'.
+    """
+    output_dir = Path(output_name)
+    files = snapshot(output_dir)
+    postings = {}
+    for file_id, (relative_path, _, _) in enumerate(files):
+        text = output_dir.joinpath(relative_path).read_text().casefold()
+        bit = 1 << file_id
+        for trigram in trigrams(text):
+            postings[trigram] = postings.get(trigram, 0) | bit
+    index = {
+        "version": INDEX_VERSION,
+        "files": files,
+        "postings": {trigram: "%x" % bits for trigram, bits in postings.items()},
+        }
+    temp_file = Path(index_name + ".tmp")
+    temp_file.write_text(json.dumps(index, ensure_ascii=False))
+    os.replace(temp_file, index_name)
+    logging.info("Indexed %d trigrams over %d files into %r.", len(postings), len(files), index_name)
+    return TrigramIndex(index)
+
+def load_index(index_name: str = TRIGRAM_INDEX_NAME):
+    """
+    Returns the TrigramIndex stored at 'index_name', or None if there is none (or it is unreadable).
+    """
+    try:
+        index = json.loads(Path(index_name).read_text())
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION:
+        return None
+    return TrigramIndex(index)
+
+class TrigramIndex:
+    """
+    A loaded trigram index.
+    """
+
+    def __init__(self, index: dict):
+        self.files = index["files"]
+        self.postings = index["postings"]
+
+    def is_current(self, output_dir: Path):
+        """
+        Returns True if the episode files under 'output_dir' are exactly those indexed, unmodified.
+        """
+        return snapshot(output_dir) == self.files
+
+    def candidates(self, literals: list):
+        """
+        Returns the set of relative paths of the files containing every trigram of every literal in 'literals'.
+        Returns None if 'literals' has no trigrams, i.e. every file is a candidate.
+        """
+        bits = None
+        for literal in literals:
+            for trigram in trigrams(literal):
+                posting = int(self.postings.get(trigram, "0"), 16)
+                bits = posting if bits is None else bits & posting
+        if bits is None:
+            return None
+        return {relative_path for file_id, (relative_path, _, _) in enumerate(self.files) if bits >> file_id & 1}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, filename=LOGGING_FILE)
+    index = build_index()
+    print("Indexed %d files into %r." % (len(index.files), TRIGRAM_INDEX_NAME))